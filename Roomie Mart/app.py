@@ -1,60 +1,143 @@
-from flask import Flask, render_template, flash, redirect, url_for, session, request
+from flask import Flask, render_template, request, session, abort, current_app
 import os
-from werkzeug.utils import secure_filename
-from datetime import datetime
-from functools import wraps
 from types import SimpleNamespace
 
-# Import controllers
-from controllers.auth_controller import auth_bp
-from controllers.item_controller import item_bp
-from controllers.message_controller import message_bp
-from controllers.feedback_controller import feedback_bp
-from controllers.reports_controller import reports_bp
-from controllers.orders_controller import orders_bp
-from controllers.requests_controller import requests_bp
-
-
-# Import database connection
-from database.db_connection import get_db_connection
-
+from utils.query_inspector import query_budget
+
+
+# Blueprints that are rarely hit: their controller modules are imported on the
+# first matching request instead of at startup (see utils/lazy_views.py).
+# Keep these rules in sync with the decorators in the controller modules.
+LAZY_BLUEPRINTS = [
+    ('reports_bp', 'controllers.reports_controller', [
+        ('/analytics', 'analytics_dashboard'),
+        ('/analytics/api/category_distribution', 'api_category_distribution'),
+        ('/analytics/api/sold_vs_available', 'api_sold_vs_available'),
+        ('/analytics/api/monthly_orders', 'api_monthly_orders'),
+        ('/analytics/api/top_categories', 'api_top_categories'),
+        ('/analytics/api/user_growth', 'api_user_growth'),
+        ('/analytics/api/revenue', 'api_revenue'),
+        ('/analytics/api/summary', 'api_summary'),
+    ]),
+    ('feedback_bp', 'controllers.feedback_controller', [
+        ('/feedback', 'feedback', ['GET', 'POST']),
+        ('/feedback/order/<int:order_id>', 'feedback_for_order', ['GET', 'POST']),
+        ('/feedback/browse', 'browse_feedback'),
+    ]),
+]
+
+
+def create_app(config=None):
+    """Build the Flask app; `config` overrides the defaults below"""
+    from database import analytics_replica, db_connection
+
+    app = Flask(__name__)
+    app.config.update(
+        SECRET_KEY='roomie_mart_secret_key',
+        DATABASE_PATH=db_connection.DATABASE_PATH,
+        MESSAGE_ARCHIVE_PATH=db_connection.ARCHIVE_PATH,  # None: <database>_archive.db
+        ANALYTICS_REPLICA=True,  # analytics read the `flask roomie snapshot` copy when there is one
+        ANALYTICS_REPLICA_PATH=analytics_replica.REPLICA_PATH,  # None: <database>_analytics.db
+        ANALYTICS_REPLICA_MAX_AGE=analytics_replica.DEFAULT_MAX_AGE,  # seconds; older snapshots fall back to live
+        INIT_DB=True,  # create missing tables/indexes on startup
+        UPLOAD_FOLDER=os.path.join(app.root_path, 'static', 'uploads'),
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024,  # 16MB max upload
+        ALLOWED_EXTENSIONS={'png', 'jpg', 'jpeg', 'gif'},
+        LAZY_BLUEPRINTS=True,  # defer importing analytics/feedback controllers
+        METRICS_ENABLED=True,  # SQL instrumentation, Server-Timing and /metrics
+        METRICS_TOKEN=os.environ.get('ROOMIE_METRICS_TOKEN'),  # bearer token for /metrics outside debug
+        SLOW_QUERY_MS=100,  # log statements slower than this (None disables)
+        RATE_LIMIT_ENABLED=True,  # token buckets/load shedding, see utils/rate_limit.py
+        RATE_LIMIT_STORAGE='memory',  # or 'sqlite' to share buckets between workers
+        RESPONSE_CACHE_ENABLED=True,  # serve repeat anonymous home/marketplace/item pages from memory
+        RESPONSE_CACHE_MAX_BYTES=32 * 1024 * 1024,  # per process
+        RESPONSE_CACHE_TTL=60,  # seconds; bounds staleness item writes don't signal
+        JOBS_ENABLED=False,  # queue background work for a runner (utils/jobs.py) instead of doing it inline
+        JOBS_WORKERS=2,  # jobs run at once per runner
+        JOBS_POOL='thread',  # or 'process' for CPU-heavy handlers
+        JOBS_SCHEDULE=None,  # None: jobs.DEFAULT_SCHEDULE; {} turns periodic jobs off
+    )
+    if config:
+        app.config.update(config)
+
+    db_connection.set_database_path(app.config['DATABASE_PATH'])
+    db_connection.set_archive_path(app.config['MESSAGE_ARCHIVE_PATH'])
+    analytics_replica.configure(app.config['ANALYTICS_REPLICA_PATH'], app.config['ANALYTICS_REPLICA'],
+                                app.config['ANALYTICS_REPLICA_MAX_AGE'])
+    if app.config['INIT_DB']:
+        db_connection.init_db()
+
+    # Ensure upload directory exists
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+
+    register_blueprints(app)
+
+    # CLI: `flask roomie ...`
+    from commands.cli import register_commands
+    register_commands(app)
+
+    from utils import metrics, query_inspector, rate_limit, response_cache
+    from database import slow_query_log
+    # Request/SQL metrics at /metrics
+    metrics.init_app(app)
+    # 429/503 for clients hammering logins, messages, search, analytics and the
+    # message polls (asgi.py applies the same limits to its native handlers)
+    rate_limit.init_app(app)
+    # Logged-out visitors get repeat pages without touching SQLite
+    response_cache.init_app(app)
+    # N+1 warnings and @query_budget checks (debug/testing only)
+    query_inspector.init_app(app)
+    # Slow statements -> logs/slow_queries.log and /_slow_queries
+    slow_query_log.init_app(app)
+
+    app.context_processor(inject_pending_request_count)
+    app.context_processor(inject_current_user)
+
+    app.add_url_rule('/', 'index', index)
+    app.add_url_rule('/_whoami', 'whoami', whoami)
+    app.add_url_rule('/_my_items', 'my_items_debug', my_items_debug)
+    app.add_url_rule('/_slow_queries', 'slow_queries_debug', slow_queries_debug)
+    app.add_url_rule('/_jobs', 'jobs_debug', jobs_debug)
+
+    app.register_error_handler(404, page_not_found)
+    app.register_error_handler(500, internal_server_error)
+    return app
+
+
+def register_blueprints(app):
+    from controllers.auth_controller import auth_bp
+    from controllers.item_controller import item_bp
+    from controllers.message_controller import message_bp
+    from controllers.orders_controller import orders_bp
+    from controllers.requests_controller import requests_bp
+    from controllers.api_controller import api_bp
+
+    app.register_blueprint(auth_bp)
+    app.register_blueprint(item_bp)
+    app.register_blueprint(message_bp, url_prefix='/message')
+    app.register_blueprint(orders_bp)
+    app.register_blueprint(requests_bp)
+    app.register_blueprint(api_bp, url_prefix='/api/v1')
+
+    if app.config['LAZY_BLUEPRINTS']:
+        from utils.lazy_views import lazy_blueprint
+        for name, module, routes in LAZY_BLUEPRINTS:
+            app.register_blueprint(lazy_blueprint(name, module, routes))
+    else:
+        from controllers.feedback_controller import feedback_bp
+        from controllers.reports_controller import reports_bp
+        app.register_blueprint(feedback_bp)
+        app.register_blueprint(reports_bp)
 
-app = Flask(__name__)
-app.secret_key = 'roomie_mart_secret_key'
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max upload
-app.config['ALLOWED_EXTENSIONS'] = {'png', 'jpg', 'jpeg', 'gif'}
 
-# Inject pending requests count for seller into all templates (must be after app is defined)
-from models.request_model import RequestModel
-@app.context_processor
+# Inject pending requests count for seller into all templates
 def inject_pending_request_count():
-    user_id = session.get('user_id')
-    pending_requests_count = 0
-    if user_id:
-        try:
-            pending_requests_count = RequestModel.count_pending_requests_for_owner(user_id)
-        except Exception:
-            pending_requests_count = 0
-    return dict(pending_requests_count=pending_requests_count)
-
-# Ensure upload directory exists
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-
-# Register blueprints
-app.register_blueprint(auth_bp)
-app.register_blueprint(item_bp)
-app.register_blueprint(message_bp, url_prefix='/message')
-app.register_blueprint(feedback_bp)
-app.register_blueprint(reports_bp)
-app.register_blueprint(orders_bp)
-app.register_blueprint(requests_bp)
-
+    from utils.helpers import pending_request_count
+    return dict(pending_requests_count=pending_request_count())
 
 
 # Inject a simple `current_user` into templates so code that expects
 # `current_user.is_authenticated` works without Flask-Login.
-@app.context_processor
 def inject_current_user():
     if 'user_id' in session:
         user = SimpleNamespace(
@@ -73,19 +156,10 @@ def inject_current_user():
 # Note: Google Maps API key support removed. Templates will display address text instead of maps.
 
 
-# Login required decorator
-def login_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
-        if 'user_id' not in session:
-            flash('Please login to access this page', 'error')
-            return redirect(url_for('auth_bp.login'))
-        return f(*args, **kwargs)
-    return decorated_function
-
 # Home route
-@app.route('/')
+@query_budget(2)
 def index():
+    from database.db_connection import get_db_connection
     conn = get_db_connection()
     cursor = conn.cursor()
     cursor.execute('''
@@ -100,23 +174,15 @@ def index():
     conn.close()
     return render_template('index.html', items=items)
 
-# Helper function to check allowed file extensions
-def allowed_file(filename):
-    return '.' in filename and \
-           filename.rsplit('.', 1)[1].lower() in app.config['ALLOWED_EXTENSIONS']
-
 # Error handlers
-@app.errorhandler(404)
 def page_not_found(e):
     return render_template('404.html'), 404
 
-@app.errorhandler(500)
 def internal_server_error(e):
     return render_template('500.html'), 500
 
 
 # Debug helper: return current session user info (development only)
-@app.route('/_whoami')
 def whoami():
     return {
         'user_id': session.get('user_id'),
@@ -127,7 +193,6 @@ def whoami():
     }
 
 
-@app.route('/_my_items')
 def my_items_debug():
     """Debug endpoint: return current user's items as JSON (development only)."""
     if 'user_id' not in session:
@@ -138,5 +203,36 @@ def my_items_debug():
     out = [dict(i) for i in items]
     return {'items': out}
 
+def slow_queries_debug():
+    """Debug page: recent slow statements with their query plans (development only)."""
+    from database import slow_query_log
+    if not (current_app.debug or current_app.config.get('SLOW_QUERY_PAGE')):
+        abort(404)
+    return render_template('slow_queries.html',
+                           entries=slow_query_log.recent_entries(),
+                           plans=slow_query_log.known_plans(),
+                           threshold_ms=current_app.config.get('SLOW_QUERY_MS'),
+                           log_path=current_app.config.get('SLOW_QUERY_LOG', slow_query_log.DEFAULT_LOG_PATH))
+
+def jobs_debug():
+    """Debug page: background job queue counts, schedules and recent jobs (development only)."""
+    from models.job_model import Job
+    if not (current_app.debug or current_app.config.get('JOBS_PAGE')):
+        abort(404)
+    from datetime import datetime
+    status = request.args.get('status') or None
+
+    def when(timestamp):
+        return datetime.fromtimestamp(timestamp).strftime('%Y-%m-%d %H:%M:%S') if timestamp else '-'
+
+    schedules = [{'name': name, 'next_run': when(row['next_run_at']), 'last_run': when(row['last_run_at'])}
+                 for name, row in sorted(Job.get_schedules().items())]
+    return render_template('jobs.html',
+                           counts=Job.get_status_counts(),
+                           schedules=schedules,
+                           jobs=Job.get_recent(status=status),
+                           status=status,
+                           enabled=current_app.config.get('JOBS_ENABLED'))
+
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
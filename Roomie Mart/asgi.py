@@ -0,0 +1,388 @@
+"""ASGI entry point for long-lived connections: `uvicorn asgi:application`.
+
+A few read endpoints are served natively on the event loop, with every DB
+call pushed onto a bounded thread pool, so an idle long-poll client costs a
+coroutine rather than a worker thread:
+
+    GET /message/unread_count                 same JSON as the Flask view;
+        ?since=<count>&wait=<seconds>         hold the request until the count
+                                              differs from `since` (long poll)
+    GET /message/conversation/<item>/<user>/updates?after=<message id>&wait=<s>
+                                              messages newer than `after`
+
+Both go through the app's rate limits (the 'polling' group in
+utils/rate_limit.py) and are recorded in /metrics under their Flask endpoint
+names. The query inspector doesn't see them; their SQL is fixed.
+
+Everything else (pages, /api/v1/items listings, forms, uploads, CSV/ZIP
+streams) goes to the regular Flask app through a small WSGI bridge that runs
+it on its own bounded pool, so the ASGI mode serves the whole site.
+
+Waiters don't poll the database themselves: while anyone is waiting, one
+watcher per process reads the messages stored since its last look every
+POLL_INTERVAL seconds and wakes only the senders' and receivers' waiters.
+"""
+import asyncio
+import io
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+from urllib.parse import parse_qs
+
+from app import create_app
+from models.message_model import Message
+from utils import metrics, rate_limit
+from utils.helpers import dumps_json
+
+DB_THREADS = int(os.environ.get('ROOMIE_ASGI_DB_THREADS', 8))
+WSGI_THREADS = int(os.environ.get('ROOMIE_ASGI_WSGI_THREADS', 16))
+POLL_INTERVAL = 1.0
+STREAM_BUFFER = 8  # response chunks a WSGI stream may run ahead of the client
+MAX_WAIT = 55  # stay under common proxy idle timeouts
+
+
+class MessageWatcher:
+    """Wakes a user's long-poll waiters when a message to or from them is stored"""
+
+    def __init__(self, run_db):
+        self._run_db = run_db
+        self._events = {}  # user_id -> asyncio.Event shared by that user's waiters
+        self._waiters = 0
+        self._task = None
+        self.latest_id = None
+
+    async def mark(self):
+        """Watcher position to hand to wait(); take it before reading what the wait is about"""
+        if self.latest_id is None:
+            latest = await self._run_db(Message.get_latest_message_id)
+            if self.latest_id is None:
+                self.latest_id = latest
+        return self.latest_id
+
+    async def wait(self, user_id, timeout, mark):
+        """Wait up to `timeout` seconds for a message involving user_id stored after `mark`;
+        True if one may have arrived (the caller re-reads either way)"""
+        if self.latest_id != mark:
+            # The watcher moved on while the caller was reading: whatever it
+            # passed may be the caller's, so re-check instead of blocking
+            return True
+        event = self._events.get(user_id)
+        if event is None:
+            event = self._events[user_id] = asyncio.Event()
+        self._waiters += 1
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._poll())
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            self._waiters -= 1
+
+    async def _poll(self):
+        while self._waiters:
+            try:
+                for row in await self._run_db(Message.get_message_parties_after, self.latest_id):
+                    self.latest_id = row['id']
+                    for user_id in (row['sender_id'], row['receiver_id']):
+                        event = self._events.pop(user_id, None)
+                        if event is not None:
+                            event.set()
+            except Exception as e:
+                print(f"[asgi] message watcher failed: {e}")
+            await asyncio.sleep(POLL_INTERVAL)
+        # Nobody is waiting: forget the position, mark() re-reads it for the next waiter
+        self.latest_id = None
+
+
+class RoomieASGI:
+    """Native long-poll endpoints plus a bridge to the Flask app for everything else"""
+
+    def __init__(self, flask_app, db_threads=DB_THREADS, wsgi_threads=WSGI_THREADS):
+        self.flask_app = flask_app
+        self.db_pool = ThreadPoolExecutor(max_workers=db_threads, thread_name_prefix='asgi-db')
+        self.wsgi_pool = ThreadPoolExecutor(max_workers=wsgi_threads, thread_name_prefix='asgi-wsgi')
+        self.watcher = MessageWatcher(self.run_db)
+        # (pattern, Flask endpoint it stands in for, handler)
+        self.routes = [
+            (re.compile(r'^/message/unread_count$'), 'message_bp.unread_count', self.unread_count),
+            (re.compile(r'^/message/conversation/(\d+)/(\d+)/updates$'), 'message_bp.conversation_updates',
+             self.conversation_updates),
+        ]
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+        if scope['type'] != 'http':
+            return
+        if scope['method'] == 'GET':
+            for pattern, endpoint, handler in self.routes:
+                match = pattern.match(scope['path'])
+                if match:
+                    return await self.serve_native(scope, send, endpoint, handler, match.groups())
+        await self.call_wsgi(scope, receive, send)
+
+    async def serve_native(self, scope, send, endpoint, handler, args):
+        """Run a native handler under the same rate limits and request metrics as its Flask view"""
+        stats = metrics.RequestStats() if self.flask_app.config.get('METRICS_ENABLED', True) else None
+        limiter = self.flask_app.extensions.get('rate_limit')
+        group = limiter.group_for(endpoint, endpoint.split('.')[0], 'GET') if limiter else None
+        headers = []
+        rejected = None
+        if group:
+            user_id = self.session_user_id(scope) if limiter.rules[group].get('key', 'user') == 'user' else None
+            client = rate_limit.client_key(user_id, (scope.get('client') or ('',))[0])
+            rejected = await self.run_db(limiter.admit, group, client)
+        if rejected:
+            status, retry_after, reason = rejected
+            rate_limit.count_rejection(group, reason)
+            payload = rate_limit.rejection_payload(status)
+            headers.append((b'retry-after', rate_limit.retry_after_header(retry_after).encode('ascii')))
+        else:
+            try:
+                status, payload = await handler(scope, stats, *args)
+            finally:
+                if group:
+                    limiter.leave(group)
+        if stats is not None:
+            metrics.record_request(endpoint, 'GET', status, stats)
+        await send_json(send, status, payload, headers)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                self.db_pool.shutdown(wait=True)
+                self.wsgi_pool.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def run_db(self, fn, *args, stats=None):
+        """fn(*args) on the DB pool; its SQL counts towards the request's `stats` if given"""
+        if stats is not None:
+            fn, args = metrics.run_with_stats, (stats, fn) + args
+        return await asyncio.get_running_loop().run_in_executor(self.db_pool, fn, *args)
+
+    def session_user_id(self, scope):
+        """user_id from Flask's signed session cookie, or None"""
+        cookie = SimpleCookie()
+        for name, value in scope['headers']:
+            if name == b'cookie':
+                cookie.load(value.decode('latin-1'))
+        morsel = cookie.get(self.flask_app.config.get('SESSION_COOKIE_NAME', 'session'))
+        if morsel is None:
+            return None
+        serializer = self.flask_app.session_interface.get_signing_serializer(self.flask_app)
+        try:
+            max_age = int(self.flask_app.permanent_session_lifetime.total_seconds())
+            return serializer.loads(morsel.value, max_age=max_age).get('user_id')
+        except Exception:
+            return None
+
+    async def unread_count(self, scope, stats):
+        user_id = self.session_user_id(scope)
+        if user_id is None:
+            return 401, {'error': 'not_logged_in'}
+        args = query_args(scope)
+        since = int_arg(args, 'since')
+        remaining = min(float_arg(args, 'wait') or 0, MAX_WAIT)
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + remaining
+        while True:
+            # Mark before reading, so nothing stored after the read goes unnoticed
+            mark = await self.watcher.mark() if since is not None and remaining > 0 else None
+            count = await self.run_db(Message.get_unread_count, user_id, stats=stats)
+            if mark is None or count != since or not await self.watcher.wait(user_id, remaining, mark):
+                break
+            remaining = deadline - loop.time()
+        return 200, {'count': count}
+
+    async def conversation_updates(self, scope, stats, item_id, other_user_id):
+        user_id = self.session_user_id(scope)
+        if user_id is None:
+            return 401, {'error': 'not_logged_in'}
+        args = query_args(scope)
+        after = int_arg(args, 'after') or 0
+        remaining = min(float_arg(args, 'wait') or 0, MAX_WAIT)
+
+        fetch = (Message.get_conversation_after, user_id, int(other_user_id), int(item_id), after)
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + remaining
+        while True:
+            mark = await self.watcher.mark() if remaining > 0 else None
+            rows = await self.run_db(*fetch, stats=stats)
+            if mark is None or rows or not await self.watcher.wait(user_id, remaining, mark):
+                break
+            remaining = deadline - loop.time()
+        messages = [dict(r) for r in rows]
+        # Same as the Flask view: what the open conversation receives counts as read
+        unread = [msg for msg in messages if msg['receiver_id'] == user_id and not msg['is_read']]
+        if unread:
+            await self.run_db(Message.mark_messages_read, user_id, [msg['id'] for msg in unread], stats=stats)
+            for msg in unread:
+                msg['is_read'] = 1
+        return 200, {'messages': messages, 'last_id': messages[-1]['id'] if messages else after}
+
+    async def call_wsgi(self, scope, receive, send):
+        """Run the Flask app for this request on the WSGI pool, streaming its body back"""
+        body = io.BytesIO()
+        more = True
+        while more:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                return
+            body.write(message.get('body', b''))
+            more = message.get('more_body', False)
+        body.seek(0)
+        environ = build_environ(scope, body)
+
+        started = {}
+
+        def start_response(status, headers, exc_info=None):
+            started['status'] = int(status.split(' ', 1)[0])
+            started['headers'] = [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers]
+            return lambda data: None  # the legacy write() callable is not supported
+
+        # The app call, every next() and close() run in one pool task (one thread,
+        # one contextvars context), which stream_with_context relies on. Chunks
+        # come back through the queue; `space` caps how far the app runs ahead
+        # of a slow client.
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        space = threading.Semaphore(STREAM_BUFFER)
+        stop = threading.Event()
+
+        def run():
+            try:
+                result = self.flask_app(environ, start_response)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+                return
+            try:
+                loop.call_soon_threadsafe(queue.put_nowait, started)
+                for chunk in result:
+                    space.acquire()
+                    if stop.is_set():
+                        break
+                    if chunk:
+                        loop.call_soon_threadsafe(queue.put_nowait, chunk)
+                loop.call_soon_threadsafe(queue.put_nowait, None)
+            except BaseException as e:
+                loop.call_soon_threadsafe(queue.put_nowait, e)
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+
+        worker = loop.run_in_executor(self.wsgi_pool, run)
+        try:
+            item = await queue.get()
+            if isinstance(item, BaseException):
+                raise item
+            await send({'type': 'http.response.start', 'status': item['status'], 'headers': item['headers']})
+            while True:
+                item = await queue.get()
+                if item is None:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                space.release()
+                await send({'type': 'http.response.body', 'body': item, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        finally:
+            # Client gone or send failed: let the worker stop at the next chunk and close the app
+            stop.set()
+            space.release()
+            await worker
+
+def build_environ(scope, body):
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': 'HTTP/' + scope.get('http_version', '1.1'),
+        'REMOTE_ADDR': client[0],
+        'REMOTE_PORT': str(client[1]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': body,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope['headers']:
+        key = name.decode('latin-1').upper().replace('-', '_')
+        value = value.decode('latin-1')
+        if key == 'CONTENT_TYPE' or key == 'CONTENT_LENGTH':
+            environ[key] = value
+            continue
+        key = 'HTTP_' + key
+        environ[key] = environ[key] + ',' + value if key in environ else value
+    return environ
+
+
+def query_args(scope):
+    return parse_qs(scope.get('query_string', b'').decode('latin-1'))
+
+
+def int_arg(args, name):
+    try:
+        return int(args[name][0])
+    except (KeyError, ValueError):
+        return None
+
+
+def float_arg(args, name):
+    try:
+        return max(0.0, float(args[name][0]))
+    except (KeyError, ValueError):
+        return None
+
+
+async def send_json(send, status, payload, headers=()):
+    body = dumps_json(payload)
+    await send({'type': 'http.response.start', 'status': status, 'headers': [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(body)).encode('ascii')),
+        (b'cache-control', b'no-store'),
+        *headers,
+    ]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+def create_asgi_app(config=None):
+    """RoomieASGI around create_app(config) (`uvicorn --factory asgi:create_asgi_app`)"""
+    return RoomieASGI(create_app(config))
+
+
+_application = None
+
+
+def __getattr__(name):
+    # Build `application` on first access so importing this module has no side effects
+    global _application
+    if name == 'application':
+        if _application is None:
+            _application = create_asgi_app()
+        return _application
+    raise AttributeError(name)
+
+
+if __name__ == '__main__':
+    try:
+        import uvicorn
+    except ImportError:
+        sys.exit('Install uvicorn (pip install uvicorn) or point any ASGI server at asgi:application')
+    uvicorn.run(create_asgi_app(), host='0.0.0.0', port=int(os.environ.get('PORT', 8000)))
@@ -0,0 +1,49 @@
+"""Move old messages to cold storage: `flask roomie archive-messages`.
+
+Read messages older than --days whose conversation is finished (item sold
+or deleted) or stale (no message in --days) move from `messages` into the
+archive file (database/db_connection.init_message_archive), in batches of
+--batch per transaction so the write lock is never held for long. The hot
+table then only holds live conversations; archived ones stay readable from
+the inbox's "Archived" page and each conversation's "Load older messages"
+link. Deleted rows leave free pages in the main file until it is vacuumed.
+"""
+import time
+from datetime import datetime, timedelta
+
+import click
+
+from commands.cli import roomie_cli
+from database.db_connection import get_archive_path
+from models.message_model import Message
+
+DEFAULT_DAYS = 180
+# Each batch is bound three times per transaction; stay under SQLite's 999 parameters
+DEFAULT_BATCH = 300
+
+
+def archive_old_messages(days=DEFAULT_DAYS, batch=DEFAULT_BATCH, dry_run=False):
+    """Archive eligible messages; returns (messages moved or eligible, seconds)"""
+    started = time.perf_counter()
+    cutoff = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d %H:%M:%S')
+    ids = Message.get_archivable_message_ids(cutoff)
+    moved = len(ids)
+    if not dry_run:
+        moved = 0
+        for start in range(0, len(ids), batch):
+            moved += Message.archive_messages(ids[start:start + batch])
+    return moved, round(time.perf_counter() - started, 2)
+
+
+@roomie_cli.command('archive-messages')
+@click.option('--days', default=DEFAULT_DAYS, show_default=True, help='Only archive messages older than this.')
+@click.option('--batch', default=DEFAULT_BATCH, show_default=True, type=click.IntRange(1, DEFAULT_BATCH),
+              help='Messages moved per transaction.')
+@click.option('--dry-run', is_flag=True, help='Only count what would be archived.')
+def archive_messages_command(days, batch, dry_run):
+    """Move old messages of finished or stale conversations to the archive file."""
+    moved, seconds = archive_old_messages(days=days, batch=batch, dry_run=dry_run)
+    if dry_run:
+        click.echo(f'{moved} message(s) older than {days} day(s) would be archived')
+    else:
+        click.echo(f'Archived {moved} message(s) to {get_archive_path()} in {seconds}s')
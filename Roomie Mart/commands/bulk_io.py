@@ -0,0 +1,305 @@
+"""Bulk CSV/JSONL import and export: `flask roomie import` / `flask roomie export`.
+
+Imports are validated row by row and written with executemany in large
+batches inside one transaction (or one per --commit-every rows, with a
+checkpoint file so an interrupted run can --resume). Exports stream from a
+cursor with fetchmany, so memory stays flat regardless of table size.
+
+Imported items are published as item change events after each commit (read
+back from the item_changes log, since executemany reports no ids). Running
+server processes pick them up from that log too, within the response cache's
+and facet index's sync interval.
+
+users.password values that are already werkzeug hashes (an export made with
+--with-password-hashes) are imported as they are. Plain-text ones are hashed
+on the way in with werkzeug's default scrypt, which is deliberately slow:
+about 0.13 s per row on one core, so 10,000 plain-text users take over
+20 minutes. Hash them beforehand for large imports.
+"""
+import csv
+import json
+import os
+import sys
+import time
+from datetime import datetime
+
+import click
+from werkzeug.security import generate_password_hash
+
+from commands.cli import roomie_cli
+from database.db_connection import get_db_connection
+from utils import events
+from utils.helpers import dumps_json
+
+# entity -> (table, columns, required columns)
+ENTITIES = {
+    'users': ('users',
+              ('id', 'name', 'email', 'password', 'phone', 'hostel', 'block', 'room', 'created_at'),
+              ('name', 'email', 'password')),
+    'items': ('items',
+              ('id', 'user_id', 'title', 'category', 'price', 'condition', 'image', 'address', 'latitude',
+               'longitude', 'description', 'hostel', 'block', 'status', 'created_at', 'updated_at'),
+              ('user_id', 'title', 'category', 'price', 'condition')),
+    'orders': ('orders',
+               ('id', 'buyer_id', 'seller_id', 'item_id', 'item_title', 'price', 'quantity', 'total',
+                'transaction_ref', 'status', 'created_at'),
+               ('buyer_id', 'seller_id', 'item_id')),
+}
+
+INT_COLUMNS = {'id', 'user_id', 'buyer_id', 'seller_id', 'item_id', 'quantity'}
+FLOAT_COLUMNS = {'price', 'latitude', 'longitude', 'total'}
+TIMESTAMP_COLUMNS = {'created_at', 'updated_at'}
+STATUS_DEFAULTS = {'items': 'available', 'orders': 'completed'}
+
+# werkzeug hash prefixes; anything else in a `password` column is treated as plain text
+PASSWORD_HASH_PREFIXES = ('scrypt:', 'pbkdf2:')
+
+DEFAULT_BATCH_SIZE = 5000
+
+
+def executemany_batches(conn, sql, rows, batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """Run `sql` over an iterable of parameter tuples in executemany batches.
+
+    Does not commit; the caller owns the transaction. `on_batch(count)` is called
+    after each batch with the number of rows written so far. Returns the total.
+    """
+    cursor = conn.cursor()
+    batch = []
+    total = 0
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.executemany(sql, batch)
+            total += len(batch)
+            batch = []
+            if on_batch:
+                on_batch(total)
+    if batch:
+        cursor.executemany(sql, batch)
+        total += len(batch)
+        if on_batch:
+            on_batch(total)
+    return total
+
+
+def publish_item_changes(conn, after_version, action, fields):
+    """Publish an item event for every item_changes entry past after_version; returns the new version"""
+    for item_id, version in conn.execute(
+            'SELECT item_id, version FROM item_changes WHERE version > ? ORDER BY version', (after_version,)):
+        events.publish('item', action, item_id, fields)
+        after_version = version
+    return after_version
+
+
+def detect_format(path, fmt):
+    if fmt:
+        return fmt
+    if path == '-':
+        raise click.UsageError('--format is required when reading from stdin or writing to stdout')
+    lowered = path.lower()
+    if lowered.endswith('.csv'):
+        return 'csv'
+    if lowered.endswith(('.jsonl', '.ndjson')):
+        return 'jsonl'
+    raise click.BadParameter('cannot infer format from the file name; pass --format', param_hint='--format')
+
+
+def read_records(stream, fmt):
+    """Yield raw records from a CSV or JSONL stream, one at a time (see decode_record)"""
+    if fmt == 'csv':
+        for record in csv.DictReader(stream):
+            # CSV has no NULL; treat empty cells as missing
+            yield {k: (v if v != '' else None) for k, v in record.items()}
+    else:
+        for line in stream:
+            line = line.strip()
+            if line:
+                yield line
+
+
+def decode_record(raw):
+    """Dict for a record from read_records; JSONL lines are parsed here so a bad one is just an invalid row"""
+    if isinstance(raw, dict):
+        return raw
+    record = json.loads(raw)  # json.JSONDecodeError is a ValueError
+    if not isinstance(record, dict):
+        raise ValueError('expected a JSON object')
+    return record
+
+
+def clean_record(entity, record, now):
+    """Validate and coerce one record into a parameter tuple; raises ValueError"""
+    table, columns, required = ENTITIES[entity]
+    for col in required:
+        if record.get(col) in (None, ''):
+            raise ValueError(f'missing required field {col!r}')
+
+    values = []
+    for col in columns:
+        value = record.get(col)
+        if value is not None:
+            if col in INT_COLUMNS:
+                value = int(value)
+            elif col in FLOAT_COLUMNS:
+                value = float(value)
+        if col == 'password' and not str(value).startswith(PASSWORD_HASH_PREFIXES):
+            value = generate_password_hash(value)
+        elif col in TIMESTAMP_COLUMNS and value is None:
+            value = now
+        elif col == 'status' and value is None:
+            value = STATUS_DEFAULTS[entity]
+        elif col == 'quantity' and value is None:
+            value = 1
+        values.append(value)
+
+    if entity == 'orders':
+        row = dict(zip(columns, values))
+        if row['total'] is None and row['price'] is not None:
+            values[columns.index('total')] = row['price'] * row['quantity']
+    return tuple(values)
+
+
+def read_checkpoint(path):
+    try:
+        with open(path) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def write_checkpoint(path, rows_done):
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(str(rows_done))
+    os.replace(tmp, path)
+
+
+@roomie_cli.command('import')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('path', type=click.Path(dir_okay=False, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Input format (default: from extension).')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows per executemany call.')
+@click.option('--commit-every', default=0, help='Commit and checkpoint every N rows (0 = one transaction).')
+@click.option('--resume', is_flag=True, help='Skip rows recorded in the checkpoint of a previous run.')
+@click.option('--on-conflict', type=click.Choice(['abort', 'ignore', 'replace']), default='abort', show_default=True)
+@click.option('--skip-invalid', is_flag=True, help='Report and skip invalid rows instead of aborting.')
+def import_command(entity, path, fmt, batch_size, commit_every, resume, on_conflict, skip_invalid):
+    """Import ENTITY rows from a CSV or JSONL file ('-' for stdin)."""
+    fmt = detect_format(path, fmt)
+    table, columns, _ = ENTITIES[entity]
+    verb = {'abort': 'INSERT', 'ignore': 'INSERT OR IGNORE', 'replace': 'INSERT OR REPLACE'}[on_conflict]
+    sql = f"{verb} INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    checkpoint_path = None if path == '-' else path + '.progress'
+    skip = read_checkpoint(checkpoint_path) if resume and checkpoint_path else 0
+    now = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    stats = {'read': 0, 'invalid': 0}
+    started = time.monotonic()
+
+    stream = sys.stdin if path == '-' else open(path, newline='', encoding='utf-8')
+    conn = get_db_connection()
+    conn.execute('PRAGMA cache_size = -65536')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    # Committed items get change events (see publish_item_changes)
+    publish = entity == 'items'
+    if publish:
+        version = conn.execute('SELECT COALESCE(MAX(version), 0) FROM item_changes').fetchone()[0]
+        action = 'updated' if on_conflict == 'replace' else 'created'
+
+    def committed():
+        nonlocal version
+        if publish:
+            version = publish_item_changes(conn, version, action, columns)
+
+    def rows():
+        for lineno, record in enumerate(read_records(stream, fmt), start=1):
+            if lineno <= skip:
+                continue
+            stats['read'] = lineno
+            try:
+                yield clean_record(entity, decode_record(record), now)
+            except (ValueError, TypeError) as e:
+                if not skip_invalid:
+                    raise click.ClickException(f'row {lineno}: {e}')
+                stats['invalid'] += 1
+                click.echo(f'row {lineno}: skipped ({e})', err=True)
+
+    def progress(count):
+        elapsed = max(time.monotonic() - started, 1e-6)
+        click.echo(f'{entity}: {count} rows written ({count / elapsed * 60:,.0f} rows/min)', err=True)
+
+    if skip:
+        click.echo(f'Resuming after row {skip}', err=True)
+
+    try:
+        if commit_every:
+            written = 0
+            source = rows()
+            while True:
+                chunk = []
+                for row in source:
+                    chunk.append(row)
+                    if len(chunk) >= commit_every:
+                        break
+                if not chunk:
+                    break
+                written += executemany_batches(conn, sql, chunk, batch_size)
+                conn.commit()
+                committed()
+                if checkpoint_path:
+                    write_checkpoint(checkpoint_path, stats['read'])
+                progress(written)
+        else:
+            written = executemany_batches(conn, sql, rows(), batch_size, on_batch=progress)
+            conn.commit()
+            committed()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+        if stream is not sys.stdin:
+            stream.close()
+
+    if checkpoint_path and os.path.exists(checkpoint_path):
+        os.remove(checkpoint_path)
+    elapsed = time.monotonic() - started
+    click.echo(f'Imported {written} {entity} ({stats["invalid"]} invalid) in {elapsed:.1f}s')
+
+
+@roomie_cli.command('export')
+@click.argument('entity', type=click.Choice(sorted(ENTITIES)))
+@click.argument('path', type=click.Path(dir_okay=False, writable=True, allow_dash=True))
+@click.option('--format', 'fmt', type=click.Choice(['csv', 'jsonl']), help='Output format (default: from extension).')
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True, help='Rows fetched per round trip.')
+@click.option('--with-password-hashes', is_flag=True, help='Include users.password hashes (needed for migrations).')
+def export_command(entity, path, fmt, batch_size, with_password_hashes):
+    """Export ENTITY rows to a CSV or JSONL file ('-' for stdout)."""
+    fmt = detect_format(path, fmt)
+    table, columns, _ = ENTITIES[entity]
+    if entity == 'users' and not with_password_hashes:
+        columns = tuple(c for c in columns if c != 'password')
+
+    out = sys.stdout if path == '-' else open(path, 'w', newline='', encoding='utf-8')
+    conn = get_db_connection()
+    written = 0
+    try:
+        cursor = conn.execute(f"SELECT {', '.join(columns)} FROM {table} ORDER BY id")
+        writer = csv.writer(out) if fmt == 'csv' else None
+        if writer:
+            writer.writerow(columns)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if writer:
+                writer.writerows(tuple(r) for r in rows)
+            else:
+                out.write(''.join(dumps_json(dict(r)).decode('utf-8') + '\n' for r in rows))
+            written += len(rows)
+    finally:
+        conn.close()
+        if out is not sys.stdout:
+            out.close()
+
+    click.echo(f'Exported {written} {entity}', err=True)
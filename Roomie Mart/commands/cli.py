@@ -0,0 +1,19 @@
+from flask.cli import AppGroup
+
+# All project commands live under `flask roomie ...`
+roomie_cli = AppGroup('roomie', help='Roomie Mart data and maintenance commands.')
+
+
+def register_commands(app):
+    """Attach the `roomie` command group to the app's CLI"""
+    # Command modules register themselves on the group when imported
+    import commands.archive  # noqa: F401
+    import commands.bulk_io  # noqa: F401
+    import commands.generate  # noqa: F401
+    import commands.jobs  # noqa: F401
+    import commands.maintain  # noqa: F401
+    import commands.seller_stats  # noqa: F401
+    import commands.serve  # noqa: F401
+    import commands.similar  # noqa: F401
+    import commands.snapshot  # noqa: F401
+    app.cli.add_command(roomie_cli)
@@ -0,0 +1,262 @@
+"""Deterministic synthetic data for scale testing: `flask roomie generate`.
+
+Creates users spread across hostels and blocks, listings with realistic
+category/price/status/timestamp distributions, and message threads,
+requests, orders and feedback whose activity follows a power law (a few
+very active users and hot listings, a long tail of quiet ones). The same
+--seed always produces the same data.
+
+Rows go through executemany in one transaction with synchronous=OFF, an
+in-memory journal and the secondary indexes dropped, then the indexes are
+rebuilt once at the end. A crash midway can corrupt the file, so the command
+refuses a database that already holds data unless --force is given: point
+ROOMIE_DATABASE_PATH at a scratch file instead.
+"""
+import random
+import time
+from itertools import accumulate
+
+import click
+from werkzeug.security import generate_password_hash
+
+from commands.bulk_io import executemany_batches, DEFAULT_BATCH_SIZE
+from commands.cli import roomie_cli
+from database import db_connection
+from database.db_connection import get_db_connection
+from models.feedback_model import Feedback
+
+TABLES = ('users', 'items', 'messages', 'requests', 'orders', 'feedbacks')
+
+BLOCKS = ['A', 'B', 'C', 'D', 'E', 'F']
+# Hostels are scattered within HOSTEL_SPREAD_DEG of the campus; listings sit near their hostel
+CAMPUS_CENTRE = (18.5204, 73.8567)
+HOSTEL_SPREAD_DEG = 0.03
+LISTING_JITTER_DEG = 0.0015
+# category -> (weight, median price)
+CATEGORIES = {
+    'Electronics': (18, 2500), 'Books': (25, 300), 'Furniture': (10, 1800), 'Clothing': (15, 450),
+    'Kitchen': (14, 600), 'Sports': (8, 900), 'Other': (10, 400),
+}
+CONDITIONS = (['New', 'Like New', 'Good', 'Fair', 'Poor'], [8, 22, 40, 22, 8])
+RATINGS = ([1, 2, 3, 4, 5], [5, 5, 15, 35, 40])
+MESSAGE_TEXTS = [
+    'Hi, is this still available?', 'Can you do a lower price?', 'Yes, it is available.',
+    'Where can I pick it up?', 'I can come by this evening.', 'Does it have any damage?',
+    'It works perfectly, barely used.', 'Deal. See you at the gate.', 'Sorry, it is already reserved.',
+    'Can you share more photos?', 'What is the last price?', 'I am in the same block, room 204.',
+]
+
+
+def power_law_weights(rng, n, alpha):
+    """Cumulative Pareto weights for picking an index in range(n)"""
+    return list(accumulate(rng.paretovariate(alpha) for _ in range(n)))
+
+
+def pick(rng, cum_weights, k):
+    return rng.choices(range(len(cum_weights)), cum_weights=cum_weights, k=k)
+
+
+def drop_indexes(conn):
+    """Drop secondary indexes on the generated tables; returns their CREATE statements"""
+    placeholders = ', '.join('?' * len(TABLES))
+    rows = conn.execute(
+        f"SELECT name, sql FROM sqlite_master WHERE type = 'index' AND sql IS NOT NULL AND tbl_name IN ({placeholders})",
+        TABLES).fetchall()
+    for row in rows:
+        conn.execute(f'DROP INDEX {row["name"]}')
+    return [row['sql'] for row in rows]
+
+
+def has_rows(conn):
+    return any(conn.execute(f'SELECT EXISTS (SELECT 1 FROM {table})').fetchone()[0] for table in TABLES)
+
+
+def next_id(conn, table):
+    return conn.execute(f'SELECT COALESCE(MAX(id), 0) + 1 FROM {table}').fetchone()[0]
+
+
+@roomie_cli.command('generate')
+@click.option('--users', default=1000, show_default=True)
+@click.option('--items', default=10000, show_default=True)
+@click.option('--messages', default=100000, show_default=True)
+@click.option('--hostels', default=12, show_default=True, help='Number of distinct hostels/PGs.')
+@click.option('--days', default=365, show_default=True, help='Spread timestamps over this many past days.')
+@click.option('--seed', default=1, show_default=True)
+@click.option('--batch-size', default=DEFAULT_BATCH_SIZE, show_default=True)
+@click.option('--force', is_flag=True,
+              help='Generate into a database that already has data (unsafe writes; back it up first).')
+def generate_command(users, items, messages, hostels, days, seed, batch_size, force):
+    """Append seeded synthetic users, items, messages, requests, orders and feedback."""
+    rng = random.Random(seed)
+    now = int(time.time())
+    span = days * 86400
+    started = time.monotonic()
+
+    conn = get_db_connection()
+    if not force and has_rows(conn):
+        conn.close()
+        raise click.ClickException(
+            f'{db_connection.DATABASE_PATH} already has data. Point ROOMIE_DATABASE_PATH at a scratch file, '
+            'or pass --force to write into it with synchronous=OFF (a crash can corrupt it).')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = MEMORY')
+    conn.execute('PRAGMA cache_size = -262144')
+    conn.execute('PRAGMA temp_store = MEMORY')
+
+    def report(table, count):
+        click.echo(f'{table}: {count:,} rows ({time.monotonic() - started:.1f}s elapsed)', err=True)
+
+    index_sql = drop_indexes(conn)
+    try:
+        # --- users -------------------------------------------------------
+        first_user = next_id(conn, 'users')
+        password = generate_password_hash('password')
+        hostel_names = [f'Hostel {chr(65 + h % 26)}{h // 26 or ""}' for h in range(hostels)]
+        user_hostel = [rng.randrange(hostels) for _ in range(users)]
+        user_block = [rng.randrange(len(BLOCKS)) for _ in range(users)]
+        user_cum = power_law_weights(rng, users, 1.16)
+
+        def user_rows():
+            for u in range(users):
+                uid = first_user + u
+                yield (uid, f'Student {uid}', f'student{uid}@synthetic.roomie', password,
+                       f'9{rng.randrange(10 ** 9):09d}', hostel_names[user_hostel[u]], BLOCKS[user_block[u]],
+                       str(100 + rng.randrange(400)), now - span + int(span * rng.random()))
+
+        executemany_batches(conn, '''
+            INSERT INTO users (id, name, email, password, phone, hostel, block, room, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', user_rows(), batch_size)
+        report('users', users)
+
+        # --- items -------------------------------------------------------
+        first_item = next_id(conn, 'items')
+        cat_names = list(CATEGORIES)
+        cat_weights = [CATEGORIES[c][0] for c in cat_names]
+        item_owner = pick(rng, user_cum, items)
+        # Recent listings are more common than old ones
+        item_created = [now - int(span * rng.random() ** 2) for _ in range(items)]
+        item_sold = [rng.random() < 0.28 for _ in range(items)]
+        item_price = []
+        item_category = []
+        # Separate stream so adding coordinates doesn't change the rest of a seed's data
+        geo_rng = random.Random(f'{seed}-geo')
+        hostel_coords = [(CAMPUS_CENTRE[0] + geo_rng.uniform(-HOSTEL_SPREAD_DEG, HOSTEL_SPREAD_DEG),
+                          CAMPUS_CENTRE[1] + geo_rng.uniform(-HOSTEL_SPREAD_DEG, HOSTEL_SPREAD_DEG))
+                         for _ in range(hostels)]
+
+        def item_rows():
+            for i in range(items):
+                category = rng.choices(cat_names, weights=cat_weights)[0]
+                price = round(CATEGORIES[category][1] * rng.lognormvariate(0, 0.6) / 10) * 10 or 10
+                item_price.append(price)
+                item_category.append(category)
+                owner = item_owner[i]
+                lat, lon = hostel_coords[user_hostel[owner]]
+                yield (first_item + i, first_user + owner, f'{category} item #{first_item + i}', category, price,
+                       rng.choices(*CONDITIONS)[0], f'Synthetic {category.lower()} listing in usable condition.',
+                       hostel_names[user_hostel[owner]], BLOCKS[user_block[owner]],
+                       round(lat + geo_rng.uniform(-LISTING_JITTER_DEG, LISTING_JITTER_DEG), 6),
+                       round(lon + geo_rng.uniform(-LISTING_JITTER_DEG, LISTING_JITTER_DEG), 6),
+                       'sold' if item_sold[i] else 'available', item_created[i], item_created[i])
+
+        executemany_batches(conn, '''
+            INSERT INTO items (id, user_id, title, category, price, condition, description, hostel, block,
+                               latitude, longitude, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, datetime(?, 'unixepoch'), datetime(?, 'unixepoch'))
+        ''', item_rows(), batch_size)
+        report('items', items)
+
+        # --- message threads (+ requests opened from some of them) ---------
+        item_cum = power_law_weights(rng, items, 1.3) if items else []
+        request_rows = []
+
+        def message_rows():
+            produced = 0
+            while produced < messages and items and users > 1:
+                item = pick(rng, item_cum, 1)[0]
+                owner = item_owner[item]
+                buyer = pick(rng, user_cum, 1)[0]
+                if buyer == owner:
+                    continue
+                length = min(1 + int(rng.expovariate(1 / 6.0)), messages - produced)
+                t = item_created[item] + int(rng.expovariate(1 / 86400.0))
+                for n in range(length):
+                    sender, receiver = (buyer, owner) if n % 2 == 0 else (owner, buyer)
+                    t += int(rng.expovariate(1 / 3600.0))
+                    yield (first_user + sender, first_user + receiver, first_item + item,
+                           rng.choice(MESSAGE_TEXTS), 0 if n == length - 1 and rng.random() < 0.3 else 1,
+                           min(t, now))
+                produced += length
+                if rng.random() < 0.25:
+                    status = rng.choice(['accepted', 'declined']) if item_sold[item] else \
+                        rng.choices(['pending', 'declined'], [3, 1])[0]
+                    request_rows.append((first_item + item, first_user + buyer, first_user + owner,
+                                     'I would like to buy this item.', status, min(t, now)))
+
+        count = executemany_batches(conn, '''
+            INSERT INTO messages (sender_id, receiver_id, item_id, content, is_read, created_at)
+            VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', message_rows(), batch_size)
+        report('messages', count)
+
+        executemany_batches(conn, '''
+            INSERT INTO requests (item_id, requester_id, owner_id, message, status, created_at)
+            VALUES (?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', request_rows, batch_size)
+        report('requests', len(request_rows))
+        request_rows = None
+
+        # --- orders for sold items, feedback for some orders ---------------
+        first_order = next_id(conn, 'orders')
+        feedbacks = []
+
+        def order_rows():
+            oid = first_order
+            for i in range(items):
+                if not item_sold[i]:
+                    continue
+                buyer = pick(rng, user_cum, 1)[0]
+                if buyer == item_owner[i]:
+                    buyer = (buyer + 1) % users
+                t = min(item_created[i] + int(rng.expovariate(1 / (5 * 86400.0))), now)
+                yield (oid, first_user + buyer, first_user + item_owner[i], first_item + i,
+                       f'{item_category[i]} item #{first_item + i}', item_price[i], 1, item_price[i],
+                       f'syn-{seed}-{oid}', t)
+                if rng.random() < 0.4:
+                    feedbacks.append((first_user + buyer, f'Student {first_user + buyer}',
+                                      f'student{first_user + buyer}@synthetic.roomie', rng.choices(*RATINGS)[0],
+                                      'Smooth deal.', first_item + i, first_user + item_owner[i],
+                                      min(t + int(rng.expovariate(1 / 86400.0)), now)))
+                oid += 1
+
+        count = executemany_batches(conn, '''
+            INSERT INTO orders (id, buyer_id, seller_id, item_id, item_title, price, quantity, total,
+                                transaction_ref, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', order_rows(), batch_size)
+        report('orders', count)
+
+        executemany_batches(conn, '''
+            INSERT INTO feedbacks (user_id, name, email, rating, comment, item_id, seller_id, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, datetime(?, 'unixepoch'))
+        ''', feedbacks, batch_size)
+        report('feedbacks', len(feedbacks))
+
+        click.echo(f'Rebuilding {len(index_sql)} indexes...', err=True)
+        for sql in index_sql:
+            conn.execute(sql)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        # Put back any index that was dropped before the failure
+        for sql in index_sql:
+            conn.execute(sql.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+        conn.commit()
+        raise
+    finally:
+        conn.close()
+
+    # Feedback rows went in directly, bypassing Feedback.create_feedback
+    Feedback.rebuild_seller_stats()
+    click.echo(f'Generated data with seed {seed} in {time.monotonic() - started:.1f}s')
@@ -0,0 +1,87 @@
+"""Background job queue: `flask roomie jobs work|enqueue|list|retry`.
+
+See utils/jobs.py. `work` runs a JobRunner in the foreground (for when the
+app is served without `flask roomie serve` and JOBS_ENABLED, or to add
+capacity); any number of them can share the queue.
+"""
+import json
+import signal
+import threading
+
+import click
+from flask import current_app
+
+from commands.cli import roomie_cli
+from models.job_model import Job
+from utils import jobs
+
+
+@roomie_cli.group('jobs')
+def jobs_cli():
+    """Work and inspect the background job queue."""
+
+
+@jobs_cli.command('work')
+@click.option('--workers', type=int, default=None, help='Jobs run at once (default: JOBS_WORKERS).')
+@click.option('--pool', type=click.Choice(['thread', 'process']), default=None,
+              help='Run handlers on threads or in a process pool (default: JOBS_POOL).')
+@click.option('--no-schedule', is_flag=True, help='Only run queued jobs, never enqueue periodic ones.')
+def work_command(workers, pool, no_schedule):
+    """Run queued and periodic jobs until interrupted."""
+    app = current_app._get_current_object()
+    runner = jobs.JobRunner(app,
+                            workers=workers or app.config.get('JOBS_WORKERS', 2),
+                            pool=pool or app.config.get('JOBS_POOL', 'thread'),
+                            lease=app.config.get('JOBS_LEASE', jobs.DEFAULT_LEASE),
+                            schedule={} if no_schedule else app.config.get('JOBS_SCHEDULE'))
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    runner.start()
+    click.echo(f'Working the job queue with {runner.workers} worker(s) as {runner.worker_id}')
+    try:
+        stopping.wait()
+    except KeyboardInterrupt:
+        pass
+    click.echo('Stopping, waiting for running jobs...', err=True)
+    runner.stop()
+
+
+@jobs_cli.command('enqueue')
+@click.argument('name')
+@click.option('--payload', default='{}', show_default=True, help='Handler keyword arguments as JSON.')
+@click.option('--delay', default=0.0, show_default=True, help='Seconds before it may run.')
+def enqueue_command(name, payload, delay):
+    """Queue job NAME."""
+    try:
+        kwargs = json.loads(payload)
+        job_id = jobs.enqueue(name, kwargs, delay=delay)
+    except ValueError as e:
+        raise click.ClickException(f'bad --payload: {e}')
+    except KeyError as e:
+        raise click.ClickException(e.args[0])
+    click.echo(f'Queued {name} as job #{job_id}')
+
+
+@jobs_cli.command('list')
+@click.option('--status', type=click.Choice(['queued', 'running', 'done', 'failed']), default=None)
+@click.option('--limit', default=20, show_default=True)
+def list_command(status, limit):
+    """Show queue counts and the latest jobs."""
+    for row in Job.get_status_counts():
+        click.echo(f"{row['name']:<24} {row['status']:<8} {row['count']:>6}")
+    click.echo('')
+    for job in Job.get_recent(status=status, limit=limit):
+        error = f"  {job['last_error']}" if job['last_error'] else ''
+        click.echo(f"#{job['id']:<6} {job['name']:<24} {job['status']:<8} "
+                   f"{job['attempts']}/{job['max_attempts']} {job['created_at']}{error}")
+
+
+@jobs_cli.command('retry')
+@click.argument('job_ids', type=int, nargs=-1, required=True)
+def retry_command(job_ids):
+    """Queue failed jobs again."""
+    for job_id in job_ids:
+        if Job.retry(job_id):
+            click.echo(f'Job #{job_id} queued again')
+        else:
+            click.echo(f'Job #{job_id} is not a failed job', err=True)
@@ -0,0 +1,147 @@
+"""Database upkeep: `flask roomie db backup|vacuum|optimize|checkpoint|report|maintain`.
+
+See database/maintenance.py. `maintain` runs checkpoint, incremental vacuum
+and optimize in one go (plus a backup with --backup-dir); give it --every to
+keep doing that on a schedule, or run it from cron.
+"""
+import glob
+import os
+import time
+from datetime import datetime
+
+import click
+
+from commands.cli import roomie_cli
+from database import db_connection, maintenance
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BACKUP_DIR = os.path.join(APP_ROOT, 'backups')
+DEFAULT_KEEP = 7
+
+
+@roomie_cli.group('db')
+def db_cli():
+    """Backups and storage maintenance for the SQLite database."""
+
+
+def human_size(size):
+    if size is None:
+        return '-'
+    for unit in ('B', 'KB', 'MB', 'GB'):
+        if size < 1024 or unit == 'GB':
+            return f'{size:.0f} {unit}' if unit == 'B' else f'{size:.1f} {unit}'
+        size /= 1024
+
+
+def run_backup(directory, keep, pages, pause, verify):
+    """Timestamped backup in `directory`, keeping the `keep` newest; returns the summary"""
+    os.makedirs(directory, exist_ok=True)
+    stem = os.path.splitext(os.path.basename(db_connection.DATABASE_PATH))[0]
+    target = os.path.join(directory, f"{stem}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.db")
+    summary = maintenance.backup_to(target, verify=verify, pages=pages, pause=pause)
+    if keep:
+        # Names sort by timestamp
+        for old in sorted(glob.glob(os.path.join(glob.escape(directory), f'{glob.escape(stem)}-*.db')))[:-keep]:
+            os.remove(old)
+    return summary
+
+
+def echo_backup(summary):
+    check = f", quick_check {summary['check']}" if 'check' in summary else ''
+    click.echo(f"Backed up {summary['pages']} pages to {summary['path']} in {summary['steps']} step(s), "
+               f"{summary['restarts']} restart(s), {summary['mode']}, {summary['seconds']}s{check}")
+
+
+def echo_vacuum(result):
+    if result['auto_vacuum'] != 'incremental':
+        click.echo(f"auto_vacuum is {result['auto_vacuum']}: {result['free_pages']} free page(s) stay in the file "
+                   f"(run `flask roomie db vacuum --enable` once to switch to incremental)")
+    else:
+        click.echo(f"Released {result['freed']} free page(s), {result['free_pages']} left")
+
+
+def echo_checkpoint(result):
+    if result is None:
+        click.echo('Not in WAL mode, nothing to checkpoint')
+    else:
+        busy, wal_pages, done = result
+        click.echo(f"Checkpointed {done} of {wal_pages} WAL page(s){' (busy)' if busy else ''}")
+
+
+@db_cli.command('backup')
+@click.option('--dir', 'directory', default=DEFAULT_BACKUP_DIR, show_default=True, help='Where backups go.')
+@click.option('--keep', default=DEFAULT_KEEP, show_default=True, help='Newest backups to keep (0 keeps all).')
+@click.option('--pages', default=maintenance.PAGES_PER_STEP, show_default=True,
+              help='Pages copied per step (-1 copies everything in one step).')
+@click.option('--pause', default=maintenance.STEP_PAUSE, show_default=True,
+              help='Seconds to pause between steps so writers get the lock.')
+@click.option('--verify', is_flag=True, help='Run PRAGMA quick_check on the copy.')
+def backup_command(directory, keep, pages, pause, verify):
+    """Online backup of the live database, throttled so writes keep flowing."""
+    echo_backup(run_backup(directory, keep, pages, pause, verify))
+
+
+@db_cli.command('vacuum')
+@click.option('--enable', is_flag=True,
+              help='Switch to auto_vacuum=INCREMENTAL first (one full VACUUM; locks the database meanwhile).')
+@click.option('--step', default=maintenance.VACUUM_PAGES_PER_STEP, show_default=True,
+              help='Pages released per transaction.')
+@click.option('--max-pages', type=int, default=None, help='Stop after releasing this many pages.')
+def vacuum_command(enable, step, max_pages):
+    """Give free pages back to the OS with PRAGMA incremental_vacuum."""
+    if enable:
+        click.echo(f'auto_vacuum is now {maintenance.enable_incremental_vacuum()}')
+    echo_vacuum(maintenance.incremental_vacuum(step=step, max_pages=max_pages))
+
+
+@db_cli.command('optimize')
+@click.option('--analysis-limit', default=maintenance.ANALYSIS_LIMIT, show_default=True,
+              help='Rows ANALYZE samples per index (0 reads them all).')
+def optimize_command(analysis_limit):
+    """Refresh the query planner's statistics (ANALYZE + PRAGMA optimize)."""
+    click.echo(f"Statistics refreshed in {maintenance.optimize(analysis_limit)['seconds']}s")
+
+
+@db_cli.command('checkpoint')
+@click.option('--mode', type=click.Choice(['PASSIVE', 'FULL', 'RESTART', 'TRUNCATE']), default='TRUNCATE',
+              show_default=True)
+def checkpoint_command(mode):
+    """Copy the WAL into the database and truncate it (WAL mode only)."""
+    echo_checkpoint(maintenance.checkpoint(mode))
+
+
+@db_cli.command('report')
+def report_command():
+    """Print file sizes, free space and per-table statistics."""
+    report = maintenance.storage_report()
+    click.echo(f"{report['path']}")
+    click.echo(f"  size {human_size(report['size'])}, WAL {human_size(report['wal_size'])}, "
+               f"journal_mode {report['journal_mode']}, auto_vacuum {report['auto_vacuum']}")
+    click.echo(f"  {report['page_count']} pages of {report['page_size']} B, {report['free_pages']} free "
+               f"({report['fragmentation']}% fragmentation)")
+    click.echo(f"  planner statistics: {'present' if report['analyzed'] else 'missing (run `flask roomie db optimize`)'}")
+    for name, size in report['related'].items():
+        click.echo(f'  {name}: {human_size(size)}')
+    click.echo('')
+    click.echo(f"{'table':<24} {'rows':>10} {'data':>10} {'indexes':>10} {'unused':>10}")
+    for table in sorted(report['tables'], key=lambda t: -(t['bytes'] or 0)):
+        click.echo(f"{table['name']:<24} {table['rows']:>10} {human_size(table['bytes']):>10} "
+                   f"{human_size(table['index_bytes']):>10} {human_size(table['unused']):>10}")
+
+
+@db_cli.command('maintain')
+@click.option('--backup-dir', default=None, help='Also take a backup into this directory.')
+@click.option('--keep', default=DEFAULT_KEEP, show_default=True, help='Newest backups to keep.')
+@click.option('--every', type=float, default=0, help='Keep running, repeating every N seconds.')
+def maintain_command(backup_dir, keep, every):
+    """Checkpoint, incremental vacuum and optimize (and back up) in one run."""
+    while True:
+        click.echo(f"[{datetime.now().strftime('%Y-%m-%d %H:%M:%S')}]")
+        if backup_dir:
+            echo_backup(run_backup(backup_dir, keep, maintenance.PAGES_PER_STEP, maintenance.STEP_PAUSE, True))
+        echo_checkpoint(maintenance.checkpoint('TRUNCATE'))
+        echo_vacuum(maintenance.incremental_vacuum())
+        click.echo(f"Statistics refreshed in {maintenance.optimize()['seconds']}s")
+        if not every:
+            break
+        time.sleep(every)
@@ -0,0 +1,18 @@
+"""Rebuild seller reputation aggregates: `flask roomie seller-stats`.
+
+seller_stats is normally kept current by Feedback.create_feedback, in the
+same transaction as each feedback row. Rows written any other way (manual
+SQL, restores, generate) need a rebuild, which recomputes every seller from
+the feedbacks table in one transaction.
+"""
+import click
+
+from commands.cli import roomie_cli
+from models.feedback_model import Feedback
+
+
+@roomie_cli.command('seller-stats')
+def seller_stats_command():
+    """Recompute seller_stats from the feedbacks table."""
+    sellers = Feedback.rebuild_seller_stats()
+    click.echo(f'Rebuilt rating aggregates for {sellers} seller(s)')
@@ -0,0 +1,287 @@
+"""Preforking production server: `flask roomie serve`.
+
+The master process builds the app once (code imported, templates compiled,
+marketplace facet index loaded), binds the listening socket and forks
+--workers copies that share it. The master does use the database while it
+sets up (init_db() when the app is created, the facet index preload), but
+get_db_connection() opens a connection per call and both close theirs before
+the first fork, so no SQLite handle crosses into a worker: each opens its
+own.
+
+Each worker warms its own caches, then serves with a threaded WSGI server.
+On SIGTERM/SIGINT the master tells workers to stop accepting, each worker
+waits for its in-flight requests (up to --graceful-timeout), runs the
+registered shutdown hooks and exits. Workers that die unexpectedly are
+replaced after RESTART_DELAY seconds, doubled for every other exit in the
+last CRASH_WINDOW seconds; after CRASH_LIMIT exits in that window the master
+assumes a crash loop, stops the remaining workers and exits with an error.
+Needs os.fork(), i.e. Linux or macOS.
+
+With JOBS_ENABLED every worker also runs a background job runner
+(utils/jobs.py), started after warm-up and stopped (running jobs get up to
+--graceful-timeout) before the shutdown hooks.
+"""
+import logging
+import os
+from collections import deque
+import signal
+import socket
+import sys
+import threading
+import time
+
+import click
+from flask import current_app
+from werkzeug.serving import make_server
+
+from commands.cli import roomie_cli
+from database.db_connection import get_db_connection
+
+# Respawn backoff: first delay, its ceiling, and how many worker exits within
+# CRASH_WINDOW seconds make the master give up
+RESTART_DELAY = 1.0
+MAX_RESTART_DELAY = 30.0
+CRASH_WINDOW = 60.0
+CRASH_LIMIT = 10
+
+# Callables run in each worker after it stops serving (flush logs, queues, ...)
+_shutdown_hooks = []
+
+
+def add_shutdown_hook(hook):
+    """Register hook() to run in every worker once its requests have drained"""
+    _shutdown_hooks.append(hook)
+
+
+def default_workers():
+    """One worker per core available to this process"""
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def preload(app):
+    """Compile every template in the master so workers inherit them"""
+    for name in app.jinja_env.list_templates(extensions=('html',)):
+        try:
+            app.jinja_env.get_template(name)
+        except Exception as e:
+            print(f"[serve] could not preload template {name}: {e}")
+
+
+def preload_facets():
+    """Load the facet index in the master; workers share its bitmaps copy-on-write"""
+    from utils import facet_index
+    try:
+        facet_index.get_index().refresh()
+    except Exception as e:
+        print(f"[serve] could not preload the facet index: {e}")
+
+
+def warm_worker(app):
+    """Per-worker warm-up, run after fork: first connection and hot pages"""
+    conn = get_db_connection()
+    try:
+        # Touch the tables behind the busiest pages so they are in the page cache
+        for table in ('users', 'items', 'messages', 'orders'):
+            conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+    finally:
+        conn.close()
+    with app.app_context():
+        from utils import bill_cache
+        bill_cache.template_version()
+
+
+class InFlight:
+    """WSGI middleware counting requests that are still being handled"""
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+        self.count = 0
+        self._cond = threading.Condition()
+
+    def __call__(self, environ, start_response):
+        with self._cond:
+            self.count += 1
+        try:
+            # Streamed bodies are written after we return; the server closes
+            # the iterable when done, which is when the request really ends.
+            return _ClosingIterator(self.wsgi_app(environ, start_response), self._done)
+        except BaseException:
+            self._done()
+            raise
+
+    def _done(self):
+        with self._cond:
+            self.count -= 1
+            self._cond.notify_all()
+
+    def wait(self, timeout):
+        """Block until no request is in flight; False if `timeout` ran out"""
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while self.count:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+
+class _ClosingIterator:
+    def __init__(self, iterable, on_close):
+        self._iterable = iterable
+        self._on_close = on_close
+
+    def __iter__(self):
+        return iter(self._iterable)
+
+    def close(self):
+        try:
+            if hasattr(self._iterable, 'close'):
+                self._iterable.close()
+        finally:
+            self._on_close()
+
+
+def run_worker(app, sock, threaded, graceful_timeout):
+    """Body of a forked worker; never returns"""
+    # The master's handlers were inherited; this process handles its own
+    stopping = threading.Event()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Until the server is up there is nothing to drain: just die on SIGTERM
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    status = 0
+    runner = None
+    try:
+        warm_worker(app)
+        if app.config.get('JOBS_ENABLED'):
+            from utils import jobs
+            runner = jobs.start_runner(app)
+        in_flight = InFlight(app)
+        server = make_server(sock.getsockname()[0], sock.getsockname()[1], in_flight,
+                             threaded=threaded, fd=sock.fileno())
+
+        def stop(signum, frame):
+            if not stopping.is_set():
+                stopping.set()
+                # shutdown() blocks until serve_forever() returns, so not from this thread
+                threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_forever()
+        if not in_flight.wait(graceful_timeout):
+            print(f"[serve] worker {os.getpid()}: {in_flight.count} request(s) still running after "
+                  f"{graceful_timeout}s, exiting anyway")
+        server.server_close()
+    except Exception as e:
+        print(f"[serve] worker {os.getpid()} failed: {e}")
+        status = 1
+    if runner is not None:
+        runner.stop(graceful_timeout)
+    for hook in _shutdown_hooks:
+        try:
+            hook()
+        except Exception as e:
+            print(f"[serve] shutdown hook failed: {e}")
+    logging.shutdown()
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os._exit(status)
+
+
+def spawn(app, sock, threaded, graceful_timeout):
+    pid = os.fork()
+    if pid == 0:
+        run_worker(app, sock, threaded, graceful_timeout)
+    return pid
+
+
+@roomie_cli.command('serve')
+@click.option('--host', default='0.0.0.0', show_default=True)
+@click.option('--port', default=8000, show_default=True)
+@click.option('--workers', type=int, default=None, help='Worker processes (default: one per CPU core).')
+@click.option('--threads/--no-threads', default=True, show_default=True,
+              help='Handle each worker\'s requests in threads.')
+@click.option('--graceful-timeout', default=30.0, show_default=True,
+              help='Seconds a stopping worker waits for in-flight requests.')
+def serve(host, port, workers, threads, graceful_timeout):
+    """Serve the app with preforked worker processes."""
+    if not hasattr(os, 'fork'):
+        raise click.ClickException('serve needs os.fork(); use `flask run` on this platform')
+    app = current_app._get_current_object()
+    workers = workers or default_workers()
+
+    preload(app)
+    preload_facets()
+    sock = socket.socket(socket.AF_INET6 if ':' in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(socket.SOMAXCONN)
+    sock.set_inheritable(True)
+
+    stopping = False
+
+    def request_stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGTERM, request_stop)
+    signal.signal(signal.SIGINT, request_stop)
+
+    children = set()
+    for _ in range(workers):
+        children.add(spawn(app, sock, threads, graceful_timeout))
+    click.echo(f'Serving on http://{host}:{port} with {workers} worker(s) (master pid {os.getpid()})')
+
+    exits = deque()  # when workers died, within the last CRASH_WINDOW seconds
+    respawns = []  # when each pending replacement is due
+    crash_loop = False
+    while not stopping:
+        now = time.monotonic()
+        for due in [due for due in respawns if due <= now]:
+            respawns.remove(due)
+            children.add(spawn(app, sock, threads, graceful_timeout))
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            if not respawns:
+                break
+            pid = 0
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        children.discard(pid)
+        exits.append(now)
+        while exits[0] < now - CRASH_WINDOW:
+            exits.popleft()
+        if len(exits) >= CRASH_LIMIT:
+            click.echo(f'{len(exits)} worker exits in {CRASH_WINDOW:.0f}s, giving up', err=True)
+            crash_loop = True
+            break
+        delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** (len(exits) - 1))
+        click.echo(f'Worker {pid} exited ({status}), starting a replacement in {delay:.1f}s', err=True)
+        respawns.append(now + delay)
+
+    click.echo(f'Stopping {len(children)} worker(s)...', err=True)
+    for pid in children:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    deadline = time.monotonic() + graceful_timeout + 5
+    while children and time.monotonic() < deadline:
+        try:
+            pid, _ = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid:
+            children.discard(pid)
+        else:
+            time.sleep(0.1)
+    for pid in children:
+        os.kill(pid, signal.SIGKILL)
+    sock.close()
+    if crash_loop:
+        raise click.ClickException('workers keep exiting; check the log above for the cause')
@@ -0,0 +1,157 @@
+"""Precompute "similar items": `flask roomie similar`.
+
+Vectorises every available item with TF-IDF (utils/similarity.py) and stores
+each one's top-K cosine neighbours in `item_similar`, so item_detail shows
+related listings with one primary-key lookup.
+
+Runs are incremental: `item_similar_state` remembers the item_changes version
+the lists reflect, and the next run only recomputes the lists of
+
+  - items written since then (new, edited, sold or deleted ones),
+  - items whose list points at one of those, and
+  - items a changed item now beats the weakest entry of.
+
+IDF weights drift as listings come and go, so scores of untouched lists age
+slowly; run with --full now and then (or whenever more than
+FULL_REBUILD_SHARE of the lists would be recomputed anyway). Use --every to
+keep refreshing in the foreground.
+"""
+import time
+
+import click
+
+from commands.cli import roomie_cli
+from database.db_connection import get_db_connection
+
+DEFAULT_K = 8
+FULL_REBUILD_SHARE = 0.25
+# SQLite's default limit on host parameters is 999
+PARAMS_PER_QUERY = 900
+
+
+def chunks(values, size=PARAMS_PER_QUERY):
+    values = list(values)
+    for start in range(0, len(values), size):
+        yield values[start:start + size]
+
+
+def read_snapshot(conn, last_version):
+    """(head version, available item docs, ids changed since last_version) in one read transaction"""
+    conn.execute('BEGIN')
+    try:
+        head = conn.execute('SELECT COALESCE(MAX(version), 0) FROM item_changes').fetchone()[0]
+        docs = conn.execute('''
+            SELECT id, title, description, category
+            FROM items
+            WHERE +status = 'available'
+            ORDER BY id
+        ''').fetchall()
+        changed = set()
+        if last_version is not None:
+            changed = {row[0] for row in conn.execute(
+                'SELECT item_id FROM item_changes WHERE version > ? AND version <= ?', (last_version, head))}
+    finally:
+        conn.rollback()
+    return head, [tuple(row) for row in docs], changed
+
+
+def stale_lists(conn, changed_ids):
+    """Items whose stored list mentions any of changed_ids"""
+    stale = set()
+    for chunk in chunks(changed_ids):
+        placeholders = ', '.join('?' * len(chunk))
+        stale.update(row[0] for row in conn.execute(
+            f'SELECT DISTINCT item_id FROM item_similar WHERE similar_id IN ({placeholders})', chunk))
+    return stale
+
+
+def weakest_scores(conn, matrix, k, min_score):
+    """Score a newcomer must reach to enter each row's list (min_score while a list has room)"""
+    import numpy as np
+    floor = np.full(len(matrix), min_score, dtype=np.float32)
+    position = {int(item_id): i for i, item_id in enumerate(matrix.ids)}
+    for item_id, weakest, count in conn.execute(
+            'SELECT item_id, MIN(score), COUNT(*) FROM item_similar GROUP BY item_id'):
+        if count >= k and item_id in position:
+            floor[position[item_id]] = weakest
+    return floor
+
+
+def refresh_similar(full=False, k=DEFAULT_K):
+    """Bring item_similar up to date; returns a summary dict"""
+    # NumPy is only needed by this job, not by the web app
+    import numpy as np
+    from utils import similarity
+
+    started = time.perf_counter()
+    conn = get_db_connection()
+    try:
+        state = conn.execute('SELECT version FROM item_similar_state WHERE id = 1').fetchone()
+        last_version = None if full or state is None else state[0]
+        head, docs, changed = read_snapshot(conn, last_version)
+        if last_version is not None and not changed:
+            return {'mode': 'incremental', 'items': len(docs), 'lists': 0, 'seconds': 0.0}
+
+        matrix = similarity.build_matrix(docs)
+        position = {int(item_id): i for i, item_id in enumerate(matrix.ids)}
+        targets = None
+        if last_version is not None:
+            changed_positions = [position[i] for i in changed if i in position]
+            column_best = np.zeros(len(matrix), dtype=np.float32)
+            changed_lists = dict(similarity.nearest(matrix, changed_positions, k, column_best=column_best))
+            floor = weakest_scores(conn, matrix, k, similarity.MIN_SCORE)
+            targets = set(changed_positions)
+            targets.update(position[i] for i in stale_lists(conn, changed) if i in position)
+            targets.update(int(p) for p in np.nonzero(column_best >= floor)[0])
+            if len(targets) > FULL_REBUILD_SHARE * len(matrix):
+                targets = None
+
+        if targets is None:
+            mode, lists = 'full', similarity.nearest(matrix, range(len(matrix)), k)
+        else:
+            mode = 'incremental'
+            rest = sorted(targets - changed_lists.keys())
+            lists = list(changed_lists.items()) + list(similarity.nearest(matrix, rest, k))
+
+        rows = [(int(matrix.ids[p]), rank, int(matrix.ids[n]), round(score, 5))
+                for p, neighbours in lists for rank, (n, score) in enumerate(neighbours, start=1)]
+
+        conn.execute('BEGIN IMMEDIATE')
+        if mode == 'full':
+            conn.execute('DELETE FROM item_similar')
+        else:
+            # Rewritten lists, plus lists of changed items that are no longer available
+            cleared = {int(matrix.ids[p]) for p in targets} | {i for i in changed if i not in position}
+            for chunk in chunks(cleared):
+                conn.execute(f"DELETE FROM item_similar WHERE item_id IN ({', '.join('?' * len(chunk))})", chunk)
+        conn.executemany('INSERT INTO item_similar (item_id, rank, similar_id, score) VALUES (?, ?, ?, ?)', rows)
+        conn.execute('''
+            INSERT INTO item_similar_state (id, version, updated_at) VALUES (1, ?, CURRENT_TIMESTAMP)
+            ON CONFLICT (id) DO UPDATE SET version = excluded.version, updated_at = excluded.updated_at
+        ''', (head,))
+        conn.commit()
+        return {'mode': mode, 'items': len(matrix),
+                'lists': len(matrix) if mode == 'full' else len(targets),
+                'seconds': round(time.perf_counter() - started, 2)}
+    finally:
+        conn.close()
+
+
+@roomie_cli.command('similar')
+@click.option('--full', is_flag=True, help='Recompute every list instead of only what changed.')
+@click.option('--k', 'k', default=DEFAULT_K, show_default=True, help='Neighbours stored per item.')
+@click.option('--every', type=float, default=0, help='Keep running, refreshing every N seconds.')
+def similar_command(full, k, every):
+    """Precompute the "similar items" lists shown on item pages."""
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        raise click.ClickException('This command needs NumPy (pip install numpy)')
+    while True:
+        summary = refresh_similar(full=full, k=k)
+        click.echo(f"{summary['mode']}: {summary['lists']} list(s) over {summary['items']} item(s) "
+                   f"in {summary['seconds']}s")
+        if not every:
+            break
+        full = False
+        time.sleep(every)
@@ -0,0 +1,28 @@
+"""Refresh the analytics replica: `flask roomie snapshot`.
+
+See database/analytics_replica.py. Run it from cron, or keep it going with
+--every; the analytics API reports the age of the snapshot it served.
+"""
+import time
+
+import click
+
+from commands.cli import roomie_cli
+from database import analytics_replica, maintenance
+
+
+@roomie_cli.command('snapshot')
+@click.option('--pages', default=maintenance.PAGES_PER_STEP, show_default=True,
+              help='Pages copied per backup step (-1 copies everything in one step).')
+@click.option('--pause', default=maintenance.STEP_PAUSE, show_default=True,
+              help='Seconds to pause between steps so writers get the lock.')
+@click.option('--every', type=float, default=0, help='Keep running, taking a snapshot every N seconds.')
+def snapshot_command(pages, pause, every):
+    """Copy the live database to the read-only analytics replica."""
+    while True:
+        summary = analytics_replica.take_snapshot(pages=pages, pause=pause)
+        click.echo(f"{summary['path']}: {summary['pages']} pages in {summary['steps']} step(s), "
+                   f"{summary['restarts']} restart(s), {summary['mode']}, {summary['seconds']}s")
+        if not every:
+            break
+        time.sleep(every)
@@ -0,0 +1,153 @@
+from flask import Blueprint, request
+from models.item_model import Item
+from models.feedback_model import Feedback
+from utils.helpers import json_response, encode_cursor, decode_cursor, positive_int_arg
+from utils import facet_index, feedback_stats
+from utils.query_inspector import query_budget
+import os
+
+api_bp = Blueprint('api_bp', __name__)
+
+# Fields a client may ask for with ?fields=a,b,c
+LIST_FIELDS = ('id', 'user_id', 'title', 'category', 'price', 'condition', 'image', 'address',
+               'latitude', 'longitude', 'description', 'hostel', 'block', 'status',
+               'created_at', 'updated_at', 'seller_name', 'seller_rating', 'seller_rating_count')
+DETAIL_FIELDS = LIST_FIELDS + ('seller_email', 'seller_phone', 'seller_hostel', 'seller_block', 'seller_room')
+
+# Reviewer emails are never exposed
+FEEDBACK_FIELDS = ('id', 'user_id', 'name', 'rating', 'comment', 'item_id', 'item_title', 'seller_id',
+                   'seller_name', 'created_at')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def parse_fields(allowed):
+    """Return the requested projection, or None if ?fields= names an unknown field"""
+    raw = request.args.get('fields', '').strip()
+    if not raw:
+        return allowed
+    fields = tuple(f.strip() for f in raw.split(',') if f.strip())
+    if not fields or any(f not in allowed for f in fields):
+        return None
+    return fields
+
+
+def serialize_item(row, fields):
+    item = dict(row)
+    # Templates only ever use the filename under static/uploads/
+    img = item.get('image')
+    if img:
+        item['image'] = os.path.basename(str(img).replace('\\', '/'))
+    return {f: item.get(f) for f in fields}
+
+
+def parse_price(name):
+    value = request.args.get(name, '').strip()
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+@api_bp.route('/items')
+@query_budget(1)
+def list_items():
+    """Paginated listing of available items (same filters as /marketplace)"""
+    fields = parse_fields(LIST_FIELDS)
+    if fields is None:
+        return json_response({'error': 'invalid_fields', 'allowed': list(LIST_FIELDS)}, 400)
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    after = None
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except Exception:
+            return json_response({'error': 'invalid_cursor'}, 400)
+
+    rows = Item.get_items_page(category=request.args.get('category', '').strip(),
+                               condition=request.args.get('condition', '').strip(),
+                               hostel=request.args.get('hostel', '').strip(),
+                               block=request.args.get('block', '').strip(),
+                               min_price=parse_price('min_price'),
+                               max_price=parse_price('max_price'),
+                               after=after, limit=limit)
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return json_response({
+        'items': [serialize_item(r, fields) for r in rows],
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None
+    })
+
+
+@api_bp.route('/feedbacks')
+@query_budget(3)
+def list_feedbacks():
+    """Paginated feedback, newest first, filtered by ?seller_id=&item_id=&rating=, with summary stats"""
+    seller_id = positive_int_arg('seller_id')
+    item_id = positive_int_arg('item_id')
+    rating = positive_int_arg('rating', maximum=5)
+
+    try:
+        limit = int(request.args.get('limit', DEFAULT_PAGE_SIZE))
+    except ValueError:
+        limit = DEFAULT_PAGE_SIZE
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+
+    after = None
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except Exception:
+            return json_response({'error': 'invalid_cursor'}, 400)
+
+    rows = Feedback.get_feedbacks_page(seller_id, item_id, rating, after=after, limit=limit)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    return json_response({
+        'feedbacks': [{f: row[f] for f in FEEDBACK_FIELDS} for row in rows],
+        'summary': feedback_stats.summary(seller_id, item_id, rating),
+        'next_cursor': encode_cursor(rows[-1]) if has_more else None
+    })
+
+
+@api_bp.route('/facets')
+# One change-log read per call; a process's first call also loads the index
+@query_budget(2)
+def facets():
+    """Facet counts and price histogram for a filter set (same filters as /items)"""
+    try:
+        top = int(request.args.get('top', 0))
+    except ValueError:
+        top = 0
+    counts = facet_index.facet_counts(category=request.args.get('category', '').strip(),
+                                      condition=request.args.get('condition', '').strip(),
+                                      hostel=request.args.get('hostel', '').strip(),
+                                      block=request.args.get('block', '').strip(),
+                                      min_price=parse_price('min_price'),
+                                      max_price=parse_price('max_price'),
+                                      top=max(top, 0) or None)
+    return json_response(counts)
+
+
+@api_bp.route('/items/<int:item_id>')
+@query_budget(1)
+def get_item(item_id):
+    """Single item with seller details"""
+    fields = parse_fields(DETAIL_FIELDS)
+    if fields is None:
+        return json_response({'error': 'invalid_fields', 'allowed': list(DETAIL_FIELDS)}, 400)
+
+    item = Item.get_item_by_id(item_id)
+    if not item:
+        return json_response({'error': 'not_found'}, 404)
+    return json_response({'item': serialize_item(item, fields)})
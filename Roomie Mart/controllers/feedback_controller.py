@@ -1,6 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session
 from models.feedback_model import Feedback
 from models.order_model import Order
+from utils.authentication import login_required
+from utils.helpers import encode_cursor, decode_cursor, positive_int_arg
+from utils.query_inspector import query_budget
+from utils import feedback_stats
 
 feedback_bp = Blueprint('feedback_bp', __name__)
 
@@ -82,3 +86,33 @@ def feedback_for_order(order_id):
         return redirect(url_for('item_bp.item_detail', item_id=item_id))
 
     return render_template('feedback_order.html', item_title=item_title, seller_name=seller_name)
+
+
+FEEDBACK_PAGE_SIZE = 25
+
+
+@feedback_bp.route('/feedback/browse')
+@login_required
+# page, summary top-up (MAX(id) + new rows), navbar request badge
+@query_budget(4)
+def browse_feedback():
+    # Moderation view: newest feedback first, filterable, one page at a time
+    seller_id = positive_int_arg('seller_id')
+    item_id = positive_int_arg('item_id')
+    rating = positive_int_arg('rating', maximum=5)
+    after = None
+    cursor = request.args.get('cursor', '').strip()
+    if cursor:
+        try:
+            after = decode_cursor(cursor)
+        except Exception:
+            flash('That page link is no longer valid', 'error')
+            return redirect(url_for('feedback_bp.browse_feedback', seller_id=seller_id, item_id=item_id, rating=rating))
+
+    rows = Feedback.get_feedbacks_page(seller_id, item_id, rating, after=after, limit=FEEDBACK_PAGE_SIZE)
+    has_more = len(rows) > FEEDBACK_PAGE_SIZE
+    rows = rows[:FEEDBACK_PAGE_SIZE]
+    return render_template('feedback_browse.html', feedbacks=rows,
+                           summary=feedback_stats.summary(seller_id, item_id, rating),
+                           seller_id=seller_id, item_id=item_id, rating=rating,
+                           next_cursor=encode_cursor(rows[-1]) if has_more else None)
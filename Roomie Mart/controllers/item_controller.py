@@ -1,14 +1,13 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, session, abort
 from models.item_model import Item
 from utils.authentication import login_required
+from utils.query_inspector import query_budget
+from utils import facet_index
 from models.order_model import Order
 import os
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from flask import current_app
-import urllib.parse
-import urllib.request
-import json
 
 item_bp = Blueprint('item_bp', __name__)
 
@@ -18,9 +17,9 @@ def save_image(file):
         filename = secure_filename(file.filename)
         timestamp = datetime.now().strftime('%Y%m%d%H%M%S')
         new_filename = f"{timestamp}_{filename}"
-        file_path = os.path.join('static/uploads', new_filename)
-        file.save(os.path.join(os.getcwd(), file_path))
-        return file_path
+        file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], new_filename))
+        # Stored as static/uploads/<name>; templates only use the basename
+        return os.path.join('static/uploads', new_filename)
     return None
 
 
@@ -54,7 +53,28 @@ def process_items(rows):
         processed.append(item)
     return processed
 
+# Hostel/block values listed under their filter inputs
+FACET_TOP_VALUES = 8
+SIMILAR_ITEMS_SHOWN = 4
+
+DEFAULT_NEAR_RADIUS_KM = 5.0
+MAX_NEAR_RADIUS_KM = 50.0
+
+
+def parse_near(value):
+    """'lat,lon' -> (lat, lon) floats, or None if missing/invalid"""
+    try:
+        lat, lon = (float(part) for part in value.split(','))
+    except ValueError:
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return None
+    return lat, lon
+
+
 @item_bp.route('/marketplace')
+# near= runs up to three statements (see Item.get_items_near)
+@query_budget(5)
 def marketplace():
     # Get filter parameters from query string
     category = request.args.get('category', '').strip()
@@ -75,18 +95,45 @@ def marketplace():
     except ValueError:
         max_price = None
     
+    # "Near me": ?near=lat,lon&radius=km ranks by distance instead of date
+    near = request.args.get('near', '').strip()
+    near_point = parse_near(near) if near else None
+    try:
+        radius = float(request.args.get('radius', '') or DEFAULT_NEAR_RADIUS_KM)
+    except ValueError:
+        radius = DEFAULT_NEAR_RADIUS_KM
+    radius = max(0.1, min(radius, MAX_NEAR_RADIUS_KM))
+    
     # Get filtered items
-    items = Item.get_filtered_items(category=category, condition=condition, 
-                                     hostel=hostel, block=block, 
-                                     min_price=min_price, max_price=max_price)
+    if near_point:
+        items = Item.get_items_near(near_point[0], near_point[1], radius,
+                                    category=category, condition=condition,
+                                    hostel=hostel, block=block,
+                                    min_price=min_price, max_price=max_price)
+    else:
+        items = Item.get_filtered_items(category=category, condition=condition, 
+                                         hostel=hostel, block=block, 
+                                         min_price=min_price, max_price=max_price)
     items = process_items(items)
     
+    # Sidebar counts for the same filters (the index knows nothing about distance)
+    facets = None
+    if not near_point:
+        facets = facet_index.facet_counts(category=category, condition=condition,
+                                          hostel=hostel, block=block,
+                                          min_price=min_price, max_price=max_price,
+                                          top=FACET_TOP_VALUES)
+    
     return render_template('marketplace.html', items=items, 
                            category=category, condition=condition, 
                            hostel=hostel, block=block, 
-                           min_price=min_price, max_price=max_price)
+                           min_price=min_price, max_price=max_price,
+                           near=near if near_point else '', radius=radius,
+                           facets=facets)
 
 @item_bp.route('/item/<int:item_id>')
+# item, viewer's order, similar items, navbar request badge
+@query_budget(4)
 def item_detail(item_id):
     item = Item.get_item_by_id(item_id)
     if not item:
@@ -115,7 +162,9 @@ def item_detail(item_id):
         'phone': item.get('seller_phone') or item.get('seller_phone', ''),
         'hostel': item.get('seller_hostel') or item.get('hostel') or '',
         'block': item.get('seller_block') or item.get('block') or '',
-        'room': item.get('seller_room') or item.get('room') or ''
+        'room': item.get('seller_room') or item.get('room') or '',
+        'rating': item.get('seller_rating'),
+        'rating_count': item.get('seller_rating_count') or 0
     }
 
     # If the current user is related to this item, fetch any order (bill) for quick access
@@ -127,7 +176,11 @@ def item_detail(item_id):
     except Exception:
         order = None
 
-    return render_template('product_detail.html', item=item, seller=seller, order=order)
+    # Precomputed by `flask roomie similar`; empty until that has run
+    similar_items = process_items(Item.get_similar_items(item_id, limit=SIMILAR_ITEMS_SHOWN))
+
+    return render_template('product_detail.html', item=item, seller=seller, order=order,
+                           similar_items=similar_items)
 
 @item_bp.route('/add_item', methods=['GET', 'POST'])
 @login_required
@@ -312,6 +365,7 @@ def mark_as_sold(item_id):
     return redirect(url_for('item_bp.my_items'))
 
 @item_bp.route('/search', methods=['GET'])
+@query_budget(2)
 def search():
     query = request.args.get('query', '')
     category = request.args.get('category', '')
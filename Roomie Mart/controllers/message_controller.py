@@ -3,11 +3,16 @@ from models.message_model import Message
 from models.item_model import Item
 from models.user_model import User
 from utils.authentication import login_required
+from utils.query_inspector import query_budget
 
 message_bp = Blueprint('message_bp', __name__)
 
+ARCHIVED_PAGE_SIZE = 100
+CONVERSATION_PAGE_SIZE = 50
+
 @message_bp.route('/messages')
 @login_required
+@query_budget(2)
 def messages():
     """Display all messages for the current user"""
     user_id = session.get('user_id')
@@ -47,11 +52,22 @@ def messages():
     
     return render_template('messages.html', conversations=conversation_list)
 
+@message_bp.route('/archived')
+@login_required
+@query_budget(2)
+def archived_conversations():
+    """Conversations whose older messages were moved to the archive"""
+    user_id = session.get('user_id')
+    conversations = Message.get_archived_conversations(user_id)
+    return render_template('archived_conversations.html', conversations=conversations)
+
 @message_bp.route('/conversation/<int:item_id>/<int:other_user_id>')
 @login_required
+@query_budget(6)
 def conversation(item_id, other_user_id):
-    """Display conversation between current user and another user about a specific item"""
+    """Display the latest messages of a conversation about an item (?before=<message id> for older ones)"""
     user_id = session.get('user_id')
+    before = request.args.get('before', type=int)
     
     # Get item and other user details
     item = Item.get_item_by_id(item_id)
@@ -61,19 +77,98 @@ def conversation(item_id, other_user_id):
         flash('Conversation not found', 'danger')
         return redirect(url_for('message_bp.messages'))
     
-    # Get messages in this conversation
-    messages = Message.get_conversation(user_id, other_user_id, item_id)
+    # Latest page of messages; one extra row tells whether older ones exist
+    messages = Message.get_conversation(user_id, other_user_id, item_id, before, CONVERSATION_PAGE_SIZE + 1)
+    older = len(messages) > CONVERSATION_PAGE_SIZE
+    messages = messages[1:] if older else messages
     
-    # Mark all received messages as read
-    for msg in messages:
-        if msg['receiver_id'] == user_id and msg['is_read'] == 0:
-            Message.mark_as_read(msg['id'])
+    # Mark all received messages as read (one UPDATE, only if something is unread).
+    # Unread messages are the newest received ones, so a page without any
+    # received message is the only case where older unread ones can hide.
+    received = [msg for msg in messages if msg['receiver_id'] == user_id]
+    if any(msg['is_read'] == 0 for msg in received) or (older and not received):
+        Message.mark_conversation_read(user_id, other_user_id, item_id)
+    
+    # Older history lives in the archive file; only link to it here
+    archived = Message.get_archived_summary(user_id, other_user_id, item_id)
     
     return render_template('conversation.html', 
                           messages=messages, 
                           item=item, 
                           other_user=other_user,
-                          user_id=user_id)
+                          user_id=user_id,
+                          archived=archived,
+                          older_before=messages[0]['id'] if older else None,
+                          # An older page isn't the end of the conversation: no updates poll there
+                          last_id=None if before else (messages[-1]['id'] if messages else 0))
+
+@message_bp.route('/conversation/<int:item_id>/<int:other_user_id>/older')
+@login_required
+@query_budget(1)
+def conversation_older(item_id, other_user_id):
+    """JSON page of messages older than ?before=<message id>, oldest first"""
+    user_id = session.get('user_id')
+    before = request.args.get('before', type=int)
+    
+    messages = Message.get_conversation(user_id, other_user_id, item_id, before, CONVERSATION_PAGE_SIZE + 1)
+    older = len(messages) > CONVERSATION_PAGE_SIZE
+    messages = [dict(msg) for msg in (messages[1:] if older else messages)]
+    
+    return jsonify({
+        'messages': messages,
+        'older_before': messages[0]['id'] if older else None
+    })
+
+def mark_received_read(user_id, messages):
+    """Mark the unread messages in `messages` (dicts) sent to user_id as read, in the DB and in place"""
+    unread = [msg for msg in messages if msg['receiver_id'] == user_id and not msg['is_read']]
+    if unread:
+        Message.mark_messages_read(user_id, [msg['id'] for msg in unread])
+        for msg in unread:
+            msg['is_read'] = 1
+
+@message_bp.route('/conversation/<int:item_id>/<int:other_user_id>/updates')
+@login_required
+@query_budget(2)
+def conversation_updates(item_id, other_user_id):
+    """JSON of messages newer than ?after=<message id> (asgi.py serves this natively, with long polling)"""
+    user_id = session.get('user_id')
+    after = request.args.get('after', 0, type=int)
+    
+    messages = [dict(msg) for msg in Message.get_conversation_after(user_id, other_user_id, item_id, after)]
+    # The open conversation shows them right away, so they count as read
+    mark_received_read(user_id, messages)
+    
+    return jsonify({
+        'messages': messages,
+        'last_id': messages[-1]['id'] if messages else after
+    })
+
+@message_bp.route('/conversation/<int:item_id>/<int:other_user_id>/archived')
+@login_required
+@query_budget(5)
+def archived_conversation(item_id, other_user_id):
+    """Archived messages of a conversation, newest page first (?before=<message id> for older)"""
+    user_id = session.get('user_id')
+    before = request.args.get('before', type=int)
+    
+    item = Item.get_item_by_id(item_id)
+    other_user = User.get_user_by_id(other_user_id)
+    if not other_user:
+        flash('Conversation not found', 'danger')
+        return redirect(url_for('message_bp.archived_conversations'))
+    
+    messages = Message.get_archived_messages(user_id, other_user_id, item_id, before, ARCHIVED_PAGE_SIZE + 1)
+    older = len(messages) > ARCHIVED_PAGE_SIZE
+    messages = messages[1:] if older else messages
+    
+    return render_template('conversation.html',
+                          messages=messages,
+                          item=item or {'id': item_id, 'title': 'Deleted item', 'image': None, 'deleted': True},
+                          other_user=other_user,
+                          user_id=user_id,
+                          archived_view=True,
+                          older_before=messages[0]['id'] if older else None)
 
 @message_bp.route('/send_message', methods=['POST'])
 @login_required
@@ -104,6 +199,7 @@ def send_message():
 
 @message_bp.route('/unread_count')
 @login_required
+@query_budget(1)
 def unread_count():
     """Get count of unread messages for the current user (for navbar badge)"""
     user_id = session.get('user_id')
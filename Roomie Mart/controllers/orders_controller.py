@@ -1,8 +1,15 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, make_response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, session, send_file, make_response, Response, stream_with_context
 from utils.authentication import login_required
+from utils.query_inspector import query_budget
 from models.order_model import Order
 from models.item_model import Item
 from database.db_connection import get_db_connection
+from utils import bill_cache, jobs
+from utils.helpers import pending_request_count
+from markupsafe import Markup
+from datetime import datetime, timedelta
+import csv
+import hashlib
 import io
 
 orders_bp = Blueprint('orders_bp', __name__)
@@ -10,6 +17,7 @@ orders_bp = Blueprint('orders_bp', __name__)
 
 @orders_bp.route('/orders/buy/<int:item_id>', methods=['POST'])
 @login_required
+@query_budget(3)
 def create_order(item_id):
     # Legacy direct-buy endpoint — create an initial request and send buyer to payment
     buyer_id = session.get('user_id')
@@ -37,8 +45,8 @@ def create_order(item_id):
     req_id = RequestModel.create_request(item_id, buyer_id, seller_id, message=None, status='pending')
     # Notify seller by message
     try:
-        from models.message_model import Message
-        Message.create_message(buyer_id, seller_id, item_id, 'Buyer initiated purchase — pending payment.')
+        jobs.defer('messages.notify', sender_id=buyer_id, receiver_id=seller_id, item_id=item_id,
+                   content='Buyer initiated purchase — pending payment.')
     except Exception as e:
         print(f"[orders_controller] notify seller failed: {e}")
 
@@ -81,8 +89,8 @@ def pay_request(request_id):
         # Simulate payment success: mark request as paid and notify seller
         RequestModel.update_request_status(request_id, 'paid')
         try:
-            from models.message_model import Message
-            Message.create_message(req['requester_id'], req['owner_id'], req['item_id'], f'Buyer has completed payment for request #{request_id}.')
+            jobs.defer('messages.notify', sender_id=req['requester_id'], receiver_id=req['owner_id'], item_id=req['item_id'],
+                       content=f'Buyer has completed payment for request #{request_id}.')
         except Exception as e:
             print(f"[orders_controller] notify seller after payment failed: {e}")
 
@@ -94,6 +102,7 @@ def pay_request(request_id):
 
 @orders_bp.route('/orders/my_orders')
 @login_required
+@query_budget(2)
 def my_orders():
     buyer_id = session.get('user_id')
     rows = Order.get_orders_for_buyer(buyer_id)
@@ -102,45 +111,153 @@ def my_orders():
 
 @orders_bp.route('/orders/sales_history')
 @login_required
+@query_budget(2)
 def sales_history():
     seller_id = session.get('user_id')
     rows = Order.get_orders_for_seller(seller_id)
     return render_template('sales_history.html', orders=rows)
 
 
+CSV_COLUMNS = ('order_id', 'created_at', 'item_id', 'item_title', 'price', 'quantity', 'total',
+               'status', 'transaction_ref')
+
+
+def parse_date_range():
+    """Read ?from=YYYY-MM-DD&to=YYYY-MM-DD (both inclusive) into created_at bounds"""
+    start = end = None
+    try:
+        if request.args.get('from'):
+            start = datetime.strptime(request.args['from'], '%Y-%m-%d').strftime('%Y-%m-%d %H:%M:%S')
+        if request.args.get('to'):
+            end_day = datetime.strptime(request.args['to'], '%Y-%m-%d') + timedelta(days=1)
+            end = end_day.strftime('%Y-%m-%d %H:%M:%S')
+    except ValueError:
+        return None
+    return start, end
+
+
+# Spreadsheets run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+
+def csv_cell(value):
+    """Quote user-supplied text that a spreadsheet would treat as a formula"""
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return "'" + value
+    return value
+
+
+def csv_stream(rows, counterparty_label, flush_every=200):
+    """Encode order rows as CSV, yielding a chunk every `flush_every` rows"""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(CSV_COLUMNS + (f'{counterparty_label}_name', f'{counterparty_label}_email'))
+    for n, o in enumerate(rows, start=1):
+        writer.writerow([csv_cell(value) for value in (
+            o['id'], o['created_at'], o['item_id'], o['item_title'], o['price'], o['quantity'],
+            o['total'], o['status'], o['transaction_ref'], o['counterparty_name'], o['counterparty_email'])])
+        if n % flush_every == 0:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+    yield buf.getvalue()
+
+
+def csv_download(rows, counterparty_label, filename):
+    response = Response(stream_with_context(csv_stream(rows, counterparty_label)), mimetype='text/csv')
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+
+@orders_bp.route('/orders/sales_history.csv')
+@login_required
+def sales_history_csv():
+    date_range = parse_date_range()
+    if date_range is None:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('orders_bp.sales_history'))
+    rows = Order.iter_orders_for_seller(session.get('user_id'), *date_range)
+    return csv_download(rows, 'buyer', 'sales_history.csv')
+
+
+@orders_bp.route('/orders/my_orders.csv')
+@login_required
+def my_orders_csv():
+    date_range = parse_date_range()
+    if date_range is None:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('orders_bp.my_orders'))
+    rows = Order.iter_orders_for_buyer(session.get('user_id'), *date_range)
+    return csv_download(rows, 'seller', 'my_orders.csv')
+
+
+@orders_bp.route('/orders/sales_history/bills.zip')
+@login_required
+def sales_bills_zip():
+    """Stream every bill in the seller's (optionally date-filtered) history as one ZIP"""
+    date_range = parse_date_range()
+    if date_range is None:
+        flash('Dates must be in YYYY-MM-DD format', 'error')
+        return redirect(url_for('orders_bp.sales_history'))
+    order_ids = (o['id'] for o in Order.iter_orders_for_seller(session.get('user_id'), *date_range))
+    response = Response(stream_with_context(bill_cache.stream_bills_zip(order_ids)), mimetype='application/zip')
+    response.headers['Content-Disposition'] = 'attachment; filename=sales_bills.zip'
+    return response
+
+
 @orders_bp.route('/orders/<int:order_id>')
 @login_required
+@query_budget(2)
 def view_order(order_id):
-    order = Order.get_order_by_id(order_id)
-    if not order:
+    bill = bill_cache.get_bill(order_id)
+    if not bill:
         flash('Order not found', 'error')
         return redirect(url_for('index'))
 
     # Ensure only involved parties can view
     uid = session.get('user_id')
-    if uid != order['buyer_id'] and uid != order['seller_id']:
+    if uid != bill['buyer_id'] and uid != bill['seller_id']:
         flash('You do not have permission to view this bill', 'error')
         return redirect(url_for('index'))
 
-    return render_template('order_bill.html', order=order)
+    if bill['status'] != 'completed' or '_flashes' in session:
+        return render_template('order_bill.html', order=bill, bill_html=Markup(bill['fragment']))
+
+    # The bill never changes but the navbar around it can, so the browser
+    # revalidates every time against a tag covering both and gets a 304
+    # without the page being rendered when its copy is still current.
+    page = f"{bill['etag']}:{uid}:{session.get('user_name')}:{pending_request_count()}"
+    etag = hashlib.sha256(page.encode('utf-8')).hexdigest()
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(render_template('order_bill.html', order=bill, bill_html=Markup(bill['fragment'])))
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 
 @orders_bp.route('/orders/<int:order_id>/download')
 @login_required
+@query_budget(1)
 def download_order(order_id):
-    order = Order.get_order_by_id(order_id)
-    if not order:
+    bill = bill_cache.get_bill(order_id)
+    if not bill:
         flash('Order not found', 'error')
         return redirect(url_for('index'))
 
     uid = session.get('user_id')
-    if uid != order['buyer_id'] and uid != order['seller_id']:
+    if uid != bill['buyer_id'] and uid != bill['seller_id']:
         flash('You do not have permission to download this bill', 'error')
         return redirect(url_for('index'))
 
-    rendered = render_template('order_bill.html', order=order, download=True)
     # Return as an attachment (HTML). User can save as PDF via browser.
-    response = make_response(rendered)
+    response = make_response(bill['document'])
     response.headers['Content-Type'] = 'text/html; charset=utf-8'
     response.headers['Content-Disposition'] = f'attachment; filename=order_{order_id}_bill.html'
+    if bill['status'] == 'completed':
+        # Completed bills are immutable: let the browser keep them and revalidate by ETag
+        response.set_etag(bill['etag'])
+        response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+        response.make_conditional(request)
     return response
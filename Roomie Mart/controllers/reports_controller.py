@@ -1,8 +1,12 @@
 from flask import Blueprint, render_template, jsonify
-from database.db_connection import get_db_connection
+from database import analytics_replica
+from utils.query_inspector import query_budget
 
 reports_bp = Blueprint('reports_bp', __name__)
 
+# Every aggregate here reads the analytics replica (database/analytics_replica.py)
+# when there is one and reports its age under 'snapshot'.
+
 
 @reports_bp.route('/analytics')
 def analytics_dashboard():
@@ -11,9 +15,10 @@ def analytics_dashboard():
 
 
 @reports_bp.route('/analytics/api/category_distribution')
+@query_budget(1)
 def api_category_distribution():
     """Return items count per category"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -36,14 +41,16 @@ def api_category_distribution():
         'backgroundColor': [
             '#FF6384', '#36A2EB', '#FFCE56', '#4BC0C0', '#9966FF',
             '#FF9F40', '#FF6384', '#C9CBCF', '#4BC0C0', '#FF6384'
-        ]
+        ],
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/sold_vs_available')
+@query_budget(1)
 def api_sold_vs_available():
     """Return count of sold vs available items"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -62,14 +69,16 @@ def api_sold_vs_available():
     return jsonify({
         'labels': ['Available', 'Sold'],
         'data': [available, sold],
-        'backgroundColor': ['#36A2EB', '#FF6384']
+        'backgroundColor': ['#36A2EB', '#FF6384'],
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/monthly_orders')
+@query_budget(1)
 def api_monthly_orders():
     """Return monthly order/sales count"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     # Get last 12 months of orders
@@ -93,14 +102,16 @@ def api_monthly_orders():
         'labels': months,
         'data': counts,
         'borderColor': '#36A2EB',
-        'backgroundColor': 'rgba(54, 162, 235, 0.1)'
+        'backgroundColor': 'rgba(54, 162, 235, 0.1)',
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/top_categories')
+@query_budget(1)
 def api_top_categories():
     """Return top 5 most sold categories"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -121,14 +132,16 @@ def api_top_categories():
     return jsonify({
         'labels': categories,
         'data': sales,
-        'backgroundColor': '#4BC0C0'
+        'backgroundColor': '#4BC0C0',
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/user_growth')
+@query_budget(1)
 def api_user_growth():
     """Return monthly user registration growth"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -149,14 +162,16 @@ def api_user_growth():
         'labels': months,
         'data': counts,
         'borderColor': '#9966FF',
-        'backgroundColor': 'rgba(153, 102, 255, 0.1)'
+        'backgroundColor': 'rgba(153, 102, 255, 0.1)',
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/revenue')
+@query_budget(1)
 def api_revenue():
     """Return monthly revenue analysis"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     cursor.execute('''
@@ -182,14 +197,16 @@ def api_revenue():
         'total_revenue': total_revenue,
         'highest_month': highest_month[0] if highest_month else 'N/A',
         'highest_amount': highest_month[1] if highest_month else 0,
-        'backgroundColor': '#FF9F40'
+        'backgroundColor': '#FF9F40',
+        'snapshot': snapshot
     })
 
 
 @reports_bp.route('/analytics/api/summary')
+@query_budget(6)
 def api_summary():
     """Return key summary statistics"""
-    conn = get_db_connection()
+    conn, snapshot = analytics_replica.connect()
     cursor = conn.cursor()
     
     # Total items
@@ -225,5 +242,6 @@ def api_summary():
         'sold_items': sold_items,
         'total_orders': total_orders,
         'total_users': total_users,
-        'total_revenue': total_revenue
+        'total_revenue': total_revenue,
+        'snapshot': snapshot
     })
@@ -4,6 +4,7 @@ from models.request_model import RequestModel
 from models.item_model import Item
 from models.order_model import Order
 from models.message_model import Message
+from utils import jobs
 
 requests_bp = Blueprint('requests_bp', __name__)
 
@@ -108,7 +109,8 @@ def accept_request(request_id):
 
     # Notify requester
     try:
-        Message.create_message(owner_id, req['requester_id'], req['item_id'], f'Your request was accepted. Order #{order_id} created.')
+        jobs.defer('messages.notify', sender_id=owner_id, receiver_id=req['requester_id'], item_id=req['item_id'],
+                   content=f'Your request was accepted. Order #{order_id} created.')
     except Exception as e:
         print(f"[requests_controller] notify requester failed: {e}")
 
@@ -131,7 +133,8 @@ def decline_request(request_id):
 
     RequestModel.update_request_status(request_id, 'declined')
     try:
-        Message.create_message(owner_id, req['requester_id'], req['item_id'], 'Your request was declined by the seller.')
+        jobs.defer('messages.notify', sender_id=owner_id, receiver_id=req['requester_id'], item_id=req['item_id'],
+                   content='Your request was declined by the seller.')
     except Exception as e:
         print(f"[requests_controller] notify decline failed: {e}")
 
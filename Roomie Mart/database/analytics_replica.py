@@ -0,0 +1,76 @@
+"""Read-only analytics replica refreshed with SQLite's online backup API.
+
+The analytics endpoints aggregate whole tables; run against the live file
+those scans hold read locks and evict hot pages other requests need. Instead
+`flask roomie snapshot` copies the live database into a scratch file with
+Connection.backup a few hundred pages per step, pausing between steps so
+writers get the lock back (database/maintenance.online_backup), and then
+swaps the finished copy in with an atomic rename. Readers see either the
+previous snapshot or the new one, never a half-written file.
+
+connect() opens the replica read-only when one exists (the live database
+otherwise) and says how fresh the data it serves is, so the API can report
+it. A replica older than MAX_AGE seconds (snapshots stopped running) is
+ignored in favour of the live database and reported as stale.
+"""
+import os
+import pathlib
+import time
+from datetime import datetime
+
+from database import db_connection, maintenance
+
+# None means "<main database name>_analytics.db" next to the main file
+REPLICA_PATH = os.environ.get('ROOMIE_ANALYTICS_PATH') or None
+# Seconds; None serves a replica of any age
+DEFAULT_MAX_AGE = 900
+MAX_AGE = DEFAULT_MAX_AGE
+_enabled = True
+
+
+def configure(path=None, enabled=True, max_age=DEFAULT_MAX_AGE):
+    """Replica file to use (None: derive it from DATABASE_PATH), whether analytics read it and its max age"""
+    global REPLICA_PATH, _enabled, MAX_AGE
+    REPLICA_PATH = path
+    _enabled = enabled
+    MAX_AGE = max_age
+
+
+def get_replica_path():
+    return REPLICA_PATH or os.path.splitext(db_connection.DATABASE_PATH)[0] + '_analytics.db'
+
+
+def freshness():
+    """{'source', 'taken_at', 'age_seconds', 'stale'} for what connect() would serve right now.
+
+    stale is True when a replica exists but is older than MAX_AGE, so the live
+    database is read instead; taken_at and age_seconds then describe that replica.
+    """
+    path = get_replica_path()
+    try:
+        taken = os.stat(path).st_mtime if _enabled else None
+    except OSError:
+        taken = None
+    if taken is None:
+        return {'source': 'live', 'taken_at': None, 'age_seconds': 0, 'stale': False}
+    age = max(0, round(time.time() - taken))
+    stale = MAX_AGE is not None and age > MAX_AGE
+    return {'source': 'live' if stale else 'replica',
+            'taken_at': datetime.fromtimestamp(taken).strftime('%Y-%m-%d %H:%M:%S'),
+            'age_seconds': age,
+            'stale': stale}
+
+
+def connect():
+    """(connection, freshness()) for analytics reads: the replica, or the live file if there is none (or it is stale)"""
+    snapshot = freshness()
+    if snapshot['source'] == 'replica':
+        uri = pathlib.Path(os.path.abspath(get_replica_path())).as_uri() + '?mode=ro'
+        return db_connection.open_connection(uri, uri=True), snapshot
+    return db_connection.get_db_connection(), snapshot
+
+
+def take_snapshot(pages=maintenance.PAGES_PER_STEP, pause=maintenance.STEP_PAUSE,
+                  max_restarts=maintenance.MAX_RESTARTS):
+    """Copy the live database to the replica; returns a summary dict"""
+    return maintenance.backup_to(get_replica_path(), pages=pages, pause=pause, max_restarts=max_restarts)
@@ -2,14 +2,59 @@ import sqlite3
 import os
 from sqlite3 import Error
 
-DATABASE_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'hosteltrade.db')
+# ROOMIE_DATABASE_PATH points the app at another file (benchmarks, scratch copies)
+DATABASE_PATH = os.environ.get('ROOMIE_DATABASE_PATH') or os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'database', 'hosteltrade.db')
+
+# Cold storage for old messages, ATTACHed on demand (see init_message_archive);
+# None means "<main database name>_archive.db" next to the main file
+ARCHIVE_PATH = os.environ.get('ROOMIE_ARCHIVE_PATH') or None
+
+# Callables run with every new connection (e.g. to install trace callbacks)
+_connection_hooks = []
+
+# Connection class used by get_db_connection (see database/instrumentation.py)
+_connection_factory = sqlite3.Connection
+
+def set_database_path(path):
+    """Point get_db_connection at another SQLite file (see create_app)"""
+    global DATABASE_PATH
+    DATABASE_PATH = path
+
+def set_archive_path(path):
+    """Use another file for the message archive (None: derive it from DATABASE_PATH)"""
+    global ARCHIVE_PATH
+    ARCHIVE_PATH = path
+
+def get_archive_path():
+    """File holding archived messages"""
+    return ARCHIVE_PATH or os.path.splitext(DATABASE_PATH)[0] + '_archive.db'
+
+def attach_archive(conn):
+    """ATTACH the message archive to `conn` as schema `archive` (outside any transaction)"""
+    conn.execute('ATTACH DATABASE ? AS archive', (get_archive_path(),))
+    return conn
+
+def set_connection_factory(factory):
+    """Use a sqlite3.Connection subclass for all new connections"""
+    global _connection_factory
+    _connection_factory = factory
+
+def add_connection_hook(hook):
+    """Register hook(conn) to be called on every connection handed out"""
+    _connection_hooks.append(hook)
 
 def get_db_connection():
     """Create a database connection to the SQLite database"""
+    return open_connection(DATABASE_PATH)
+
+def open_connection(database, uri=False):
+    """Connection to another SQLite file set up like get_db_connection's (rows, hooks)"""
     conn = None
     try:
-        conn = sqlite3.connect(DATABASE_PATH)
+        conn = sqlite3.connect(database, uri=uri, factory=_connection_factory)
         conn.row_factory = sqlite3.Row
+        for hook in _connection_hooks:
+            hook(conn)
         return conn
     except Error as e:
         print(e)
@@ -21,6 +66,9 @@ def init_db():
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    # Only takes effect on a brand-new file; `flask roomie db vacuum --enable` converts old ones
+    cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+    
     # Create users table
     cursor.execute('''
     CREATE TABLE IF NOT EXISTS users (
@@ -167,5 +215,236 @@ def init_db():
     conn.commit()
     conn.close()
 
-# Initialize database when module is imported
-init_db()
\ No newline at end of file
+    # Per-seller rating aggregates, kept by Feedback.create_feedback (rebuild: flask roomie seller-stats)
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS seller_stats (
+        seller_id INTEGER PRIMARY KEY,
+        rating_count INTEGER NOT NULL DEFAULT 0,
+        rating_sum INTEGER NOT NULL DEFAULT 0,
+        rating_1 INTEGER NOT NULL DEFAULT 0,
+        rating_2 INTEGER NOT NULL DEFAULT 0,
+        rating_3 INTEGER NOT NULL DEFAULT 0,
+        rating_4 INTEGER NOT NULL DEFAULT 0,
+        rating_5 INTEGER NOT NULL DEFAULT 0,
+        last_feedback_id INTEGER,
+        last_feedback_at TIMESTAMP,
+        FOREIGN KEY (seller_id) REFERENCES users (id)
+    )
+    ''')
+    conn.commit()
+    conn.close()
+
+    # Indexes backing the listing and history queries
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_items_status_created ON items (status, created_at, id)')
+    # Per-party order history (sales history / purchases, incl. date-range CSV exports)
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_seller_created ON orders (seller_id, created_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_orders_buyer_created ON orders (buyer_id, created_at)')
+    # Feedback browsing: newest first overall, per seller, per item and per rating
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedbacks_created ON feedbacks (created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedbacks_seller_created ON feedbacks (seller_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedbacks_item_created ON feedbacks (item_id, created_at, id)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_feedbacks_rating_created ON feedbacks (rating, created_at, id)')
+    # Conversation pages and live updates: one direction of a thread, walked by id
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_messages_conversation ON messages (item_id, sender_id, receiver_id, id)')
+    conn.commit()
+    conn.close()
+
+    init_spatial_index()
+    init_item_change_log()
+    init_similar_items()
+    init_message_archive()
+    init_jobs()
+
+def init_spatial_index():
+    """R*Tree over available items' coordinates for "near me" search, kept in sync by triggers"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        existed = cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'items_rtree'").fetchone()
+        cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS items_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)
+        ''')
+    except Error as e:
+        print(f"[db_connection] R*Tree module unavailable, near-me search disabled: {e}")
+        conn.close()
+        return
+
+    indexed_row = '''
+        SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+        WHERE NEW.status = 'available' AND NEW.latitude IS NOT NULL AND NEW.longitude IS NOT NULL;
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS items_rtree_insert AFTER INSERT ON items
+    BEGIN
+        INSERT OR REPLACE INTO items_rtree {indexed_row}
+    END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS items_rtree_update
+    AFTER UPDATE OF latitude, longitude, status ON items
+    BEGIN
+        DELETE FROM items_rtree WHERE id = OLD.id;
+        INSERT INTO items_rtree {indexed_row}
+    END
+    ''')
+    cursor.execute('''
+    CREATE TRIGGER IF NOT EXISTS items_rtree_delete AFTER DELETE ON items
+    BEGIN
+        DELETE FROM items_rtree WHERE id = OLD.id;
+    END
+    ''')
+    if not existed:
+        # First run on an existing database: index what is already listed
+        cursor.execute('''
+        INSERT INTO items_rtree
+        SELECT id, latitude, latitude, longitude, longitude
+        FROM items
+        WHERE status = 'available' AND latitude IS NOT NULL AND longitude IS NOT NULL
+        ''')
+    conn.commit()
+    conn.close()
+
+def init_item_change_log():
+    """item_changes: one row per item holding a version bumped on every write.
+
+    Readers remember the highest version they have applied and fetch the rows
+    above it (utils/facet_index.py, commands/similar.py).
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_changes (
+        item_id INTEGER PRIMARY KEY,
+        version INTEGER NOT NULL
+    )
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_changes_version ON item_changes (version)')
+    bump = '''
+        INSERT OR REPLACE INTO item_changes (item_id, version)
+        VALUES ({ref}.id, (SELECT COALESCE(MAX(version), 0) + 1 FROM item_changes));
+    '''
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS item_changes_insert AFTER INSERT ON items
+    BEGIN {bump.format(ref='NEW')} END
+    ''')
+    # Dropped and recreated so a changed column list reaches existing databases
+    cursor.execute('DROP TRIGGER IF EXISTS item_changes_update')
+    cursor.execute(f'''
+    CREATE TRIGGER item_changes_update
+    AFTER UPDATE OF status, category, condition, hostel, block, price, title, description ON items
+    BEGIN {bump.format(ref='NEW')} END
+    ''')
+    cursor.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS item_changes_delete AFTER DELETE ON items
+    BEGIN {bump.format(ref='OLD')} END
+    ''')
+    conn.commit()
+    conn.close()
+
+def init_similar_items():
+    """Precomputed "similar items" lists, written by `flask roomie similar`"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_similar (
+        item_id INTEGER NOT NULL,
+        rank INTEGER NOT NULL,
+        similar_id INTEGER NOT NULL,
+        score REAL NOT NULL,
+        PRIMARY KEY (item_id, rank)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_item_similar_similar ON item_similar (similar_id)')
+    # item_changes version the lists were last brought up to
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS item_similar_state (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        version INTEGER NOT NULL,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    conn.commit()
+    conn.close()
+
+def init_message_archive():
+    """Archive file for old messages plus the hot-side index of what was moved there.
+
+    `flask roomie archive-messages` moves read messages of finished or stale
+    conversations into archive.messages; archived_conversations (in the main
+    file) tells the inbox and conversation pages that older history exists
+    without attaching the archive.
+    """
+    conn = attach_archive(get_db_connection())
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS archive.messages (
+        id INTEGER PRIMARY KEY,
+        sender_id INTEGER NOT NULL,
+        receiver_id INTEGER NOT NULL,
+        item_id INTEGER NOT NULL,
+        content TEXT NOT NULL,
+        is_read INTEGER DEFAULT 0,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    ''')
+    cursor.execute('''
+    CREATE INDEX IF NOT EXISTS archive.idx_archived_messages_conversation
+    ON messages (item_id, sender_id, receiver_id, id)
+    ''')
+    # One row per archived conversation; user_a < user_b
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS main.archived_conversations (
+        item_id INTEGER NOT NULL,
+        user_a INTEGER NOT NULL,
+        user_b INTEGER NOT NULL,
+        message_count INTEGER NOT NULL,
+        first_at TIMESTAMP,
+        last_at TIMESTAMP,
+        PRIMARY KEY (item_id, user_a, user_b)
+    ) WITHOUT ROWID
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS main.idx_archived_conversations_a ON archived_conversations (user_a, last_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS main.idx_archived_conversations_b ON archived_conversations (user_b, last_at)')
+    conn.commit()
+    conn.close()
+
+def init_jobs():
+    """Background job queue (utils/jobs.py). run_at/locked_until are unix seconds."""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        status TEXT NOT NULL DEFAULT 'queued',
+        priority INTEGER NOT NULL DEFAULT 0,
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        run_at REAL NOT NULL,
+        locked_by TEXT,
+        locked_until REAL,
+        last_error TEXT,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        started_at TIMESTAMP,
+        finished_at TIMESTAMP
+    )
+    ''')
+    # Claiming looks at due queued jobs and running jobs whose lease ran out
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_run_at ON jobs (status, run_at)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_jobs_status_locked ON jobs (status, locked_until)')
+    # Next due time of each periodic job; whoever moves it forward enqueues the run
+    cursor.execute('''
+    CREATE TABLE IF NOT EXISTS job_schedules (
+        name TEXT PRIMARY KEY,
+        next_run_at REAL NOT NULL,
+        last_run_at REAL
+    )
+    ''')
+    conn.commit()
+    conn.close()
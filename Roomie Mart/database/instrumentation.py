@@ -0,0 +1,169 @@
+"""Statement tracing and timing for connections from get_db_connection().
+
+install() switches get_db_connection() to InstrumentedConnection, whose
+cursors time execute() plus every fetch on the same statement (conn.execute()
+and conn.executemany() go through those cursors too), and puts one
+set_trace_callback on each connection. Anything that wants to observe SQL
+registers a listener here instead of touching connections itself:
+
+    add_statement_listener(fn)  # fn(sql, params, seconds, conn) once per statement
+    add_trace_listener(fn)      # fn(sql) for everything SQLite runs, incl. BEGIN/COMMIT
+
+A statement is reported when its cursor is exhausted, re-executed or closed,
+or when its connection is closed, so `seconds` covers the whole read.
+"""
+import re
+import sqlite3
+import weakref
+from time import perf_counter
+
+from database import db_connection
+
+_STRING_LITERAL = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_LITERAL = re.compile(r'\b\d+(?:\.\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_WHITESPACE = re.compile(r'\s+')
+
+_statement_listeners = []
+_trace_listeners = []
+_installed = False
+
+
+def normalize_sql(sql):
+    """Reduce a statement to its shape: literals become ?, IN lists collapse, whitespace folds"""
+    sql = _STRING_LITERAL.sub('?', sql)
+    sql = _NUMBER_LITERAL.sub('?', sql)
+    sql = _IN_LIST.sub('(?...)', sql)
+    return _WHITESPACE.sub(' ', sql).strip()
+
+
+def add_statement_listener(listener):
+    _statement_listeners.append(listener)
+
+
+def add_trace_listener(listener):
+    _trace_listeners.append(listener)
+
+
+def _notify(sql, params, seconds, conn):
+    for listener in _statement_listeners:
+        try:
+            listener(sql, params, seconds, conn)
+        except Exception as e:
+            print(f"[instrumentation] statement listener failed: {e}")
+
+
+def _on_trace(sql):
+    for listener in _trace_listeners:
+        try:
+            listener(sql)
+        except Exception as e:
+            print(f"[instrumentation] trace listener failed: {e}")
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    _pending = None
+
+    def _finish(self):
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            _notify(*pending)
+
+    def _timed_fetch(self, method, *args):
+        t0 = perf_counter()
+        try:
+            return method(self, *args)
+        finally:
+            if self._pending is not None:
+                self._pending[2] += perf_counter() - t0
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        t0 = perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._pending = [sql, parameters, perf_counter() - t0, self.connection]
+            # Writes and DDL are done once execute() returns
+            if self.description is None:
+                self._finish()
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        t0 = perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._pending = [sql, (), perf_counter() - t0, self.connection]
+            self._finish()
+
+    def fetchone(self):
+        row = self._timed_fetch(sqlite3.Cursor.fetchone)
+        if row is None:
+            self._finish()
+        return row
+
+    def fetchmany(self, size=None):
+        size = self.arraysize if size is None else size
+        rows = self._timed_fetch(sqlite3.Cursor.fetchmany, size)
+        if len(rows) < size:
+            self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed_fetch(sqlite3.Cursor.fetchall)
+        self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            return self._timed_fetch(sqlite3.Cursor.__next__)
+        except StopIteration:
+            self._finish()
+            raise
+
+    def close(self):
+        self._finish()
+        super().close()
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._cursors = weakref.WeakSet()
+        self.set_trace_callback(_on_trace)
+
+    def cursor(self, factory=InstrumentedCursor):
+        cur = super().cursor(factory)
+        self._cursors.add(cur)
+        return cur
+
+    # sqlite3.Connection.execute() builds its cursor in C without calling
+    # cursor(), so these shortcuts would otherwise go untimed
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+    def close(self):
+        for cur in list(self._cursors):
+            cur._finish()
+        super().close()
+
+    def database_files(self):
+        """[(schema, file)] open on this connection (main, plus anything ATTACHed), untraced"""
+        self.set_trace_callback(None)
+        try:
+            return [(row[1], row[2]) for row in sqlite3.Cursor(self).execute('PRAGMA database_list')]
+        finally:
+            self.set_trace_callback(_on_trace)
+
+
+def install():
+    """Route every new connection through InstrumentedConnection (idempotent)"""
+    global _installed
+    if not _installed:
+        db_connection.set_connection_factory(InstrumentedConnection)
+        _installed = True
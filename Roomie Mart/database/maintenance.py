@@ -0,0 +1,228 @@
+"""Online backup and storage upkeep for the SQLite files (`flask roomie db ...`).
+
+    online_backup()       copy a live database with the backup API, a few
+                          hundred pages per step so writers keep getting the lock
+    incremental_vacuum()  hand free pages back to the OS in small steps
+                          (needs auto_vacuum=INCREMENTAL, see enable_incremental_vacuum)
+    optimize()            refresh the planner statistics (ANALYZE, PRAGMA optimize)
+    checkpoint()          fold the WAL back into the database and truncate it
+    storage_report()      sizes, free pages and per-table usage
+
+Everything opens its own plain sqlite3 connection: this is upkeep, not app
+traffic, and stays out of the request metrics.
+"""
+import os
+import sqlite3
+import time
+
+from database import db_connection
+
+PAGES_PER_STEP = 256
+STEP_PAUSE = 0.005  # seconds between backup/vacuum steps
+MAX_RESTARTS = 5
+VACUUM_PAGES_PER_STEP = 1000
+ANALYSIS_LIMIT = 1000  # rows ANALYZE samples per index (0 = all)
+
+AUTO_VACUUM_MODES = {0: 'none', 1: 'full', 2: 'incremental'}
+
+
+class BackupRestarted(Exception):
+    """The source kept changing under an incremental backup"""
+
+
+def connect(path=None):
+    conn = sqlite3.connect(path or db_connection.DATABASE_PATH, timeout=30, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def online_backup(target_path, pages=PAGES_PER_STEP, pause=STEP_PAUSE, max_restarts=MAX_RESTARTS,
+                  source_path=None):
+    """Copy the database into target_path (overwritten) without holding its lock between steps.
+
+    SQLite restarts a backup whenever another connection writes to the
+    source; after max_restarts restarts the rest is copied in one step.
+    Returns {'mode', 'pages', 'steps', 'restarts', 'seconds'}.
+    """
+    started = time.perf_counter()
+    state = {'remaining': None, 'restarts': 0, 'steps': 0}
+
+    def progress(status, remaining, total):
+        # A step that copied pages but left no fewer to go means SQLite started over after a write
+        if status == sqlite3.SQLITE_OK and state['remaining'] is not None and remaining >= state['remaining']:
+            state['restarts'] += 1
+            if state['restarts'] > max_restarts:
+                raise BackupRestarted()
+        state['remaining'] = remaining
+        state['steps'] += 1
+        if pause and remaining:
+            time.sleep(pause)
+
+    source = sqlite3.connect(source_path or db_connection.DATABASE_PATH)
+    target = sqlite3.connect(target_path)
+    try:
+        try:
+            source.backup(target, pages=pages, progress=progress)
+            mode = 'incremental'
+        except BackupRestarted:
+            source.backup(target, pages=-1)
+            mode = 'single step'
+            print(f"[maintenance] source changed {state['restarts']} times mid-backup, finished in one step")
+        page_count = target.execute('PRAGMA page_count').fetchone()[0]
+    finally:
+        target.close()
+        source.close()
+    return {'mode': mode, 'pages': page_count, 'steps': state['steps'], 'restarts': state['restarts'],
+            'seconds': round(time.perf_counter() - started, 2)}
+
+
+def backup_to(target_path, verify=False, **options):
+    """online_backup() into a scratch file renamed to target_path once complete (and checked)"""
+    scratch = target_path + '.partial'
+    if os.path.exists(scratch):
+        os.remove(scratch)
+    summary = online_backup(scratch, **options)
+    conn = connect(scratch)
+    try:
+        # A rollback-journal copy opens anywhere, read-only included, without -wal/-shm files
+        conn.execute('PRAGMA journal_mode=DELETE')
+        if verify:
+            summary['check'] = conn.execute('PRAGMA quick_check').fetchone()[0]
+    finally:
+        conn.close()
+    if verify and summary['check'] != 'ok':
+        os.remove(scratch)
+        raise sqlite3.DatabaseError(f"backup failed quick_check: {summary['check']}")
+    try:
+        os.replace(scratch, target_path)
+    except PermissionError:
+        # Windows won't rename over a file readers have open: copy into it instead
+        online_backup(target_path, pages=-1, source_path=scratch)
+        os.remove(scratch)
+    summary['path'] = target_path
+    return summary
+
+
+def enable_incremental_vacuum():
+    """Switch auto_vacuum to INCREMENTAL; rebuilds the file with a full VACUUM (locks it meanwhile)"""
+    conn = connect()
+    try:
+        conn.execute('PRAGMA auto_vacuum = INCREMENTAL')
+        conn.execute('VACUUM')
+        return AUTO_VACUUM_MODES[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]
+    finally:
+        conn.close()
+
+
+def incremental_vacuum(step=VACUUM_PAGES_PER_STEP, pause=STEP_PAUSE, max_pages=None):
+    """Release free pages `step` at a time (each its own short write transaction).
+
+    Returns {'auto_vacuum', 'freed', 'free_pages'}; nothing is freed unless
+    auto_vacuum is INCREMENTAL.
+    """
+    conn = connect()
+    try:
+        mode = AUTO_VACUUM_MODES[conn.execute('PRAGMA auto_vacuum').fetchone()[0]]
+        before = free = conn.execute('PRAGMA freelist_count').fetchone()[0]
+        if mode == 'incremental':
+            while free and (max_pages is None or before - free < max_pages):
+                batch = step if max_pages is None else min(step, max_pages - (before - free))
+                conn.execute(f'PRAGMA incremental_vacuum({int(batch)})').fetchall()
+                remaining = conn.execute('PRAGMA freelist_count').fetchone()[0]
+                if remaining >= free:
+                    break
+                free = remaining
+                if free and pause:
+                    time.sleep(pause)
+        return {'auto_vacuum': mode, 'freed': before - free, 'free_pages': free}
+    finally:
+        conn.close()
+
+
+def optimize(analysis_limit=ANALYSIS_LIMIT):
+    """Refresh sqlite_stat1 (sampled to analysis_limit rows per index) and run PRAGMA optimize"""
+    started = time.perf_counter()
+    conn = connect()
+    try:
+        conn.execute(f'PRAGMA analysis_limit = {int(analysis_limit)}')
+        conn.execute('ANALYZE')
+        conn.execute('PRAGMA optimize')
+    finally:
+        conn.close()
+    return {'seconds': round(time.perf_counter() - started, 2)}
+
+
+def checkpoint(mode='TRUNCATE'):
+    """wal_checkpoint(mode): (busy, wal pages, pages checkpointed), or None when not in WAL mode"""
+    conn = connect()
+    try:
+        if conn.execute('PRAGMA journal_mode').fetchone()[0] != 'wal':
+            return None
+        return tuple(conn.execute(f'PRAGMA wal_checkpoint({mode})').fetchone())
+    finally:
+        conn.close()
+
+
+def file_size(path):
+    try:
+        return os.path.getsize(path)
+    except OSError:
+        return None
+
+
+def storage_report():
+    """File sizes, page usage and per-table statistics of the main database"""
+    from database import analytics_replica
+    path = db_connection.DATABASE_PATH
+    conn = connect()
+    try:
+        def pragma(name):
+            return conn.execute(f'PRAGMA {name}').fetchone()[0]
+
+        page_size, page_count, free = pragma('page_size'), pragma('page_count'), pragma('freelist_count')
+        report = {
+            'path': path,
+            'size': file_size(path),
+            'wal_size': file_size(path + '-wal'),
+            'journal_mode': pragma('journal_mode'),
+            'auto_vacuum': AUTO_VACUUM_MODES[pragma('auto_vacuum')],
+            'page_size': page_size,
+            'page_count': page_count,
+            'free_pages': free,
+            'fragmentation': round(100.0 * free / page_count, 1) if page_count else 0.0,
+            'analyzed': conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE name = 'sqlite_stat1'").fetchone() is not None,
+            'related': {name: file_size(other) for name, other in (
+                ('message archive', db_connection.get_archive_path()),
+                ('analytics replica', analytics_replica.get_replica_path()),
+            ) if file_size(other) is not None},
+        }
+        tables = [row[0] for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name NOT LIKE 'sqlite_%' ORDER BY name")]
+        usage = {}
+        try:
+            # dbstat is compiled into most builds; without it the report just has no byte counts
+            for row in conn.execute('''
+                SELECT name, COUNT(*) AS pages, SUM(pgsize) AS bytes, SUM(unused) AS unused
+                FROM dbstat GROUP BY name
+            '''):
+                usage[row['name']] = dict(row)
+        except sqlite3.OperationalError:
+            pass
+        indexes = {}
+        for row in conn.execute("SELECT name, tbl_name FROM sqlite_master WHERE type = 'index'"):
+            indexes.setdefault(row['tbl_name'], []).append(row['name'])
+        report['tables'] = []
+        for table in tables:
+            own = usage.get(table, {})
+            index_bytes = sum(usage.get(index, {}).get('bytes') or 0 for index in indexes.get(table, ()))
+            report['tables'].append({
+                'name': table,
+                'rows': conn.execute(f'SELECT COUNT(*) FROM "{table}"').fetchone()[0],
+                'bytes': own.get('bytes'),
+                'index_bytes': index_bytes if usage else None,
+                'unused': own.get('unused'),
+            })
+        return report
+    finally:
+        conn.close()
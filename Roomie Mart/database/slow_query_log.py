@@ -0,0 +1,151 @@
+"""Slow-query log for statements run through get_db_connection().
+
+Any statement slower than SLOW_QUERY_MS (default 100ms; None disables) is
+logged with its normalized SQL, redacted parameters, duration and the model
+or controller method that issued it. The first time a statement shape shows
+up slow, its EXPLAIN QUERY PLAN is captured too (against the files the
+statement actually ran on: the analytics replica, an ATTACHed archive), so
+full table scans are easy to spot. Entries go to a rotating file (SLOW_QUERY_LOG) and the most
+recent ones are kept in memory for the /_slow_queries debug page.
+"""
+import logging
+import os
+import pathlib
+import sqlite3
+import sys
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from logging.handlers import RotatingFileHandler
+
+from database import db_connection, instrumentation
+from database.instrumentation import normalize_sql
+
+APP_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_LOG_PATH = os.path.join(APP_ROOT, 'logs', 'slow_queries.log')
+DEFAULT_THRESHOLD_MS = 100
+RECENT_ENTRIES = 200
+MAX_PLANS = 1000
+
+logger = logging.getLogger('roomie.slow_queries')
+logger.propagate = False
+
+_threshold_ms = None
+_recent = deque(maxlen=RECENT_ENTRIES)
+_plans = OrderedDict()  # shape -> plan lines (bounded, oldest shapes dropped)
+_lock = threading.Lock()
+_listener_added = False
+
+
+def redact(params):
+    """Describe parameters by type and size only, never their values"""
+    if isinstance(params, dict):
+        return {k: _describe(v) for k, v in params.items()}
+    return [_describe(v) for v in params or ()]
+
+
+def _describe(value):
+    if value is None:
+        return 'NULL'
+    if isinstance(value, (str, bytes)):
+        return f'<{type(value).__name__}:{len(value)}>'
+    return f'<{type(value).__name__}>'
+
+
+def find_caller():
+    """First models/ or controllers/ frame on the stack, as 'path:Qualified.name:line'"""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        rel = os.path.relpath(filename, APP_ROOT)
+        if rel.startswith(('models' + os.sep, 'controllers' + os.sep)):
+            return f'{rel}:{frame.f_code.co_qualname}:{frame.f_lineno}'
+        frame = frame.f_back
+    return None
+
+
+def explain(sql, params, files=None):
+    """EXPLAIN QUERY PLAN on a separate, uninstrumented read-only connection.
+
+    `files` is [(schema, file)] as from InstrumentedConnection.database_files():
+    the main file is opened and the others ATTACHed under the same names, so
+    the plan matches the connection the statement ran on. Default: DATABASE_PATH.
+    """
+    files = files or [('main', db_connection.DATABASE_PATH)]
+    main = dict(files).get('main')
+    if not main:
+        return ['EXPLAIN skipped: in-memory database']
+    conn = sqlite3.connect(pathlib.Path(os.path.abspath(main)).as_uri() + '?mode=ro', uri=True)
+    try:
+        for schema, path in files:
+            if schema not in ('main', 'temp') and path:
+                conn.execute(f'ATTACH DATABASE ? AS "{schema}"', (path,))
+        rows = conn.execute('EXPLAIN QUERY PLAN ' + sql, params).fetchall()
+        return [row[-1] for row in rows]
+    except sqlite3.Error as e:
+        return [f'EXPLAIN failed: {e}']
+    finally:
+        conn.close()
+
+
+def _on_statement(sql, params, seconds, conn):
+    if _threshold_ms is None or seconds * 1000.0 < _threshold_ms:
+        return
+    shape = normalize_sql(sql)
+    entry = {
+        'time': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'duration_ms': round(seconds * 1000.0, 2),
+        'sql': shape,
+        'params': redact(params),
+        'caller': find_caller(),
+        'plan': None,
+    }
+
+    with _lock:
+        plan = _plans.get(shape)
+        new_shape = plan is None
+    if new_shape and shape.upper().startswith(('SELECT', 'WITH')):
+        plan = explain(sql, params, conn.database_files())
+        with _lock:
+            _plans[shape] = plan
+            while len(_plans) > MAX_PLANS:
+                _plans.popitem(last=False)
+        entry['plan'] = plan
+
+    with _lock:
+        _recent.appendleft(entry)
+    message = f"{entry['duration_ms']}ms {entry['caller'] or '-'} {shape} params={entry['params']}"
+    if entry['plan']:
+        message += ' plan=' + ' | '.join(entry['plan'])
+    logger.warning(message)
+
+
+def recent_entries():
+    with _lock:
+        return list(_recent)
+
+
+def known_plans():
+    with _lock:
+        return dict(_plans)
+
+
+def init_app(app):
+    """Start logging slow statements according to the app config"""
+    global _threshold_ms, _listener_added
+    _threshold_ms = app.config.get('SLOW_QUERY_MS', DEFAULT_THRESHOLD_MS)
+    if _threshold_ms is None:
+        return
+
+    log_path = app.config.get('SLOW_QUERY_LOG', DEFAULT_LOG_PATH)
+    if not any(getattr(h, 'baseFilename', None) == os.path.abspath(log_path) for h in logger.handlers):
+        os.makedirs(os.path.dirname(log_path), exist_ok=True)
+        handler = RotatingFileHandler(log_path, maxBytes=5 * 1024 * 1024, backupCount=5, encoding='utf-8')
+        handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+        logger.addHandler(handler)
+        logger.setLevel(logging.WARNING)
+
+    instrumentation.install()
+    if not _listener_added:
+        instrumentation.add_statement_listener(_on_statement)
+        _listener_added = True
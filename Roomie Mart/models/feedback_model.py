@@ -1,4 +1,5 @@
 from database.db_connection import get_db_connection
+from utils import events
 from datetime import datetime
 
 class Feedback:
@@ -13,8 +14,27 @@ class Feedback:
             VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         ''', (user_id, name, email, rating, comment, item_id, seller_id, created_at))
         fid = cur.lastrowid
+        # Seller reputation is updated in the same transaction, so it never disagrees with feedbacks
+        if seller_id and rating in (1, 2, 3, 4, 5):
+            cur.execute('''
+                INSERT INTO seller_stats (seller_id, rating_count, rating_sum, rating_1, rating_2, rating_3,
+                                          rating_4, rating_5, last_feedback_id, last_feedback_at)
+                VALUES (?, 1, ?, ? = 1, ? = 2, ? = 3, ? = 4, ? = 5, ?, ?)
+                ON CONFLICT (seller_id) DO UPDATE SET
+                    rating_count = rating_count + 1,
+                    rating_sum = rating_sum + excluded.rating_sum,
+                    rating_1 = rating_1 + excluded.rating_1,
+                    rating_2 = rating_2 + excluded.rating_2,
+                    rating_3 = rating_3 + excluded.rating_3,
+                    rating_4 = rating_4 + excluded.rating_4,
+                    rating_5 = rating_5 + excluded.rating_5,
+                    last_feedback_id = excluded.last_feedback_id,
+                    last_feedback_at = excluded.last_feedback_at
+            ''', (seller_id, rating, rating, rating, rating, rating, rating, fid, created_at))
         conn.commit()
         conn.close()
+        events.publish('feedback', 'created', fid, ('user_id', 'name', 'email', 'rating', 'comment', 'item_id',
+                                                    'seller_id', 'created_at'))
         return fid
 
     @staticmethod
@@ -25,3 +45,105 @@ class Feedback:
         rows = cur.fetchall()
         conn.close()
         return rows
+
+    @staticmethod
+    def get_seller_stats(seller_id):
+        """A seller's rating aggregates (seller_stats row plus `average`), or None before any rating"""
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('''
+            SELECT *, ROUND(1.0 * rating_sum / rating_count, 1) AS average
+            FROM seller_stats
+            WHERE seller_id = ? AND rating_count > 0
+        ''', (seller_id,))
+        row = cur.fetchone()
+        conn.close()
+        return row
+
+    @staticmethod
+    def rebuild_seller_stats():
+        """Recompute seller_stats from feedbacks in one transaction; returns the number of sellers"""
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('DELETE FROM seller_stats')
+        cur.execute('''
+            INSERT INTO seller_stats (seller_id, rating_count, rating_sum, rating_1, rating_2, rating_3,
+                                      rating_4, rating_5, last_feedback_id, last_feedback_at)
+            SELECT seller_id, COUNT(*), SUM(rating), SUM(rating = 1), SUM(rating = 2), SUM(rating = 3),
+                   SUM(rating = 4), SUM(rating = 5), MAX(id), MAX(created_at)
+            FROM feedbacks
+            WHERE seller_id IS NOT NULL AND rating BETWEEN 1 AND 5
+            GROUP BY seller_id
+        ''')
+        sellers = cur.rowcount
+        conn.commit()
+        conn.close()
+        return sellers
+
+    @staticmethod
+    def _filter_clause(seller_id=None, item_id=None, rating=None):
+        """WHERE fragment and params for the feedback browsing filters"""
+        sql = ''
+        params = []
+        if seller_id:
+            sql += ' AND f.seller_id = ?'
+            params.append(seller_id)
+        if item_id:
+            sql += ' AND f.item_id = ?'
+            params.append(item_id)
+        if rating:
+            sql += ' AND f.rating = ?'
+            params.append(rating)
+        return sql, params
+
+    @staticmethod
+    def get_feedbacks_page(seller_id=None, item_id=None, rating=None, after=None, limit=20):
+        """One page of feedback, newest first, using keyset pagination.
+
+        `after` is the (created_at, id) of the last row on the previous page.
+        One extra row is fetched so callers can tell whether another page exists.
+        """
+        conn = get_db_connection()
+        cur = conn.cursor()
+        sql = '''
+            SELECT f.*, i.title AS item_title, s.name AS seller_name
+            FROM feedbacks f
+            LEFT JOIN items i ON i.id = f.item_id
+            LEFT JOIN users s ON s.id = f.seller_id
+            WHERE 1 = 1
+        '''
+        filter_sql, params = Feedback._filter_clause(seller_id, item_id, rating)
+        sql += filter_sql
+        if after:
+            sql += ' AND (f.created_at < ? OR (f.created_at = ? AND f.id < ?))'
+            params.extend([after[0], after[0], after[1]])
+        sql += ' ORDER BY f.created_at DESC, f.id DESC LIMIT ?'
+        params.append(limit + 1)
+        cur.execute(sql, params)
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
+    @staticmethod
+    def get_rating_counts(seller_id=None, item_id=None, rating=None, after_id=0):
+        """({rating: count}, max_id) for feedback with after_id < id <= max_id matching the filters.
+
+        max_id is the highest feedback id at the time of the call; pass it back
+        as after_id to count only what was added since.
+        """
+        conn = get_db_connection()
+        cur = conn.cursor()
+        cur.execute('SELECT COALESCE(MAX(id), 0) FROM feedbacks')
+        max_id = cur.fetchone()[0]
+        filter_sql, params = Feedback._filter_clause(seller_id, item_id, rating)
+        # A top-up only reads the new rows, by rowid; keep the filter indexes out of it
+        source = 'feedbacks f NOT INDEXED' if after_id else 'feedbacks f'
+        cur.execute(f'''
+            SELECT f.rating, COUNT(*) AS count
+            FROM {source}
+            WHERE f.id > ? AND f.id <= ? AND f.rating BETWEEN 1 AND 5{filter_sql}
+            GROUP BY f.rating
+        ''', [after_id, max_id] + params)
+        counts = {row['rating']: row['count'] for row in cur.fetchall()}
+        conn.close()
+        return counts, max_id
@@ -1,5 +1,37 @@
 from database.db_connection import get_db_connection
+from utils import events
 from datetime import datetime
+import math
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE_LAT = 111.32
+# get_items_near probes a box this size to estimate density
+NEAR_START_RADIUS_KM = 1.0
+
+# Seller reputation from seller_stats (kept by Feedback.create_feedback); NULL before a first rating
+SELLER_RATING_COLUMNS = ('ss.rating_count as seller_rating_count, '
+                         'ROUND(1.0 * ss.rating_sum / ss.rating_count, 1) as seller_rating')
+SELLER_RATING_JOIN = 'LEFT JOIN seller_stats ss ON ss.seller_id = i.user_id'
+
+# Columns create_item writes, as reported in its change event
+ITEM_COLUMNS = ('user_id', 'title', 'category', 'price', 'condition', 'image', 'address', 'latitude', 'longitude',
+                'description', 'hostel', 'block', 'status')
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    """Great-circle distance between two points in kilometres"""
+    lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+    a = (math.sin((lat2 - lat1) / 2) ** 2
+         + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bounding_box(lat, lon, radius_km):
+    """(min_lat, max_lat, min_lon, max_lon) enclosing a circle of radius_km"""
+    dlat = radius_km / KM_PER_DEGREE_LAT
+    cos_lat = math.cos(math.radians(lat))
+    dlon = 180.0 if cos_lat < 1e-6 else min(180.0, radius_km / (KM_PER_DEGREE_LAT * cos_lat))
+    return max(-90.0, lat - dlat), min(90.0, lat + dlat), max(-180.0, lon - dlon), min(180.0, lon + dlon)
 
 class Item:
     @staticmethod
@@ -17,6 +49,7 @@ class Item:
         item_id = cursor.lastrowid
         conn.close()
         
+        events.publish('item', 'created', item_id, ITEM_COLUMNS)
         return item_id
     
     @staticmethod
@@ -25,11 +58,13 @@ class Item:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        cursor.execute('''
+        cursor.execute(f'''
             SELECT i.*, u.name as seller_name, u.email as seller_email, u.phone as seller_phone,
-                   u.hostel as seller_hostel, u.block as seller_block, u.room as seller_room
+                   u.hostel as seller_hostel, u.block as seller_block, u.room as seller_room,
+                   {SELLER_RATING_COLUMNS}
             FROM items i
             JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
             WHERE i.id = ?
         ''', (item_id,))
         
@@ -44,10 +79,11 @@ class Item:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        query = '''
-            SELECT i.*, u.name as seller_name
+        query = f'''
+            SELECT i.*, u.name as seller_name, {SELLER_RATING_COLUMNS}
             FROM items i
             JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
             WHERE i.status = ?
             ORDER BY i.created_at DESC
         '''
@@ -109,6 +145,7 @@ class Item:
         conn.commit()
         conn.close()
 
+        events.publish('item', 'updated', item_id, [field.split(' = ')[0] for field in fields])
         return True
     
     @staticmethod
@@ -122,6 +159,7 @@ class Item:
         conn.commit()
         conn.close()
         
+        events.publish('item', 'deleted', item_id)
         return True
     
     @staticmethod
@@ -139,6 +177,7 @@ class Item:
         conn.commit()
         conn.close()
         
+        events.publish('item', 'updated', item_id, ('status',))
         return True
     
     @staticmethod
@@ -147,10 +186,11 @@ class Item:
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        sql_query = '''
-            SELECT i.*, u.name as seller_name
+        sql_query = f'''
+            SELECT i.*, u.name as seller_name, {SELLER_RATING_COLUMNS}
             FROM items i
             JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
             WHERE i.status = 'available'
         '''
         params = []
@@ -180,47 +220,237 @@ class Item:
         return items
 
     @staticmethod
-    def get_filtered_items(category=None, condition=None, hostel=None, block=None, min_price=None, max_price=None):
-        """Get items filtered by category, condition, location, and price range"""
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        sql_query = '''
-            SELECT i.*, u.name as seller_name
-            FROM items i
-            JOIN users u ON i.user_id = u.id
-            WHERE i.status = 'available'
-        '''
+    def _filter_clause(category=None, condition=None, hostel=None, block=None, min_price=None, max_price=None,
+                       alias='i'):
+        """Build the WHERE fragment and params shared by the listing filters"""
+        sql = ''
         params = []
         
         if category:
-            sql_query += " AND i.category = ?"
+            sql += f" AND {alias}.category = ?"
             params.append(category)
         
         if condition:
-            sql_query += " AND i.condition = ?"
+            sql += f" AND {alias}.condition = ?"
             params.append(condition)
         
         if hostel:
-            sql_query += " AND i.hostel = ?"
+            sql += f" AND {alias}.hostel = ?"
             params.append(hostel)
         
         if block:
-            sql_query += " AND i.block = ?"
+            sql += f" AND {alias}.block = ?"
             params.append(block)
         
         if min_price is not None:
-            sql_query += " AND i.price >= ?"
+            sql += f" AND {alias}.price >= ?"
             params.append(min_price)
         
         if max_price is not None:
-            sql_query += " AND i.price <= ?"
+            sql += f" AND {alias}.price <= ?"
             params.append(max_price)
         
+        return sql, params
+
+    @staticmethod
+    def get_filtered_items(category=None, condition=None, hostel=None, block=None, min_price=None, max_price=None):
+        """Get items filtered by category, condition, location, and price range"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        sql_query = f'''
+            SELECT i.*, u.name as seller_name, {SELLER_RATING_COLUMNS}
+            FROM items i
+            JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
+            WHERE i.status = 'available'
+        '''
+        filter_sql, params = Item._filter_clause(category, condition, hostel, block, min_price, max_price)
+        sql_query += filter_sql
         sql_query += " ORDER BY i.created_at DESC"
         
         cursor.execute(sql_query, params)
         items = cursor.fetchall()
         conn.close()
         
-        return items
\ No newline at end of file
+        return items
+
+    @staticmethod
+    def get_items_page(category=None, condition=None, hostel=None, block=None, min_price=None, max_price=None,
+                       after=None, limit=20):
+        """Get one page of available items, newest first, using keyset pagination.
+
+        `after` is the (created_at, id) of the last item on the previous page.
+        One extra row is fetched so callers can tell whether another page exists.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        sql_query = f'''
+            SELECT i.*, u.name as seller_name, {SELLER_RATING_COLUMNS}
+            FROM items i
+            JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
+            WHERE i.status = 'available'
+        '''
+        filter_sql, params = Item._filter_clause(category, condition, hostel, block, min_price, max_price)
+        sql_query += filter_sql
+        
+        if after:
+            sql_query += " AND (i.created_at < ? OR (i.created_at = ? AND i.id < ?))"
+            params.extend([after[0], after[0], after[1]])
+        
+        sql_query += " ORDER BY i.created_at DESC, i.id DESC LIMIT ?"
+        params.append(limit + 1)
+        
+        cursor.execute(sql_query, params)
+        items = cursor.fetchall()
+        conn.close()
+        
+        return items
+
+    @staticmethod
+    def get_items_near(lat, lon, radius_km, limit=60, category=None, condition=None, hostel=None, block=None,
+                       min_price=None, max_price=None):
+        """Nearest available items within radius_km of (lat, lon), closest first.
+
+        items_rtree (available items only) narrows candidates to a bounding box
+        and SQLite orders them by a flat-earth approximation, so only the closest
+        few rows are fetched in full and ranked by exact haversine distance. The
+        box is sized from a count over a small probe box so it should hold about
+        `limit` matches; if it holds fewer, one more query covers the whole
+        radius (at most three statements). Each returned dict carries
+        `distance_km`.
+        """
+        filter_sql, filter_params = Item._filter_clause(category, condition, hostel, block, min_price, max_price)
+        # Overlap tests, because the R*Tree stores coordinates as rounded-out float32
+        box_sql = 'r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?'
+        # Filters need the items row; CROSS JOIN keeps the R*Tree (not the status index) as the outer loop
+        candidates = 'items_rtree r CROSS JOIN items i ON i.id = r.id' if filter_sql else 'items_rtree r'
+        sql_query = f'''
+            SELECT i.*, u.name as seller_name, {SELLER_RATING_COLUMNS}
+            FROM (
+                SELECT r.id
+                FROM {candidates}
+                WHERE {box_sql}{filter_sql}
+                ORDER BY (r.min_lat - ?) * (r.min_lat - ?) + (r.min_lon - ?) * (r.min_lon - ?) * ?
+                LIMIT ?
+            ) nearest
+            CROSS JOIN items i ON i.id = nearest.id
+            JOIN users u ON i.user_id = u.id
+            {SELLER_RATING_JOIN}
+            WHERE i.status = 'available'
+        '''
+        # Exact ranking happens on a few more rows than needed, in case the approximation reorders near-ties
+        fetch = limit * 2
+        cos2 = math.cos(math.radians(lat)) ** 2
+
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        search_km = min(radius_km, NEAR_START_RADIUS_KM)
+        cursor.execute(f'SELECT COUNT(*) FROM {candidates} WHERE {box_sql}{filter_sql}',
+                       list(bounding_box(lat, lon, search_km)) + filter_params)
+        in_box = cursor.fetchone()[0]
+        if in_box:
+            # Matches per km^2 around here -> a box expected to hold `limit` of them (2x headroom)
+            search_km = min(radius_km, search_km * math.sqrt(2 * limit / in_box))
+        else:
+            # Nothing close by: no density to go on, search the whole radius
+            search_km = radius_km
+
+        while True:
+            cursor.execute(sql_query, list(bounding_box(lat, lon, search_km)) + filter_params
+                           + [lat, lat, lon, lon, cos2, fetch])
+            found = []
+            for row in cursor.fetchall():
+                distance = haversine_km(lat, lon, row['latitude'], row['longitude'])
+                # Box corners lie outside the circle; only the circle is exact
+                if distance <= search_km:
+                    item = dict(row)
+                    item['distance_km'] = round(distance, 3)
+                    found.append(item)
+            found.sort(key=lambda item: item['distance_km'])
+            if len(found) >= limit or search_km >= radius_km:
+                break
+            # The estimate fell short: go straight to the full radius rather than widening step by step
+            search_km = radius_km
+        conn.close()
+
+        return found[:limit]
+
+    @staticmethod
+    def get_facet_snapshot():
+        """(change-log version, facet columns of every available item), read in one transaction"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('BEGIN')
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM item_changes')
+        version = cursor.fetchone()[0]
+        cursor.execute('''
+            SELECT id, category, condition, hostel, block, price
+            FROM items
+            WHERE +status = 'available'
+        ''')  # unary + : most items match, so a sequential table scan beats the status index
+        items = cursor.fetchall()
+        conn.rollback()
+        conn.close()
+
+        return version, items
+
+    @staticmethod
+    def get_change_version():
+        """Highest item_changes version so far (0 before the first item write)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT COALESCE(MAX(version), 0) FROM item_changes')
+
+        version = cursor.fetchone()[0]
+        conn.close()
+
+        return version
+
+    @staticmethod
+    def get_facet_changes(after_version, limit):
+        """Items written since after_version with their current facet columns, oldest change first.
+
+        `status` is NULL for deleted items. At most `limit` rows are returned.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT c.item_id, c.version, i.status, i.category, i.condition, i.hostel, i.block, i.price
+            FROM item_changes c
+            LEFT JOIN items i ON i.id = c.item_id
+            WHERE c.version > ?
+            ORDER BY c.version
+            LIMIT ?
+        ''', (after_version, limit))
+
+        changes = cursor.fetchall()
+        conn.close()
+
+        return changes
+
+    @staticmethod
+    def get_similar_items(item_id, limit=8):
+        """Precomputed similar listings for an item that are still available, best first"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT i.id, i.title, i.price, i.image, i.category, i.condition, i.hostel, i.block, s.score
+            FROM item_similar s
+            JOIN items i ON i.id = s.similar_id
+            WHERE s.item_id = ? AND i.status = 'available'
+            ORDER BY s.rank
+            LIMIT ?
+        ''', (item_id, limit))
+
+        items = cursor.fetchall()
+        conn.close()
+
+        return items
@@ -0,0 +1,203 @@
+import json
+import time
+
+from database.db_connection import get_db_connection
+
+
+class Job:
+    """Rows of the background job queue; see utils/jobs.py for the runner"""
+
+    @staticmethod
+    def enqueue(name, payload=None, delay=0, priority=0, max_attempts=5, conn=None):
+        """Queue a job (one INSERT); pass `conn` to enqueue inside the caller's transaction"""
+        own = conn is None
+        if own:
+            conn = get_db_connection()
+        cursor = conn.execute('''
+            INSERT INTO jobs (name, payload, priority, max_attempts, run_at)
+            VALUES (?, ?, ?, ?, ?)
+        ''', (name, json.dumps(payload or {}), priority, max_attempts, time.time() + delay))
+        job_id = cursor.lastrowid
+        if own:
+            conn.commit()
+            conn.close()
+        return job_id
+
+    @staticmethod
+    def claim(worker_id, lease):
+        """Lease the most urgent due job (or one whose lease ran out) to worker_id; None if idle"""
+        now = time.time()
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        # One statement, so two workers can never claim the same row
+        cursor.execute('''
+            UPDATE jobs
+            SET status = 'running', locked_by = :worker, locked_until = :now + :lease,
+                attempts = attempts + 1, started_at = CURRENT_TIMESTAMP
+            WHERE id = (
+                SELECT id FROM (
+                    SELECT id, priority, run_at FROM jobs WHERE status = 'queued' AND run_at <= :now
+                    UNION ALL
+                    SELECT id, priority, run_at FROM jobs WHERE status = 'running' AND locked_until < :now
+                )
+                ORDER BY priority DESC, run_at
+                LIMIT 1
+            )
+            RETURNING id, name, payload, attempts, max_attempts
+        ''', {'worker': worker_id, 'now': now, 'lease': lease})
+
+        job = cursor.fetchone()
+        conn.commit()
+        conn.close()
+
+        return job
+
+    @staticmethod
+    def renew_leases(job_ids, worker_id, lease):
+        """Push the lease of jobs worker_id is still running lease seconds into the future"""
+        conn = get_db_connection()
+        placeholders = ', '.join('?' * len(job_ids))
+        conn.execute(f'''
+            UPDATE jobs SET locked_until = ?
+            WHERE id IN ({placeholders}) AND locked_by = ? AND status = 'running'
+        ''', (time.time() + lease, *job_ids, worker_id))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def finish(job_id, worker_id, status, error=None, retry_in=None):
+        """Record a run's outcome: 'done', 'failed', or back to 'queued' in retry_in seconds.
+
+        Only applies while worker_id still holds the lease; returns False if it
+        had expired and another worker took the job over.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs
+            SET status = ?, last_error = ?, locked_by = NULL, locked_until = NULL,
+                run_at = COALESCE(?, run_at),
+                finished_at = CASE WHEN ? = 'queued' THEN NULL ELSE CURRENT_TIMESTAMP END
+            WHERE id = ? AND locked_by = ?
+        ''', (status, error, None if retry_in is None else time.time() + retry_in, status, job_id, worker_id))
+
+        updated = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+
+        return updated
+
+    @staticmethod
+    def retry(job_id):
+        """Queue a failed job again right away"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            UPDATE jobs SET status = 'queued', attempts = 0, run_at = ?, finished_at = NULL
+            WHERE id = ? AND status = 'failed'
+        ''', (time.time(), job_id))
+
+        updated = cursor.rowcount == 1
+        conn.commit()
+        conn.close()
+
+        return updated
+
+    @staticmethod
+    def claim_schedule(name, job_name, payload, seen, next_run_at, max_attempts=5):
+        """Move a periodic job's due time from `seen` to next_run_at and queue its run.
+
+        Several workers tick the same schedules; only the one whose UPDATE still
+        sees the old due time enqueues. Returns the new job id or None.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        job_id = None
+
+        cursor.execute('BEGIN IMMEDIATE')
+        cursor.execute('''
+            UPDATE job_schedules SET next_run_at = ?, last_run_at = ?
+            WHERE name = ? AND next_run_at = ?
+        ''', (next_run_at, time.time(), name, seen))
+        if cursor.rowcount == 1:
+            job_id = Job.enqueue(job_name, payload, max_attempts=max_attempts, conn=conn)
+        conn.commit()
+        conn.close()
+
+        return job_id
+
+    @staticmethod
+    def get_schedules():
+        """{name: next_run_at} for every periodic job seen so far"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT name, next_run_at, last_run_at FROM job_schedules')
+
+        schedules = {row['name']: row for row in cursor.fetchall()}
+        conn.close()
+
+        return schedules
+
+    @staticmethod
+    def add_schedules(first_runs):
+        """Insert the first due time of schedules that don't have a row yet"""
+        conn = get_db_connection()
+        conn.executemany('INSERT OR IGNORE INTO job_schedules (name, next_run_at) VALUES (?, ?)',
+                         list(first_runs.items()))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def get_status_counts():
+        """(name, status, count) over the whole queue"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT name, status, COUNT(*) AS count
+            FROM jobs
+            GROUP BY name, status
+            ORDER BY name, status
+        ''')
+
+        counts = cursor.fetchall()
+        conn.close()
+
+        return counts
+
+    @staticmethod
+    def get_recent(status=None, limit=50):
+        """Latest jobs, newest first, optionally only those with `status`"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        if status:
+            cursor.execute('SELECT * FROM jobs WHERE status = ? ORDER BY id DESC LIMIT ?', (status, limit))
+        else:
+            cursor.execute('SELECT * FROM jobs ORDER BY id DESC LIMIT ?', (limit,))
+
+        jobs = cursor.fetchall()
+        conn.close()
+
+        return jobs
+
+    @staticmethod
+    def delete_finished(older_than_days):
+        """Drop done jobs finished more than older_than_days ago; returns how many"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            DELETE FROM jobs
+            WHERE status = 'done' AND finished_at < datetime('now', ?)
+        ''', (f'-{int(older_than_days)} days',))
+
+        deleted = cursor.rowcount
+        conn.commit()
+        conn.close()
+
+        return deleted
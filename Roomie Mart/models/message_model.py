@@ -1,6 +1,7 @@
 import sqlite3
 from datetime import datetime
-from database.db_connection import get_db_connection
+from database.db_connection import get_db_connection, attach_archive
+from utils import events
 
 class Message:
     @staticmethod
@@ -20,6 +21,8 @@ class Message:
         conn.commit()
         conn.close()
         
+        events.publish('message', 'created', message_id,
+                       ('sender_id', 'receiver_id', 'item_id', 'content', 'created_at', 'is_read'))
         return message_id
     
     @staticmethod
@@ -67,30 +70,108 @@ class Message:
         return messages
     
     @staticmethod
-    def get_conversation(user_id, other_user_id, item_id):
-        """Get conversation between two users about a specific item"""
+    def get_conversation(user_id, other_user_id, item_id, before_id=None, limit=50):
+        """Up to `limit` messages of a conversation older than before_id (default: the latest), oldest first.
+
+        Each direction of the conversation is read backwards from
+        idx_messages_conversation and stops after `limit` rows, so a page
+        costs the same however long the conversation is.
+        """
         conn = get_db_connection()
         cursor = conn.cursor()
-        
+
         cursor.execute('''
-            SELECT m.*, i.title as item_title,
-                   s.name as sender_name, r.name as receiver_name,
-                   CASE WHEN m.sender_id = ? THEN 'sent' ELSE 'received' END as message_type
-            FROM messages m
-            JOIN items i ON m.item_id = i.id
+            SELECT m.*, s.name as sender_name,
+                   CASE WHEN m.sender_id = :user THEN 'sent' ELSE 'received' END as message_type
+            FROM (
+                SELECT id FROM (
+                    SELECT id FROM messages
+                    WHERE item_id = :item AND sender_id = :user AND receiver_id = :other AND id < :before
+                    ORDER BY id DESC LIMIT :limit
+                )
+                UNION ALL
+                SELECT id FROM (
+                    SELECT id FROM messages
+                    WHERE item_id = :item AND sender_id = :other AND receiver_id = :user AND id < :before
+                    ORDER BY id DESC LIMIT :limit
+                )
+            ) page
+            JOIN messages m ON m.id = page.id
             JOIN users s ON m.sender_id = s.id
-            JOIN users r ON m.receiver_id = r.id
-            WHERE m.item_id = ? AND 
-                  ((m.sender_id = ? AND m.receiver_id = ?) OR 
-                   (m.sender_id = ? AND m.receiver_id = ?))
-            ORDER BY m.created_at ASC
-        ''', (user_id, item_id, user_id, other_user_id, other_user_id, user_id))
-        
+            ORDER BY m.id DESC
+            LIMIT :limit
+        ''', {'user': user_id, 'other': other_user_id, 'item': item_id,
+              'before': before_id or 2 ** 63 - 1, 'limit': limit})
+
         messages = cursor.fetchall()
         conn.close()
-        
+
+        return messages[::-1]
+
+    @staticmethod
+    def get_conversation_after(user_id, other_user_id, item_id, after_id, limit=100):
+        """Up to `limit` messages in a conversation newer than after_id, oldest first (live updates)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT m.*, s.name as sender_name,
+                   CASE WHEN m.sender_id = :user THEN 'sent' ELSE 'received' END as message_type
+            FROM (
+                SELECT id FROM (
+                    SELECT id FROM messages
+                    WHERE item_id = :item AND sender_id = :user AND receiver_id = :other AND id > :after
+                    ORDER BY id LIMIT :limit
+                )
+                UNION ALL
+                SELECT id FROM (
+                    SELECT id FROM messages
+                    WHERE item_id = :item AND sender_id = :other AND receiver_id = :user AND id > :after
+                    ORDER BY id LIMIT :limit
+                )
+            ) page
+            JOIN messages m ON m.id = page.id
+            JOIN users s ON m.sender_id = s.id
+            ORDER BY m.id
+            LIMIT :limit
+        ''', {'user': user_id, 'other': other_user_id, 'item': item_id, 'after': after_id, 'limit': limit})
+
+        messages = cursor.fetchall()
+        conn.close()
+
         return messages
-    
+
+    @staticmethod
+    def get_latest_message_id():
+        """Highest message id so far (0 when there are none)"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('SELECT COALESCE(MAX(id), 0) FROM messages')
+
+        latest = cursor.fetchone()[0]
+        conn.close()
+
+        return latest
+
+    @staticmethod
+    def get_message_parties_after(after_id):
+        """(id, sender_id, receiver_id) of every message newer than after_id"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT id, sender_id, receiver_id
+            FROM messages
+            WHERE id > ?
+            ORDER BY id
+        ''', (after_id,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return rows
+
     @staticmethod
     def mark_as_read(message_id):
         """Mark a message as read"""
@@ -108,6 +189,43 @@ class Message:
         
         return True
     
+    @staticmethod
+    def mark_conversation_read(user_id, other_user_id, item_id):
+        """Mark every message other_user_id sent to user_id about an item as read"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute('''
+            UPDATE messages
+            SET is_read = 1
+            WHERE item_id = ? AND sender_id = ? AND receiver_id = ? AND is_read = 0
+        ''', (item_id, other_user_id, user_id))
+        
+        conn.commit()
+        conn.close()
+        
+        return cursor.rowcount
+    
+    @staticmethod
+    def mark_messages_read(user_id, message_ids):
+        """Mark the messages among message_ids that were sent to user_id as read"""
+        if not message_ids:
+            return 0
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        placeholders = ','.join('?' * len(message_ids))
+        cursor.execute(f'''
+            UPDATE messages
+            SET is_read = 1
+            WHERE id IN ({placeholders}) AND receiver_id = ? AND is_read = 0
+        ''', list(message_ids) + [user_id])
+        
+        conn.commit()
+        conn.close()
+        
+        return cursor.rowcount
+    
     @staticmethod
     def get_unread_count(user_id):
         """Get count of unread messages for a user"""
@@ -123,4 +241,146 @@ class Message:
         result = cursor.fetchone()
         conn.close()
         
-        return result['count'] if result else 0
\ No newline at end of file
+        return result['count'] if result else 0
+
+    @staticmethod
+    def get_archivable_message_ids(cutoff):
+        """Ids of read messages older than cutoff whose conversation is finished or stale.
+
+        A conversation (item + pair of users) is finished once its item is sold
+        or gone, and stale when its newest message is older than cutoff.
+        Unread messages stay hot so unread counts never need the archive.
+        """
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            WITH conversations AS (
+                SELECT item_id, MIN(sender_id, receiver_id) AS user_a,
+                       MAX(sender_id, receiver_id) AS user_b, MAX(created_at) AS last_at
+                FROM messages
+                GROUP BY 1, 2, 3
+            )
+            SELECT m.id
+            FROM messages m
+            JOIN conversations c ON c.item_id = m.item_id
+                 AND c.user_a = MIN(m.sender_id, m.receiver_id)
+                 AND c.user_b = MAX(m.sender_id, m.receiver_id)
+            LEFT JOIN items i ON i.id = m.item_id
+            WHERE m.created_at < ? AND m.is_read = 1
+              AND (c.last_at < ? OR i.id IS NULL OR i.status = 'sold')
+            ORDER BY m.id
+        ''', (cutoff, cutoff))
+
+        ids = [row[0] for row in cursor.fetchall()]
+        conn.close()
+
+        return ids
+
+    @staticmethod
+    def archive_messages(message_ids):
+        """Move messages into the archive file and record them in archived_conversations.
+
+        Copy, summary and delete commit as one transaction across both files.
+        Returns the number of messages moved.
+        """
+        conn = attach_archive(get_db_connection())
+        cursor = conn.cursor()
+        placeholders = ', '.join('?' * len(message_ids))
+
+        try:
+            cursor.execute('BEGIN IMMEDIATE')
+            cursor.execute(f'''
+                INSERT OR IGNORE INTO archive.messages
+                    (id, sender_id, receiver_id, item_id, content, is_read, created_at)
+                SELECT id, sender_id, receiver_id, item_id, content, is_read, created_at
+                FROM main.messages
+                WHERE id IN ({placeholders})
+            ''', message_ids)
+            cursor.execute(f'''
+                INSERT INTO main.archived_conversations (item_id, user_a, user_b, message_count, first_at, last_at)
+                SELECT item_id, MIN(sender_id, receiver_id), MAX(sender_id, receiver_id),
+                       COUNT(*), MIN(created_at), MAX(created_at)
+                FROM main.messages
+                WHERE id IN ({placeholders})
+                GROUP BY 1, 2, 3
+                ON CONFLICT (item_id, user_a, user_b) DO UPDATE SET
+                    message_count = message_count + excluded.message_count,
+                    first_at = MIN(first_at, excluded.first_at),
+                    last_at = MAX(last_at, excluded.last_at)
+            ''', message_ids)
+            cursor.execute(f'DELETE FROM main.messages WHERE id IN ({placeholders})', message_ids)
+            moved = cursor.rowcount
+            conn.commit()
+        except sqlite3.Error:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+        return moved
+
+    @staticmethod
+    def get_archived_summary(user_id, other_user_id, item_id):
+        """archived_conversations row for a conversation, or None if nothing was archived"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT message_count, first_at, last_at
+            FROM archived_conversations
+            WHERE item_id = ? AND user_a = MIN(?, ?) AND user_b = MAX(?, ?)
+        ''', (item_id, user_id, other_user_id, user_id, other_user_id))
+
+        summary = cursor.fetchone()
+        conn.close()
+
+        return summary
+
+    @staticmethod
+    def get_archived_conversations(user_id):
+        """Archived conversations a user took part in, most recent first"""
+        conn = get_db_connection()
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT a.item_id, a.message_count, a.first_at, a.last_at,
+                   a.other_user_id, u.name AS other_user_name,
+                   i.title AS item_title, i.image AS item_image
+            FROM (
+                SELECT *, user_b AS other_user_id FROM archived_conversations WHERE user_a = ?
+                UNION ALL
+                SELECT *, user_a AS other_user_id FROM archived_conversations WHERE user_b = ?
+            ) a
+            JOIN users u ON u.id = a.other_user_id
+            LEFT JOIN items i ON i.id = a.item_id
+            ORDER BY a.last_at DESC
+        ''', (user_id, user_id))
+
+        conversations = cursor.fetchall()
+        conn.close()
+
+        return conversations
+
+    @staticmethod
+    def get_archived_messages(user_id, other_user_id, item_id, before_id=None, limit=100):
+        """Up to `limit` archived messages of a conversation older than before_id, oldest first"""
+        conn = attach_archive(get_db_connection())
+        cursor = conn.cursor()
+
+        cursor.execute('''
+            SELECT m.*, s.name as sender_name,
+                   CASE WHEN m.sender_id = ? THEN 'sent' ELSE 'received' END as message_type
+            FROM archive.messages m
+            JOIN users s ON m.sender_id = s.id
+            WHERE m.item_id = ? AND m.id < ? AND
+                  ((m.sender_id = ? AND m.receiver_id = ?) OR
+                   (m.sender_id = ? AND m.receiver_id = ?))
+            ORDER BY m.id DESC
+            LIMIT ?
+        ''', (user_id, item_id, before_id or 2 ** 63 - 1, user_id, other_user_id, other_user_id, user_id, limit))
+
+        messages = cursor.fetchall()
+        conn.close()
+
+        return messages[::-1]
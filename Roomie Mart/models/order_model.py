@@ -1,4 +1,5 @@
 from database.db_connection import get_db_connection
+from utils import events
 import uuid
 
 class Order:
@@ -17,6 +18,8 @@ class Order:
         conn.commit()
         order_id = cur.lastrowid
         conn.close()
+        events.publish('order', 'created', order_id, ('buyer_id', 'seller_id', 'item_id', 'item_title', 'price',
+                                                      'quantity', 'total', 'transaction_ref'))
         return order_id
 
     @staticmethod
@@ -58,6 +61,19 @@ class Order:
         conn.close()
         return row
 
+    @staticmethod
+    def get_orders_by_ids(order_ids):
+        """Orders (with buyer and seller details) for a list of ids, in one query; missing ids are skipped"""
+        if not order_ids:
+            return []
+        conn = get_db_connection()
+        cur = conn.cursor()
+        placeholders = ','.join('?' * len(order_ids))
+        cur.execute(f'SELECT o.*, b.name as buyer_name, b.email as buyer_email, s.name as seller_name, s.email as seller_email FROM orders o JOIN users b ON o.buyer_id = b.id JOIN users s ON o.seller_id = s.id WHERE o.id IN ({placeholders})', list(order_ids))
+        rows = cur.fetchall()
+        conn.close()
+        return rows
+
     @staticmethod
     def get_order_for_item_and_user(item_id, user_id):
         """Return an order for the given item where user_id is buyer or seller (latest)."""
@@ -75,3 +91,47 @@ class Order:
         row = cur.fetchone()
         conn.close()
         return row
+
+    @staticmethod
+    def _iter_orders(party_column, other_column, party_id, start=None, end=None, batch_size=500):
+        """Yield order rows for one party straight from the cursor, newest first.
+
+        `start`/`end` bound created_at (end is exclusive). Rows are pulled in
+        fetchmany batches so memory stays flat however long the history is; the
+        connection is closed when the generator is exhausted or closed early.
+        """
+        sql = f'''
+            SELECT o.*, u.name as counterparty_name, u.email as counterparty_email
+            FROM orders o
+            JOIN users u ON o.{other_column} = u.id
+            WHERE o.{party_column} = ?
+        '''
+        params = [party_id]
+        if start:
+            sql += ' AND o.created_at >= ?'
+            params.append(start)
+        if end:
+            sql += ' AND o.created_at < ?'
+            params.append(end)
+        sql += ' ORDER BY o.created_at DESC'
+
+        conn = get_db_connection()
+        try:
+            cur = conn.cursor()
+            cur.execute(sql, params)
+            while True:
+                rows = cur.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield row
+        finally:
+            conn.close()
+
+    @staticmethod
+    def iter_orders_for_seller(seller_id, start=None, end=None):
+        return Order._iter_orders('seller_id', 'buyer_id', seller_id, start, end)
+
+    @staticmethod
+    def iter_orders_for_buyer(buyer_id, start=None, end=None):
+        return Order._iter_orders('buyer_id', 'seller_id', buyer_id, start, end)
@@ -1,4 +1,5 @@
 from database.db_connection import get_db_connection
+from utils import events
 
 
 class RequestModel:
@@ -24,6 +25,7 @@ class RequestModel:
         conn.commit()
         req_id = cur.lastrowid
         conn.close()
+        events.publish('request', 'created', req_id, ('item_id', 'requester_id', 'owner_id', 'message', 'status'))
         return req_id
 
     @staticmethod
@@ -65,6 +67,7 @@ class RequestModel:
         cur.execute('UPDATE requests SET status = ? WHERE id = ?', (status, request_id))
         conn.commit()
         conn.close()
+        events.publish('request', 'updated', request_id, ('status',))
 
     @staticmethod
     def get_request_by_id(request_id):
@@ -0,0 +1,253 @@
+"""Concurrency benchmark: WSGI (Flask) vs the ASGI mode in asgi.py.
+
+Runs in-process against a seeded scratch database (same seeding as
+scripts/benchmark.py), so no server or network is involved:
+
+  idle   --clients users keep an unread-message badge live for --duration
+         seconds while a writer stores --rate messages/second to random
+         users. WSGI clients poll /message/unread_count every --interval
+         seconds, one thread each (what the navbar script does); ASGI
+         clients hold long polls (?since=&wait=) on one event loop.
+  burst  --clients concurrent clients each fetch /api/v1/items --requests
+         times. WSGI uses a thread per client; ASGI goes through the bridge
+         onto its bounded pool.
+
+Reports requests served, SQL statements, peak threads, notification delay
+(message stored -> client sees the new count) and latency percentiles.
+
+    python scripts/asgi_benchmark.py --clients 500 --duration 10
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark  # noqa: E402  (seeding and app loading)
+
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.latencies = []
+        self.delays = []
+        self.peak_threads = threading.active_count()
+
+    def record(self, seconds):
+        with self.lock:
+            self.requests += 1
+            self.latencies.append(seconds)
+            self.peak_threads = max(self.peak_threads, threading.active_count())
+
+    def summary(self, statements, elapsed):
+        latencies = sorted(self.latencies)
+        delays = sorted(self.delays)
+        return {
+            'requests': self.requests,
+            'requests_per_s': round(self.requests / elapsed, 1),
+            'sql_statements': statements,
+            'peak_threads': self.peak_threads,
+            'latency_p50_ms': round(benchmark.percentile(latencies, 50) * 1000, 2),
+            'latency_p95_ms': round(benchmark.percentile(latencies, 95) * 1000, 2),
+            'notify_delay_p50_ms': round(benchmark.percentile(delays, 50) * 1000, 1) if delays else None,
+            'notify_delay_p95_ms': round(benchmark.percentile(delays, 95) * 1000, 1) if delays else None,
+        }
+
+
+class Writer(threading.Thread):
+    """Stores messages to random users; remembers when each user got one"""
+
+    def __init__(self, user_ids, item_id, rate, stop):
+        super().__init__(daemon=True)
+        self.user_ids = user_ids
+        self.item_id = item_id
+        self.rate = rate
+        self.stop = stop
+        self.sent_at = {}
+
+    def run(self):
+        from models.message_model import Message
+        rng = random.Random(7)
+        while not self.stop.wait(1.0 / self.rate):
+            receiver = rng.choice(self.user_ids)
+            sender = self.user_ids[0] if receiver != self.user_ids[0] else self.user_ids[1]
+            self.sent_at.setdefault(receiver, time.perf_counter())
+            Message.create_message(sender, receiver, self.item_id, 'ping')
+
+
+def session_cookie(app, user_id):
+    serializer = app.session_interface.get_signing_serializer(app)
+    return f"{app.config['SESSION_COOKIE_NAME']}={serializer.dumps({'user_id': user_id})}"
+
+
+def count_statements():
+    from database import instrumentation
+    counter = [0]
+    instrumentation.install()
+    instrumentation.add_trace_listener(lambda sql: counter.__setitem__(0, counter[0] + 1))
+    return counter
+
+
+def wsgi_idle(app, user_ids, item_id, args, counter):
+    stats, stop = Stats(), threading.Event()
+
+    def client(user_id):
+        c = app.test_client()
+        c.set_cookie('session', session_cookie(app, user_id).split('=', 1)[1])
+        seen = None
+        while not stop.is_set():
+            t0 = time.perf_counter()
+            count = c.get('/message/unread_count').get_json()['count']
+            stats.record(time.perf_counter() - t0)
+            if seen is not None and count != seen and user_id in writer.sent_at:
+                with stats.lock:
+                    stats.delays.append(time.perf_counter() - writer.sent_at.pop(user_id))
+            seen = count
+            stop.wait(args.interval)
+
+    writer = Writer(user_ids, item_id, args.rate, stop)
+    threads = [threading.Thread(target=client, args=(u,), daemon=True) for u in user_ids[:args.clients]]
+    start_statements = counter[0]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    writer.start()
+    time.sleep(args.duration)
+    stop.set()
+    for t in threads:
+        t.join()
+    return stats.summary(counter[0] - start_statements, time.perf_counter() - started)
+
+
+def asgi_idle(asgi_app, user_ids, item_id, args, counter):
+    stats, stop = Stats(), threading.Event()
+    writer = Writer(user_ids, item_id, args.rate, stop)
+
+    async def client(user_id, deadline):
+        cookie = session_cookie(asgi_app.flask_app, user_id)
+        seen = None
+        while time.perf_counter() < deadline:
+            query = f'since={seen}&wait={max(0.1, deadline - time.perf_counter()):.1f}' if seen is not None else ''
+            t0 = time.perf_counter()
+            status, body = await call(asgi_app, '/message/unread_count', query, cookie)
+            stats.record(time.perf_counter() - t0)
+            count = json.loads(body)['count']
+            if seen is not None and count != seen and user_id in writer.sent_at:
+                stats.delays.append(time.perf_counter() - writer.sent_at.pop(user_id))
+            seen = count
+
+    async def main():
+        deadline = time.perf_counter() + args.duration
+        writer.start()
+        await asyncio.gather(*(client(u, deadline) for u in user_ids[:args.clients]))
+
+    start_statements = counter[0]
+    started = time.perf_counter()
+    asyncio.run(main())
+    stop.set()
+    return stats.summary(counter[0] - start_statements, time.perf_counter() - started)
+
+
+def wsgi_burst(app, args, counter):
+    stats = Stats()
+
+    def client():
+        c = app.test_client()
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            c.get('/api/v1/items?limit=20')
+            stats.record(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=client, daemon=True) for _ in range(args.clients)]
+    start_statements = counter[0]
+    started = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return stats.summary(counter[0] - start_statements, time.perf_counter() - started)
+
+
+def asgi_burst(asgi_app, args, counter):
+    stats = Stats()
+
+    async def client():
+        for _ in range(args.requests):
+            t0 = time.perf_counter()
+            await call(asgi_app, '/api/v1/items', 'limit=20')
+            stats.record(time.perf_counter() - t0)
+
+    async def main():
+        await asyncio.gather(*(client() for _ in range(args.clients)))
+
+    start_statements = counter[0]
+    started = time.perf_counter()
+    asyncio.run(main())
+    return stats.summary(counter[0] - start_statements, time.perf_counter() - started)
+
+
+async def call(asgi_app, path, query='', cookie=None):
+    """One GET through the ASGI app; returns (status, body bytes)"""
+    headers = [(b'host', b'localhost')]
+    if cookie:
+        headers.append((b'cookie', cookie.encode('latin-1')))
+    scope = {'type': 'http', 'method': 'GET', 'path': path, 'query_string': query.encode('latin-1'),
+             'headers': headers, 'http_version': '1.1', 'scheme': 'http', 'root_path': '',
+             'server': ('localhost', 80), 'client': ('127.0.0.1', 0)}
+    response = {'status': None, 'body': []}
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        if message['type'] == 'http.response.start':
+            response['status'] = message['status']
+        else:
+            response['body'].append(message.get('body', b''))
+
+    await asgi_app(scope, receive, send)
+    return response['status'], b''.join(response['body'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=200)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds for the idle scenario')
+    parser.add_argument('--rate', type=float, default=5.0, help='Messages stored per second (idle)')
+    parser.add_argument('--interval', type=float, default=2.0, help='WSGI badge poll interval in seconds')
+    parser.add_argument('--requests', type=int, default=20, help='Requests per client (burst)')
+    parser.add_argument('--only', choices=('idle', 'burst'))
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='roomie_asgi_bench_')
+    app = benchmark.load_app(os.path.join(workdir, 'bench.db'))
+    # Budgets/N+1 checks are for tests; here they would only add noise
+    app.config['TESTING'] = False
+    users = max(args.clients + 2, 50)
+    benchmark.seed(users, 2000, 2000, 100, random.Random(42))
+    user_ids = list(range(1, users + 1))
+
+    import asgi
+    from asgi import RoomieASGI
+    asgi.POLL_INTERVAL = min(asgi.POLL_INTERVAL, args.interval)
+    asgi_app = RoomieASGI(app)
+    counter = count_statements()
+
+    report = {'config': vars(args)}
+    if args.only in (None, 'idle'):
+        report['idle'] = {'wsgi': wsgi_idle(app, user_ids, 1, args, counter),
+                          'asgi': asgi_idle(asgi_app, user_ids, 1, args, counter)}
+    if args.only in (None, 'burst'):
+        report['burst'] = {'wsgi': wsgi_burst(app, args, counter),
+                           'asgi': asgi_burst(asgi_app, args, counter)}
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == '__main__':
+    main()
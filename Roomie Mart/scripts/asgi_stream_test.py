@@ -0,0 +1,77 @@
+"""Streamed downloads through the ASGI bridge (asgi.py).
+
+Seeds a scratch database (same seeding as scripts/benchmark.py) and fetches
+the seller's sales CSV and bills ZIP through RoomieASGI, --clients at once
+on one event loop, then checks every body against the same download made
+through Flask's test client (ZIPs by their members, whose timestamps vary).
+Both views stream with stream_with_context, so this fails if the bridge
+loses the request context between chunks.
+
+    python scripts/asgi_stream_test.py --orders 1000 --clients 8
+"""
+import argparse
+import asyncio
+import io
+import os
+import random
+import sys
+import tempfile
+import zipfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark  # noqa: E402  (seeding and app loading)
+from asgi_benchmark import call, session_cookie  # noqa: E402
+
+DOWNLOADS = ('/orders/sales_history.csv', '/orders/sales_history/bills.zip')
+
+
+def contents(path, body):
+    if path.endswith('.zip'):
+        archive = zipfile.ZipFile(io.BytesIO(body))
+        return [(name, archive.read(name)) for name in archive.namelist()]
+    return body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--orders', type=int, default=1000)
+    parser.add_argument('--clients', type=int, default=8, help='Concurrent downloads of each file')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='roomie_asgi_stream_')
+    app = benchmark.load_app(os.path.join(workdir, 'stream.db'))
+    app.config['BILL_CACHE_DIR'] = os.path.join(workdir, 'bills')
+    benchmark.seed(50, 500, 100, args.orders, random.Random(42))
+
+    from asgi import RoomieASGI
+    asgi_app = RoomieASGI(app, wsgi_threads=4)
+    cookie = session_cookie(app, 1)
+
+    client = app.test_client()
+    client.set_cookie('session', cookie.split('=', 1)[1])
+    expected = {path: contents(path, client.get(path).data) for path in DOWNLOADS}
+
+    async def fetch_all():
+        return await asyncio.gather(*(call(asgi_app, path, cookie=cookie)
+                                      for path in DOWNLOADS for _ in range(args.clients)))
+
+    failures = 0
+    results = asyncio.run(fetch_all())
+    for n, (status, body) in enumerate(results):
+        path = DOWNLOADS[n // args.clients]
+        try:
+            ok = status == 200 and contents(path, body) == expected[path]
+        except zipfile.BadZipFile:
+            ok = False
+        if not ok:
+            failures += 1
+            print(f'FAIL {path}: status {status}, {len(body)} bytes')
+
+    rows = expected[DOWNLOADS[0]].decode().count('\n') - 1
+    bills = len(expected[DOWNLOADS[1]])
+    print(f'{len(results)} downloads, {rows} CSV rows, {bills} bills per ZIP, {failures} failed')
+    return 1 if failures or not rows or not bills else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,251 @@
+"""In-process HTTP benchmark for the main Roomie Mart endpoints.
+
+Seeds a throwaway SQLite database, drives the app through Flask's test
+client (no server, no network) and reports per-endpoint latency
+percentiles, throughput and SQL statement counts as JSON.
+
+    python scripts/benchmark.py --iterations 200 --output bench.json
+    python scripts/benchmark.py --save-baseline scripts/bench_baseline.json
+    python scripts/benchmark.py --baseline scripts/bench_baseline.json   # exit 1 on regression
+"""
+import argparse
+import importlib.util
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+CATEGORIES = ['Electronics', 'Books', 'Furniture', 'Clothing', 'Kitchen', 'Sports', 'Other']
+CONDITIONS = ['New', 'Like New', 'Good', 'Fair', 'Poor']
+HOSTELS = ['A Hostel', 'B Hostel', 'SN PG', 'Vrinda PG']
+BLOCKS = ['A', 'B', 'C', 'D']
+
+
+def load_app(db_path, **config):
+    """Build the app from app.py against a scratch database (handles spaces in the path)"""
+    sys.path.insert(0, root)
+    spec = importlib.util.spec_from_file_location('app', os.path.join(root, 'app.py'))
+    module = importlib.util.module_from_spec(spec)
+    sys.modules['app'] = module
+    spec.loader.exec_module(module)
+    # One client replays every scenario in a tight loop: don't rate limit it, and
+    # don't answer its anonymous pages from the response cache, which would
+    # measure cache hits instead of the endpoints
+    return module.create_app({'DATABASE_PATH': db_path, 'TESTING': True, 'RATE_LIMIT_ENABLED': False,
+                              'RESPONSE_CACHE_ENABLED': False, **config})
+
+
+def seed(users, items, messages, orders, rng):
+    """Fill the scratch database; returns ids the scenarios need"""
+    from database.db_connection import get_db_connection
+    from werkzeug.security import generate_password_hash
+
+    password = generate_password_hash('benchmark')
+    start = datetime(2025, 1, 1)
+
+    def ts(i, total):
+        return (start + timedelta(seconds=int(300 * 86400 * i / max(total, 1)))).strftime('%Y-%m-%d %H:%M:%S')
+
+    conn = get_db_connection()
+    cur = conn.cursor()
+    cur.executemany(
+        'INSERT INTO users (name, email, password, phone, hostel, block, room, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [(f'User {u}', f'user{u}@bench.test', password, '9999999999', rng.choice(HOSTELS), rng.choice(BLOCKS),
+          str(100 + u % 50), ts(u, users)) for u in range(users)])
+    cur.executemany(
+        'INSERT INTO items (user_id, title, category, price, condition, description, hostel, block, status, created_at) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+        [(rng.randint(1, users), f'{rng.choice(CATEGORIES)} item {i}', rng.choice(CATEGORIES),
+          round(rng.uniform(50, 5000), 2), rng.choice(CONDITIONS), f'Benchmark listing number {i} in good shape',
+          rng.choice(HOSTELS), rng.choice(BLOCKS), 'sold' if rng.random() < 0.2 else 'available', ts(i, items))
+         for i in range(items)])
+
+    # User 1 is the logged-in benchmark user; item 1 belongs to user 2 and
+    # carries a long conversation between the two of them.
+    cur.execute("UPDATE items SET user_id = 2, status = 'available' WHERE id = 1")
+    rows = []
+    for m in range(messages):
+        if m % 4 == 0:
+            sender, receiver = (1, 2) if m % 8 == 0 else (2, 1)
+            item_id = 1
+        else:
+            sender, receiver = rng.randint(1, users), rng.randint(1, users)
+            item_id = rng.randint(1, items)
+        rows.append((sender, receiver, item_id, f'Message {m} about the listing', rng.random() < 0.7, ts(m, messages)))
+    cur.executemany('INSERT INTO messages (sender_id, receiver_id, item_id, content, is_read, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)', rows)
+
+    order_rows = []
+    for o in range(orders):
+        item_id = rng.randint(2, items)
+        buyer, seller = (1, rng.randint(2, users)) if o % 2 else (rng.randint(2, users), 1)
+        price = round(rng.uniform(50, 5000), 2)
+        order_rows.append((buyer, seller, item_id, f'Item {item_id}', price, 1, price, f'bench-{o}', ts(o, orders)))
+    cur.executemany('INSERT INTO orders (buyer_id, seller_id, item_id, item_title, price, quantity, total, '
+                    'transaction_ref, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', order_rows)
+    conn.commit()
+    order_id = conn.execute('SELECT id FROM orders WHERE buyer_id = 1 OR seller_id = 1 LIMIT 1').fetchone()[0]
+    buy_items = [r[0] for r in conn.execute(
+        "SELECT id FROM items WHERE status = 'available' AND user_id != 1 AND id != 1 LIMIT 1000")]
+    conn.close()
+    return {'order_id': order_id, 'buy_items': buy_items}
+
+
+def scenarios(ids):
+    """name -> (method, url or callable returning url, needs login)"""
+    buy_items = iter(ids['buy_items'] * 100)
+    return {
+        'index': ('GET', '/', False),
+        'marketplace': ('GET', '/marketplace', False),
+        'marketplace_filtered': ('GET', '/marketplace?category=Books&condition=Good&min_price=100&max_price=2000', False),
+        'search': ('GET', '/search?query=item+1&category=Books', False),
+        'item_detail': ('GET', '/item/1', True),
+        'api_items': ('GET', '/api/v1/items?limit=20&category=Books', False),
+        'inbox': ('GET', '/message/messages', True),
+        'conversation': ('GET', '/message/conversation/1/2', True),
+        'unread_count': ('GET', '/message/unread_count', True),
+        'analytics_category_distribution': ('GET', '/analytics/api/category_distribution', False),
+        'analytics_sold_vs_available': ('GET', '/analytics/api/sold_vs_available', False),
+        'analytics_monthly_orders': ('GET', '/analytics/api/monthly_orders', False),
+        'analytics_top_categories': ('GET', '/analytics/api/top_categories', False),
+        'analytics_user_growth': ('GET', '/analytics/api/user_growth', False),
+        'analytics_revenue': ('GET', '/analytics/api/revenue', False),
+        'analytics_summary': ('GET', '/analytics/api/summary', False),
+        'my_orders': ('GET', '/orders/my_orders', True),
+        'sales_history': ('GET', '/orders/sales_history', True),
+        'view_order': ('GET', f"/orders/{ids['order_id']}", True),
+        'download_order': ('GET', f"/orders/{ids['order_id']}/download", True),
+        'buy_item': ('POST', lambda: f'/orders/buy/{next(buy_items)}', True),
+    }
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[k]
+
+
+def run(app, ids, iterations, warmup, only=None):
+    from database import instrumentation
+
+    statements = [0]
+
+    def count_statement(sql):
+        statements[0] += 1
+
+    instrumentation.install()
+    instrumentation.add_trace_listener(count_statement)
+
+    results = {}
+    for name, (method, url, needs_login) in scenarios(ids).items():
+        if only and name not in only:
+            continue
+        client = app.test_client()
+        if needs_login:
+            with client.session_transaction() as sess:
+                sess['user_id'] = 1
+                sess['user_name'] = 'User 0'
+                sess['user_email'] = 'user0@bench.test'
+
+        def hit():
+            target = url() if callable(url) else url
+            response = client.open(target, method=method)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: {method} {target} -> {response.status_code}')
+            response.close()
+
+        for _ in range(warmup):
+            hit()
+
+        timings = []
+        statements[0] = 0
+        started = time.perf_counter()
+        for _ in range(iterations):
+            t0 = time.perf_counter()
+            hit()
+            timings.append((time.perf_counter() - t0) * 1000.0)
+        elapsed = time.perf_counter() - started
+
+        timings.sort()
+        results[name] = {
+            'p50_ms': round(percentile(timings, 50), 3),
+            'p95_ms': round(percentile(timings, 95), 3),
+            'p99_ms': round(percentile(timings, 99), 3),
+            'throughput_rps': round(iterations / elapsed, 1) if elapsed else None,
+            'sql_per_request': round(statements[0] / iterations, 2),
+        }
+    return results
+
+
+def compare(results, baseline, tolerance):
+    """Return human-readable regressions against a stored baseline"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get('endpoints', {}).get(name)
+        if not base:
+            continue
+        if current['p95_ms'] > base['p95_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: p95 {current['p95_ms']}ms vs baseline {base['p95_ms']}ms")
+        if current['sql_per_request'] > base['sql_per_request']:
+            regressions.append(f"{name}: {current['sql_per_request']} SQL/request vs baseline {base['sql_per_request']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--items', type=int, default=2000)
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--orders', type=int, default=500)
+    parser.add_argument('--iterations', type=int, default=100)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--only', help='Comma-separated endpoint names to run')
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    parser.add_argument('--baseline', help='Compare against this stored report')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed p95 slowdown vs baseline (0.25 = 25%%)')
+    parser.add_argument('--save-baseline', help='Store this run as the new baseline')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='roomie_bench_')
+    app = load_app(os.path.join(workdir, 'bench.db'))
+    app.config['BILL_CACHE_DIR'] = os.path.join(workdir, 'bills')
+    ids = seed(args.users, args.items, args.messages, args.orders, random.Random(args.seed))
+    only = set(args.only.split(',')) if args.only else None
+
+    report = {
+        'config': {k: getattr(args, k) for k in ('users', 'items', 'messages', 'orders', 'iterations', 'seed')},
+        'endpoints': run(app, ids, args.iterations, args.warmup, only),
+    }
+
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report['endpoints'], json.load(f), args.tolerance)
+        report['regressions'] = regressions
+
+    text = json.dumps(report, indent=2)
+    if args.save_baseline:
+        with open(args.save_baseline, 'w') as f:
+            f.write(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    for line in regressions:
+        print('REGRESSION ' + line, file=sys.stderr)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Overhead of the model change events (utils/events.py).
+
+  dispatch  publish() alone, --calls times, with no subscriber, with 1 and
+            5 no-op subscribers and with one subscriber that raises (its
+            error log is discarded)
+  writes    Item.update_item on a seeded scratch database (same seeding as
+            scripts/benchmark.py), --writes times with the subscribers the
+            app installs (response cache, metrics) and again with none
+
+Reports nanoseconds per publish() and per-write latency percentiles as JSON.
+
+    python scripts/events_benchmark.py --calls 200000 --writes 2000
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark  # noqa: E402  (seeding and app loading)
+
+
+def time_publish(events, calls):
+    """Nanoseconds per publish() call"""
+    publish = events.publish
+    started = time.perf_counter_ns()
+    for i in range(calls):
+        publish('order', 'created', i, ('status',))
+    return round((time.perf_counter_ns() - started) / calls, 1)
+
+
+def dispatch(events, calls):
+    saved = dict(events._subscribers)
+    events._subscribers.clear()
+    results = {'no_subscribers_ns': time_publish(events, calls)}
+
+    def noop(change):
+        pass
+
+    events.subscribe('order', noop)
+    results['1_subscriber_ns'] = time_publish(events, calls)
+    for _ in range(4):
+        events.subscribe('order', lambda change: None)
+    results['5_subscribers_ns'] = time_publish(events, calls)
+
+    events._subscribers.clear()
+
+    def broken(change):
+        raise RuntimeError('subscriber bug')
+
+    events.subscribe('order', broken)
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        results['failing_subscriber_ns'] = time_publish(events, max(1, calls // 100))
+
+    events._subscribers.clear()
+    events._subscribers.update(saved)
+    return results
+
+
+def time_writes(item_ids, writes, rng):
+    from models.item_model import Item
+
+    timings = []
+    for _ in range(writes):
+        item_id = rng.choice(item_ids)
+        t0 = time.perf_counter()
+        Item.update_item(item_id, f'Item {item_id}', 'Books', rng.randint(50, 5000), 'Good', None, 'Benchmark edit')
+        timings.append((time.perf_counter() - t0) * 1000.0)
+    timings.sort()
+    return {
+        'p50_ms': round(benchmark.percentile(timings, 50), 3),
+        'p95_ms': round(benchmark.percentile(timings, 95), 3),
+        'mean_ms': round(sum(timings) / len(timings), 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=200000, help='publish() calls per dispatch case')
+    parser.add_argument('--writes', type=int, default=1000, help='Item.update_item calls per write case')
+    parser.add_argument('--items', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='Write the JSON report here instead of stdout')
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='roomie_events_bench_')
+    # With the response cache, whose invalidation is one of the subscribers measured
+    app = benchmark.load_app(os.path.join(workdir, 'bench.db'), RESPONSE_CACHE_ENABLED=True)
+    benchmark.seed(20, args.items, 100, 20, random.Random(args.seed))
+    from utils import events
+
+    with app.app_context():
+        installed = {entity: [getattr(h, '__qualname__', repr(h)) for h in handlers]
+                     for entity, handlers in events._subscribers.items()}
+        item_ids = list(range(1, args.items + 1))
+        with_subscribers = time_writes(item_ids, args.writes, random.Random(args.seed))
+        saved = dict(events._subscribers)
+        events._subscribers.clear()
+        without = time_writes(item_ids, args.writes, random.Random(args.seed))
+        events._subscribers.update(saved)
+
+    report = {
+        'config': {k: getattr(args, k) for k in ('calls', 'writes', 'items', 'seed')},
+        'subscribers': installed,
+        'dispatch': dispatch(events, args.calls),
+        'writes': {
+            'with_app_subscribers': with_subscribers,
+            'without_subscribers': without,
+            'overhead_ms': round(with_subscribers['mean_ms'] - without['mean_ms'], 3),
+        },
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
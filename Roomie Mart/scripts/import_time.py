@@ -0,0 +1,72 @@
+"""Measure app startup: `import app` and `create_app()` in fresh interpreters.
+
+Each run starts a new `python -X importtime` process, so nothing is cached in
+sys.modules between runs. Reports the median wall time of the import and of
+building the app, and the slowest modules by cumulative import time from the
+last run. Use it to check that startup stays cheap:
+
+    python scripts/import_time.py --runs 10
+    python scripts/import_time.py --eager   # compare with LAZY_BLUEPRINTS off
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+root = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+PROBE = '''
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+app.create_app({"DATABASE_PATH": sys.argv[1], "LAZY_BLUEPRINTS": sys.argv[2] == "lazy"})
+t2 = time.perf_counter()
+print(json.dumps({"import_ms": (t1 - t0) * 1000, "create_app_ms": (t2 - t1) * 1000,
+                  "modules": len(sys.modules)}))
+'''
+
+
+def parse_importtime(stderr, top):
+    """(cumulative_us, module) for the slowest entries of -X importtime"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative_us, name = line.split('|')
+        rows.append((int(cumulative_us), name.strip()))
+    rows.sort(reverse=True)
+    return rows[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15, help='How many slow modules to list')
+    parser.add_argument('--eager', action='store_true', help='Register every blueprint eagerly')
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='roomie_import_'), 'import.db')
+    mode = 'eager' if args.eager else 'lazy'
+    results, stderr = [], ''
+    for _ in range(args.runs):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE, db_path, mode],
+                              cwd=root, capture_output=True, text=True, check=True)
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+        stderr = proc.stderr
+
+    print(json.dumps({
+        'mode': mode,
+        'runs': args.runs,
+        'import_ms_median': round(statistics.median(r['import_ms'] for r in results), 2),
+        'create_app_ms_median': round(statistics.median(r['create_app_ms'] for r in results), 2),
+        'modules_loaded': results[-1]['modules'],
+        'slowest_imports_us': [[name, us] for us, name in parse_importtime(stderr, args.top)],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
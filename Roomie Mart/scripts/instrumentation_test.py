@@ -0,0 +1,48 @@
+"""Statement listeners see every way of running SQL (database/instrumentation.py).
+
+Builds the app against a scratch database and runs one statement each through
+conn.execute(), conn.executemany() and conn.cursor().execute(), checking that
+each reaches a statement listener with its connection.
+
+    python scripts/instrumentation_test.py
+"""
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import benchmark  # noqa: E402  (app loading)
+
+
+def main():
+    workdir = tempfile.mkdtemp(prefix='roomie_instrumentation_')
+    benchmark.load_app(os.path.join(workdir, 'instrumentation.db'))
+
+    from database import instrumentation
+    from database.db_connection import get_db_connection
+
+    seen = []
+    instrumentation.add_statement_listener(lambda sql, params, seconds, conn: seen.append((sql, conn)))
+
+    conn = get_db_connection()
+    checks = [
+        ('SELECT 1', lambda: conn.execute('SELECT 1').fetchall()),
+        ('SELECT 2', lambda: conn.cursor().execute('SELECT 2').fetchall()),
+        ('CREATE TEMP TABLE t (x)', lambda: conn.execute('CREATE TEMP TABLE t (x)')),
+        ('INSERT INTO t VALUES (?)', lambda: conn.executemany('INSERT INTO t VALUES (?)', [(1,), (2,)])),
+    ]
+    failures = 0
+    for sql, run in checks:
+        del seen[:]
+        run()
+        if (sql, conn) not in seen:
+            failures += 1
+            print(f'FAIL {sql!r} never reached a statement listener')
+    conn.close()
+
+    print(f'{len(checks)} statements, {failures} missed')
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
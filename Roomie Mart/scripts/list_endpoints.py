@@ -11,7 +11,8 @@ app_module = importlib.util.module_from_spec(spec)
 sys.modules['app'] = app_module
 sys.path.insert(0, root)
 spec.loader.exec_module(app_module)
-app = app_module.app
+# Only the route table is needed: don't touch the database
+app = app_module.create_app({'INIT_DB': False})
 
 # Print sorted endpoints and rules
 endpoints = sorted([(r.endpoint, r.rule) for r in app.url_map.iter_rules()])
@@ -0,0 +1,188 @@
+"""On-disk render cache for order bills.
+
+A completed order never changes, so its bill is rendered once and kept on
+disk keyed by order id and a hash of the bill templates. Editing a template
+changes the version and old entries are simply never read again (they age
+out through the size bound). Orders that are not completed are rendered on
+every request and never stored.
+
+The size bound is enforced every PRUNE_EVERY stores per process (pruning
+scans the whole directory), so the cache can run over it by that much.
+"""
+import hashlib
+import io
+import itertools
+import json
+import os
+import uuid
+import zipfile
+from flask import current_app
+from markupsafe import Markup
+from models.order_model import Order
+
+BILL_TEMPLATES = ('_order_bill_body.html', 'order_bill_document.html')
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'cache', 'bills')
+DEFAULT_MAX_ENTRIES = 5000
+PRUNE_EVERY = 100
+# Orders whose bills are fetched with one query when building a ZIP
+ZIP_BATCH = 200
+
+_template_version = None
+_stores = itertools.count(1)
+
+
+def template_version():
+    """Short hash of the bill template sources (computed once per process)"""
+    global _template_version
+    if _template_version is None:
+        digest = hashlib.sha1()
+        for name in BILL_TEMPLATES:
+            source, _, _ = current_app.jinja_loader.get_source(current_app.jinja_env, name)
+            digest.update(source.encode('utf-8'))
+        _template_version = digest.hexdigest()[:12]
+    return _template_version
+
+
+def cache_dir():
+    path = current_app.config.get('BILL_CACHE_DIR', DEFAULT_CACHE_DIR)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def render_bill(order):
+    """Render the cacheable parts of a bill for an order row"""
+    order = dict(order)
+    # Render straight from the Jinja env: the bill must not depend on the request,
+    # and skipping render_template also skips the per-request context processors.
+    env = current_app.jinja_env
+    fragment = env.get_template('_order_bill_body.html').render(order=order)
+    document = env.get_template('order_bill_document.html').render(order=order, bill_html=Markup(fragment))
+    return {
+        'id': order['id'],
+        'buyer_id': order['buyer_id'],
+        'seller_id': order['seller_id'],
+        'status': order['status'],
+        'fragment': fragment,
+        'document': document,
+        'etag': hashlib.sha256(document.encode('utf-8')).hexdigest(),
+    }
+
+
+def entry_path(order_id):
+    return os.path.join(cache_dir(), f'{order_id}-{template_version()}.json')
+
+
+def load_cached(order_id):
+    """The stored bill for an order, or None"""
+    path = entry_path(order_id)
+    try:
+        with open(path, encoding='utf-8') as f:
+            bill = json.load(f)
+        # Refresh mtime so pruning drops the least recently used entries first
+        os.utime(path)
+        return bill
+    except (OSError, ValueError):
+        return None
+
+
+def bill_for_order(order):
+    """Render the bill for an order row, storing it if the order is completed"""
+    bill = render_bill(order)
+    if bill['status'] == 'completed':
+        store(entry_path(bill['id']), bill)
+    return bill
+
+
+def get_bill(order_id):
+    """Return the rendered bill for an order (from disk when possible), or None"""
+    bill = load_cached(order_id)
+    if bill:
+        return bill
+    order = Order.get_order_by_id(order_id)
+    if not order:
+        return None
+    return bill_for_order(order)
+
+
+def store(path, bill):
+    # Write to a unique temp file and rename so readers never see a partial entry
+    tmp = f'{path}.{uuid.uuid4().hex}.tmp'
+    try:
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(bill, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        print(f"[bill_cache] could not store {path}: {e}")
+        return
+    if next(_stores) % PRUNE_EVERY == 0:
+        prune()
+
+
+def prune():
+    """Keep at most BILL_CACHE_MAX_ENTRIES files, removing the least recently used"""
+    limit = current_app.config.get('BILL_CACHE_MAX_ENTRIES', DEFAULT_MAX_ENTRIES)
+    directory = cache_dir()
+    try:
+        entries = [e for e in os.scandir(directory) if e.name.endswith('.json')]
+    except OSError:
+        return
+    if len(entries) <= limit:
+        return
+    entries.sort(key=lambda e: e.stat().st_mtime)
+    for entry in entries[:len(entries) - limit]:
+        try:
+            os.remove(entry.path)
+        except OSError:
+            pass
+
+
+class _ZipSink(io.RawIOBase):
+    """Write-only, unseekable sink that hands written bytes back to a generator.
+
+    zipfile falls back to data descriptors when the target cannot seek, which
+    is what lets an archive be streamed without ever holding it in memory.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._pos
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def get_bills(order_ids):
+    """Bills for a list of order ids, in order: cached ones from disk, the rest from one query"""
+    bills = {order_id: load_cached(order_id) for order_id in order_ids}
+    missing = [order_id for order_id, bill in bills.items() if bill is None]
+    for order in Order.get_orders_by_ids(missing):
+        bills[order['id']] = bill_for_order(order)
+    return [bills[order_id] for order_id in order_ids if bills[order_id]]
+
+
+def stream_bills_zip(order_ids):
+    """Yield a ZIP archive of bill documents chunk by chunk (one bill at a time)"""
+    sink = _ZipSink()
+    order_ids = iter(order_ids)
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as zf:
+        while True:
+            batch = list(itertools.islice(order_ids, ZIP_BATCH))
+            if not batch:
+                break
+            for bill in get_bills(batch):
+                zf.writestr(f"order_{bill['id']}_bill.html", bill['document'])
+                yield sink.drain()
+    yield sink.drain()
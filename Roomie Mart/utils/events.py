@@ -0,0 +1,84 @@
+"""In-process change events published by the model write methods.
+
+Every write method publishes one Change after its transaction commits:
+
+    Item.update_item(...)  ->  Change('item', 'updated', 7, ('title', 'price', ...))
+
+Anything that keeps derived state (caches, counters, indexes) subscribes
+instead of being called from the models by hand:
+
+    @events.subscriber('item')
+    def on_item_change(change): ...
+
+Subscribers run synchronously on the writing thread, in subscription order,
+and must be quick; slow work belongs in a background job (utils/jobs.py).
+A subscriber that raises is logged and counted in
+roomie_event_errors_total, and the write and the other subscribers carry on
+as if nothing happened. With no subscriber for an entity, publish() returns
+after one dict lookup (scripts/events_benchmark.py measures the overhead).
+
+Events only reach the process that made the write; subscribers that must
+see writes of other processes read a change log too (see item_changes and
+utils/response_cache.py).
+"""
+import threading
+import traceback
+from typing import NamedTuple, Tuple
+
+from utils import metrics
+
+ENTITIES = ('item', 'message', 'order', 'request', 'feedback')
+ACTIONS = ('created', 'updated', 'deleted')
+ALL = '*'
+
+metrics.registry.register('roomie_event_errors_total', 'counter',
+                          'Change event subscribers that raised, by entity and subscriber.')
+
+
+class Change(NamedTuple):
+    entity: str  # one of ENTITIES
+    action: str  # one of ACTIONS
+    id: int
+    fields: Tuple[str, ...] = ()  # columns written; () when deleted
+
+
+# entity (or ALL) -> tuple of subscribers; replaced, never mutated, so publish() needs no lock
+_subscribers = {}
+_lock = threading.Lock()
+
+
+def subscribe(entity, handler):
+    """Call handler(change) after every write to `entity` (ALL for every entity)"""
+    if entity != ALL and entity not in ENTITIES:
+        raise ValueError(f'unknown entity {entity!r}')
+    with _lock:
+        _subscribers[entity] = _subscribers.get(entity, ()) + (handler,)
+    return handler
+
+
+def unsubscribe(entity, handler):
+    with _lock:
+        _subscribers[entity] = tuple(h for h in _subscribers.get(entity, ()) if h is not handler)
+
+
+def subscriber(entity):
+    """Decorator form of subscribe()"""
+    def decorator(handler):
+        return subscribe(entity, handler)
+    return decorator
+
+
+def publish(entity, action, entity_id, fields=()):
+    """Tell the subscribers of `entity` that a committed write changed row entity_id"""
+    handlers = _subscribers.get(entity, ()) + _subscribers.get(ALL, ())
+    if not handlers:
+        return
+    change = Change(entity, action, entity_id, tuple(fields))
+    for handler in handlers:
+        try:
+            handler(change)
+        except Exception as e:
+            name = getattr(handler, '__qualname__', repr(handler))
+            print(f"[events] {name} failed on {entity} {action} #{entity_id}: {e}")
+            traceback.print_exc()
+            metrics.registry.inc('roomie_event_errors_total', (('entity', entity), ('subscriber', name)))
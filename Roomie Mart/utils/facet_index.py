@@ -0,0 +1,245 @@
+"""In-memory bitmap index behind the marketplace facet counts.
+
+Every available item is one bit (its id) in a Python int per facet value
+(category, condition, hostel, block) and per price bucket. Counts for the
+current filter set are then a few big-int ANDs and bit_count() calls instead
+of one GROUP BY scan per facet. Each facet is counted with every filter
+applied except its own, so the sidebar shows what picking another value in
+that facet would give.
+
+The index is loaded once per process on first use. Triggers on `items` bump
+a per-item version in `item_changes` (see init_item_change_log), and every
+lookup first applies the items written since the version it has seen, so
+writes from any process or worker show up on the next request.
+"""
+import math
+import threading
+from bisect import bisect_right
+from array import array
+from collections import OrderedDict
+
+from database import db_connection
+from models.item_model import Item
+
+FACETS = ('category', 'condition', 'hostel', 'block')
+# Lower edges of the price histogram buckets (the last one is open-ended)
+PRICE_EDGES = (0, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000)
+# More pending changes than this and a full reload is cheaper than patching
+RELOAD_THRESHOLD = 5000
+PRICE_RANGE_CACHE_SIZE = 32
+
+
+def price_bucket(price):
+    """Index into PRICE_EDGES of the bucket holding `price`, or None for no price"""
+    if price is None or math.isnan(price):
+        return None
+    return max(bisect_right(PRICE_EDGES, price) - 1, 0)
+
+
+def bitmap(ids, nbits):
+    """Python int with the bits in `ids` set"""
+    buf = bytearray((nbits + 7) // 8)
+    for i in ids:
+        buf[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(buf, 'little')
+
+
+def bits(mask):
+    """Positions of the set bits of `mask`, ascending"""
+    data = mask.to_bytes((mask.bit_length() + 7) // 8, 'little')
+    for offset, byte in enumerate(data):
+        if byte:
+            for bit in range(8):
+                if byte >> bit & 1:
+                    yield offset * 8 + bit
+
+
+class FacetIndex:
+    """Facet and price-bucket bitmaps over the available items"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.version = None
+        self.database_path = None
+        self._clear()
+
+    def _clear(self):
+        self.available = 0
+        self.values = {facet: [None] for facet in FACETS}  # code -> value (0 is NULL)
+        self.codes = {facet: {} for facet in FACETS}  # value -> code
+        self.masks = {facet: [0] for facet in FACETS}  # code -> bitmap
+        self.item_codes = {facet: array('I') for facet in FACETS}  # item id -> code
+        self.prices = array('d')  # item id -> price (NaN for none)
+        self.buckets = [0] * len(PRICE_EDGES)
+        self._price_ranges = OrderedDict()
+
+    def _code(self, facet, value):
+        code = self.codes[facet].get(value)
+        if code is None:
+            if value is None:
+                return 0
+            code = self.codes[facet][value] = len(self.values[facet])
+            self.values[facet].append(value)
+            self.masks[facet].append(0)
+        return code
+
+    def _grow(self, item_id):
+        missing = item_id + 1 - len(self.prices)
+        if missing > 0:
+            for facet in FACETS:
+                self.item_codes[facet].extend([0] * missing)
+            self.prices.extend([math.nan] * missing)
+
+    def refresh(self):
+        """Bring the index up to date with the database"""
+        with self._lock:
+            if self.version is None or self.database_path != db_connection.DATABASE_PATH:
+                self._load()
+                return
+            changes = Item.get_facet_changes(self.version, RELOAD_THRESHOLD + 1)
+            if len(changes) > RELOAD_THRESHOLD:
+                self._load()
+                return
+            for change in changes:
+                self._remove(change['item_id'])
+                if change['status'] == 'available':
+                    self._add(change['item_id'], change)
+                self.version = change['version']
+            if changes:
+                self._price_ranges.clear()
+
+    def _load(self):
+        self.database_path = db_connection.DATABASE_PATH
+        version, items = Item.get_facet_snapshot()
+        self._clear()
+        nbits = max((row['id'] for row in items), default=0) + 1
+        self._grow(nbits - 1)
+        ids = {facet: {} for facet in FACETS}  # facet -> code -> member ids
+        bucket_ids = [[] for _ in PRICE_EDGES]
+        for position, facet in enumerate(FACETS, start=1):
+            codes, members = self.item_codes[facet], ids[facet]
+            for row in items:
+                code = self._code(facet, row[position])
+                codes[row[0]] = code
+                members.setdefault(code, []).append(row[0])
+        for row in items:
+            price = row[5]
+            if price is not None:
+                self.prices[row[0]] = price
+                bucket_ids[price_bucket(price)].append(row[0])
+        for facet in FACETS:
+            for code, members in ids[facet].items():
+                self.masks[facet][code] = bitmap(members, nbits)
+        self.buckets = [bitmap(members, nbits) for members in bucket_ids]
+        self.available = bitmap((row['id'] for row in items), nbits)
+        self.version = version
+
+    def _remove(self, item_id):
+        bit = 1 << item_id
+        if not self.available & bit:
+            return
+        self.available &= ~bit
+        for facet in FACETS:
+            code = self.item_codes[facet][item_id]
+            self.masks[facet][code] &= ~bit
+        bucket = price_bucket(self.prices[item_id])
+        if bucket is not None:
+            self.buckets[bucket] &= ~bit
+
+    def _add(self, item_id, row):
+        bit = 1 << item_id
+        self._grow(item_id)
+        self.available |= bit
+        for facet in FACETS:
+            code = self._code(facet, row[facet])
+            self.item_codes[facet][item_id] = code
+            self.masks[facet][code] |= bit
+        price = row['price']
+        self.prices[item_id] = math.nan if price is None else price
+        bucket = price_bucket(price)
+        if bucket is not None:
+            self.buckets[bucket] |= bit
+
+    def _price_mask(self, min_price, max_price):
+        """Items priced within [min_price, max_price] (either bound may be None)"""
+        key = (min_price, max_price)
+        mask = self._price_ranges.get(key)
+        if mask is not None:
+            self._price_ranges.move_to_end(key)
+            return mask
+        low = -math.inf if min_price is None else min_price
+        high = math.inf if max_price is None else max_price
+        mask = 0
+        for bucket in range(len(PRICE_EDGES)):
+            # The first bucket also holds anything below PRICE_EDGES[0]
+            start = PRICE_EDGES[bucket] if bucket else -math.inf
+            end = PRICE_EDGES[bucket + 1] if bucket + 1 < len(PRICE_EDGES) else math.inf
+            if start >= low and end <= high:
+                mask |= self.buckets[bucket]
+            elif start <= high and end > low:
+                # Bucket straddles a bound: check its items' prices one by one
+                inside = [i for i in bits(self.buckets[bucket]) if low <= self.prices[i] <= high]
+                mask |= bitmap(inside, len(self.prices))
+        self._price_ranges[key] = mask
+        if len(self._price_ranges) > PRICE_RANGE_CACHE_SIZE:
+            self._price_ranges.popitem(last=False)
+        return mask
+
+    def facet_counts(self, category=None, condition=None, hostel=None, block=None, min_price=None,
+                     max_price=None, top=None):
+        """Counts per facet value and per price bucket for a filter set.
+
+        Takes the same filters as Item.get_filtered_items. Returns
+        {'total': n, 'category': [{'value', 'count'}, ...], ..., 'price':
+        [{'min', 'max', 'count'}, ...]}; facet values are ordered by count and
+        cut to the `top` most common when given.
+        """
+        self.refresh()
+        selected = {'category': category, 'condition': condition, 'hostel': hostel, 'block': block}
+        with self._lock:
+            filters = {}
+            for facet, value in selected.items():
+                if value:
+                    code = self.codes[facet].get(value)
+                    filters[facet] = self.masks[facet][code] if code else 0
+            if min_price is not None or max_price is not None:
+                filters['price'] = self._price_mask(min_price, max_price)
+
+            def matching(skip=None):
+                mask = self.available
+                for name, filter_mask in filters.items():
+                    if name != skip:
+                        mask &= filter_mask
+                return mask
+
+            result = {'total': matching().bit_count(), 'version': self.version}
+            for facet in FACETS:
+                base = matching(skip=facet)
+                counts = []
+                for code in range(1, len(self.values[facet])):
+                    count = (base & self.masks[facet][code]).bit_count()
+                    if count:
+                        counts.append({'value': self.values[facet][code], 'count': count})
+                counts.sort(key=lambda entry: (-entry['count'], str(entry['value'])))
+                result[facet] = counts[:top] if top else counts
+            base = matching(skip='price')
+            result['price'] = [
+                {'min': start,
+                 'max': PRICE_EDGES[bucket + 1] if bucket + 1 < len(PRICE_EDGES) else None,
+                 'count': (base & self.buckets[bucket]).bit_count()}
+                for bucket, start in enumerate(PRICE_EDGES)
+            ]
+        return result
+
+
+_index = FacetIndex()
+
+
+def get_index():
+    """The process-wide FacetIndex"""
+    return _index
+
+
+def facet_counts(**filters):
+    """Shortcut for get_index().facet_counts(...)"""
+    return _index.facet_counts(**filters)
@@ -0,0 +1,42 @@
+"""Cached rating summaries (count, average, histogram) for feedback browsing.
+
+Feedback rows are only ever inserted, with increasing ids, so a summary for
+a filter set stays exact if we remember the highest id it covers and add the
+ratings of newer rows on the next call: one MAX(id) lookup plus a rowid
+range read of whatever arrived since, instead of re-aggregating the whole
+history. Each process keeps its own small LRU of summaries.
+"""
+import threading
+from collections import OrderedDict
+
+from database import db_connection
+from models.feedback_model import Feedback
+
+CACHE_SIZE = 256
+
+_cache = OrderedDict()  # (database, seller_id, item_id, rating) -> (max_id, {rating: count})
+_lock = threading.Lock()
+
+
+def summary(seller_id=None, item_id=None, rating=None):
+    """{'count', 'average', 'histogram': [{'rating', 'count'}, ...5..1]} for a filter set"""
+    filters = (seller_id or None, item_id or None, rating or None)
+    key = (db_connection.DATABASE_PATH,) + filters
+    with _lock:
+        after_id, counts = _cache.get(key, (0, {}))
+    new_counts, max_id = Feedback.get_rating_counts(*filters, after_id=after_id)
+    counts = {r: counts.get(r, 0) + new_counts.get(r, 0) for r in range(1, 6)}
+    with _lock:
+        # Another thread may have moved further meanwhile; keep whichever covers more
+        if key not in _cache or _cache[key][0] <= max_id:
+            _cache[key] = (max_id, counts)
+        _cache.move_to_end(key)
+        while len(_cache) > CACHE_SIZE:
+            _cache.popitem(last=False)
+
+    total = sum(counts.values())
+    return {
+        'count': total,
+        'average': round(sum(r * c for r, c in counts.items()) / total, 2) if total else None,
+        'histogram': [{'rating': r, 'count': counts[r]} for r in range(5, 0, -1)],
+    }
@@ -0,0 +1,72 @@
+import base64
+import json
+import hashlib
+from flask import Response, g, request, session
+
+# orjson is an optional fast path for JSON encoding; fall back to the stdlib
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps_json(obj):
+    """Serialize obj to compact UTF-8 JSON bytes (orjson when installed)"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str)
+    return json.dumps(obj, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def json_response(payload, status=200):
+    """Build a JSON response with a strong ETag so clients can revalidate cheaply.
+
+    Answers 304 Not Modified when the request's If-None-Match matches the body.
+    """
+    body = dumps_json(payload)
+    response = Response(body, status=status, mimetype='application/json')
+    if status == 200:
+        response.set_etag(hashlib.sha1(body).hexdigest())
+        response.headers['Cache-Control'] = 'no-cache'
+        response.make_conditional(request)
+    return response
+
+
+def encode_cursor(row):
+    """Opaque cursor for the (created_at, id) of the last row on a page"""
+    raw = f"{row['created_at']}|{row['id']}".encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor"""
+    padded = cursor + '=' * (-len(cursor) % 4)
+    created_at, _, row_id = base64.urlsafe_b64decode(padded.encode('ascii')).decode('utf-8').rpartition('|')
+    if not created_at:
+        raise ValueError('bad cursor')
+    return created_at, int(row_id)
+
+
+def pending_request_count():
+    """Pending purchase requests on the logged-in user's items (the navbar badge), once per request"""
+    if 'pending_requests_count' not in g:
+        from models.request_model import RequestModel
+        user_id = session.get('user_id')
+        count = 0
+        if user_id:
+            try:
+                count = RequestModel.count_pending_requests_for_owner(user_id)
+            except Exception:
+                count = 0
+        g.pending_requests_count = count
+    return g.pending_requests_count
+
+
+def positive_int_arg(name, maximum=None):
+    """request.args[name] as an int in 1..maximum, or None if missing or invalid"""
+    try:
+        value = int(request.args.get(name, ''))
+    except ValueError:
+        return None
+    if value < 1 or (maximum is not None and value > maximum):
+        return None
+    return value
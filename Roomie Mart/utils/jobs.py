@@ -0,0 +1,331 @@
+"""Durable background jobs stored in SQLite (`jobs` / `job_schedules` tables).
+
+Handlers register by name (built-in ones live in utils/tasks.py):
+
+    @jobs.handler('messages.notify')
+    def notify(sender_id, receiver_id, item_id, content): ...
+
+and a request hands work off with one INSERT:
+
+    jobs.defer('messages.notify', sender_id=..., receiver_id=..., ...)
+
+defer() queues the job when JOBS_ENABLED is set (some runner is working the
+queue) and otherwise just runs the handler in the request, as before.
+
+A JobRunner claims one job at a time per pool slot with a single UPDATE ...
+RETURNING, which hands the row a lease (JOBS_LEASE seconds, renewed by a
+heartbeat while the handler runs), so several processes can work the same
+queue without running anything twice. A job whose worker died is picked up
+again once its lease runs out. Failures are retried with exponential backoff
+up to the job's max_attempts. Periodic jobs come from JOBS_SCHEDULE ('every'
+seconds or a five-field 'cron' expression); the runner that moves a
+schedule's due time forward is the one that enqueues the run.
+
+`flask roomie serve` starts a runner in each worker when JOBS_ENABLED is
+set; otherwise run `flask roomie jobs work` next to the app. JOBS_POOL =
+'process' runs handlers in a process pool (for CPU-heavy work), each child
+with its own app built from the parent's config.
+"""
+import json
+import os
+import random
+import socket
+import threading
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+import multiprocessing
+
+from flask import current_app
+
+from models.job_model import Job
+
+DEFAULT_LEASE = 300
+POLL_INTERVAL = 1.0
+SCHEDULE_TICK = 15.0  # seconds between schedule checks per runner
+BACKOFF_BASE = 30  # seconds before the first retry; doubles per attempt
+BACKOFF_MAX = 3600
+
+# schedule name -> {'job', 'every' | 'cron', 'payload'}
+DEFAULT_SCHEDULE = {
+    'similar-items': {'job': 'similar.refresh', 'every': 900},
+    'analytics-snapshot': {'job': 'analytics.snapshot', 'every': 300},
+    'message-archive': {'job': 'messages.archive', 'cron': '0 4 * * *'},
+    'db-maintain': {'job': 'db.maintain', 'cron': '30 3 * * *'},
+    'jobs-cleanup': {'job': 'jobs.cleanup', 'cron': '15 * * * *'},
+}
+
+HANDLERS = {}
+
+
+class Handler:
+    __slots__ = ('name', 'func', 'max_attempts')
+
+    def __init__(self, name, func, max_attempts):
+        self.name = name
+        self.func = func
+        self.max_attempts = max_attempts
+
+
+def handler(name, max_attempts=5):
+    """Register the decorated function as the handler of job `name`"""
+    def decorator(func):
+        HANDLERS[name] = Handler(name, func, max_attempts)
+        return func
+    return decorator
+
+
+def load_handlers():
+    # Built-in handlers register themselves on import
+    import utils.tasks  # noqa: F401
+    return HANDLERS
+
+
+def enqueue(name, payload=None, delay=0, priority=0):
+    """Queue job `name` to run in `delay` seconds; returns its id"""
+    registered = load_handlers().get(name)
+    if registered is None:
+        raise KeyError(f'no job handler named {name!r}')
+    return Job.enqueue(name, payload, delay=delay, priority=priority, max_attempts=registered.max_attempts)
+
+
+def defer(name, **payload):
+    """Hand work to the job queue, or run it right away when no runner is configured"""
+    if current_app.config.get('JOBS_ENABLED'):
+        return enqueue(name, payload)
+    try:
+        load_handlers()[name].func(**payload)
+    except Exception as e:
+        # Keep it for whenever a runner works the queue
+        print(f"[jobs] {name} failed inline, queued for retry: {e}")
+        return enqueue(name, payload)
+    return None
+
+
+def backoff(attempts):
+    """Seconds before retry number `attempts`, with jitter"""
+    delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempts - 1))
+    return delay * random.uniform(0.8, 1.2)
+
+
+class CronSchedule:
+    """Five-field cron expression (minute hour day-of-month month day-of-week)"""
+
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f'cron expression needs 5 fields: {expression!r}')
+        parsed = [self._field(text, low, high) for text, (low, high) in zip(fields, self.RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}  # 7 is Sunday too
+        # Like cron: when both day fields are restricted, either one matching is enough
+        self.any_day = fields[2] == '*' or fields[4] == '*'
+
+    @staticmethod
+    def _field(text, low, high):
+        values = set()
+        for part in text.split(','):
+            part, _, step = part.partition('/')
+            if part == '*':
+                start, end = low, high
+            elif '-' in part:
+                start, end = (int(v) for v in part.split('-', 1))
+            else:
+                start = end = int(part)
+                if step:
+                    end = high
+            if not low <= start <= end <= high:
+                raise ValueError(f'cron field out of range: {text!r}')
+            values.update(range(start, end + 1, int(step or 1)))
+        return values
+
+    def _day_matches(self, when):
+        in_month = when.day in self.days
+        in_week = (when.weekday() + 1) % 7 in self.weekdays
+        return in_month and in_week if self.any_day else in_month or in_week
+
+    def next_after(self, when):
+        """First matching minute after `when`"""
+        when = when.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = when + timedelta(days=366 * 5)
+        while when < limit:
+            if when.month not in self.months:
+                month = when.month % 12 + 1
+                when = when.replace(year=when.year + (month == 1), month=month, day=1, hour=0, minute=0)
+            elif not self._day_matches(when):
+                when = (when + timedelta(days=1)).replace(hour=0, minute=0)
+            elif when.hour not in self.hours:
+                when = (when + timedelta(hours=1)).replace(minute=0)
+            elif when.minute not in self.minutes:
+                when += timedelta(minutes=1)
+            else:
+                return when
+        raise ValueError('cron expression never matches')
+
+
+def next_run(entry, after):
+    """Unix time the schedule entry is next due after unix time `after`"""
+    if entry.get('cron'):
+        return CronSchedule(entry['cron']).next_after(datetime.fromtimestamp(after)).timestamp()
+    return after + float(entry['every'])
+
+
+def _process_config(config):
+    """The picklable part of an app's config, for building the app again in a pool process"""
+    simple = (str, int, float, bool, type(None), list, tuple, dict, set, frozenset)
+    return {key: value for key, value in config.items() if isinstance(value, simple)}
+
+
+_process_app = None
+
+
+def _run_in_process(config, name, payload):
+    global _process_app
+    if _process_app is None:
+        from app import create_app
+        _process_app = create_app({**config, 'INIT_DB': False, 'METRICS_ENABLED': False})
+    with _process_app.app_context():
+        return load_handlers()[name].func(**payload)
+
+
+class JobRunner:
+    """Works the queue with `workers` threads, running handlers on threads or in a process pool"""
+
+    def __init__(self, app, workers=2, pool='thread', lease=DEFAULT_LEASE, schedule=None,
+                 poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.workers = workers
+        self.lease = lease
+        self.schedule = DEFAULT_SCHEDULE if schedule is None else schedule
+        self.poll_interval = poll_interval
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+        self.processes = None
+        if pool == 'process':
+            self.processes = ProcessPoolExecutor(max_workers=workers,
+                                                 mp_context=multiprocessing.get_context('spawn'))
+        self._stop = threading.Event()
+        self._threads = []
+        self._running = {}  # job id -> worker id holding it
+        self._lock = threading.Lock()
+        self._next_tick = 0.0
+
+    def start(self):
+        load_handlers()
+        for entry in self.schedule.values():
+            next_run(entry, time.time())  # fail fast on a bad cron expression
+        for n in range(self.workers):
+            thread = threading.Thread(target=self._work, args=(f'{self.worker_id}:{n}',),
+                                      name=f'jobs-{n}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        heartbeat = threading.Thread(target=self._heartbeat, name='jobs-heartbeat', daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+        return self
+
+    def stop(self, timeout=30):
+        """Stop claiming and wait up to `timeout` seconds for running jobs"""
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        if self.processes is not None:
+            self.processes.shutdown(wait=False, cancel_futures=True)
+
+    def _work(self, worker_id):
+        while not self._stop.is_set():
+            try:
+                self._tick_schedules()
+                job = Job.claim(worker_id, self.lease)
+            except Exception as e:
+                print(f"[jobs] could not claim a job: {e}")
+                job = None
+            if job is None:
+                self._stop.wait(self.poll_interval)
+                continue
+            self.run(job, worker_id)
+
+    def run(self, job, worker_id):
+        registered = HANDLERS.get(job['name'])
+        if registered is None:
+            Job.finish(job['id'], worker_id, 'failed', error=f"no handler named {job['name']!r}")
+            return
+        if job['attempts'] > job['max_attempts']:
+            # Its lease kept running out: whatever ran it died every time
+            Job.finish(job['id'], worker_id, 'failed', error='lease expired on every attempt')
+            return
+        with self._lock:
+            self._running[job['id']] = worker_id
+        started = time.perf_counter()
+        try:
+            payload = json.loads(job['payload'])
+            if self.processes is not None:
+                self.processes.submit(_run_in_process, _process_config(self.app.config),
+                                      job['name'], payload).result()
+            else:
+                with self.app.app_context():
+                    registered.func(**payload)
+        except Exception as e:
+            error = f'{type(e).__name__}: {e}'
+            if job['attempts'] < job['max_attempts']:
+                delay = backoff(job['attempts'])
+                print(f"[jobs] {job['name']} #{job['id']} failed (attempt {job['attempts']}), "
+                      f"retrying in {delay:.0f}s: {error}")
+                status = Job.finish(job['id'], worker_id, 'queued', error=error, retry_in=delay)
+            else:
+                print(f"[jobs] {job['name']} #{job['id']} failed for good: {error}")
+                traceback.print_exc()
+                status = Job.finish(job['id'], worker_id, 'failed', error=error)
+        else:
+            status = Job.finish(job['id'], worker_id, 'done')
+            print(f"[jobs] {job['name']} #{job['id']} done in {time.perf_counter() - started:.2f}s")
+        finally:
+            with self._lock:
+                self._running.pop(job['id'], None)
+        if not status:
+            print(f"[jobs] {job['name']} #{job['id']}: lease was lost, another worker took the job over")
+
+    def _heartbeat(self):
+        while not self._stop.wait(self.lease / 3):
+            with self._lock:
+                running = dict(self._running)
+            for worker_id in set(running.values()):
+                try:
+                    Job.renew_leases([i for i, w in running.items() if w == worker_id], worker_id, self.lease)
+                except Exception as e:
+                    print(f"[jobs] could not renew leases: {e}")
+        # Stopping: leave the leases to the threads still finishing their jobs
+
+    def _tick_schedules(self):
+        now = time.time()
+        with self._lock:
+            if now < self._next_tick or not self.schedule:
+                return
+            self._next_tick = now + SCHEDULE_TICK
+        known = Job.get_schedules()
+        missing = {name: next_run(entry, now) if entry.get('cron') else now
+                   for name, entry in self.schedule.items() if name not in known}
+        if missing:
+            Job.add_schedules(missing)
+            known = Job.get_schedules()
+        for name, entry in self.schedule.items():
+            due = known[name]['next_run_at']
+            if due <= now:
+                # Skip runs missed while nothing was running instead of catching up
+                following = next_run(entry, max(due, now))
+                # An unknown handler still gets queued, so run() records why it failed
+                registered = HANDLERS.get(entry['job'])
+                Job.claim_schedule(name, entry['job'], entry.get('payload'), due, following,
+                                   max_attempts=registered.max_attempts if registered else 5)
+
+
+def start_runner(app):
+    """Start a JobRunner configured from app.config (JOBS_WORKERS, JOBS_POOL, JOBS_LEASE, JOBS_SCHEDULE)"""
+    return JobRunner(app,
+                     workers=app.config.get('JOBS_WORKERS', 2),
+                     pool=app.config.get('JOBS_POOL', 'thread'),
+                     lease=app.config.get('JOBS_LEASE', DEFAULT_LEASE),
+                     schedule=app.config.get('JOBS_SCHEDULE')).start()
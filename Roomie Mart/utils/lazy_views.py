@@ -0,0 +1,52 @@
+"""Blueprints whose controller module is only imported on first use.
+
+The URL rules are declared up front (so url_for() and the route table work
+immediately), but each view is a LazyView that imports its function the
+first time a matching request comes in:
+
+    lazy_blueprint('reports_bp', 'controllers.reports_controller', [
+        ('/analytics', 'analytics_dashboard'),
+        ('/feedback', 'feedback', ['GET', 'POST']),
+    ])
+
+Endpoint names stay '<blueprint>.<function>', exactly as the eager blueprint
+in the controller module would register them.
+"""
+from flask import Blueprint
+from werkzeug.utils import import_string
+
+
+class LazyView:
+    """Stand-in view function that imports the real one on first call"""
+
+    def __init__(self, import_name):
+        self.import_name = import_name
+        self.__name__ = import_name.rpartition('.')[2]
+        self._view = None
+
+    @property
+    def view(self):
+        if self._view is None:
+            self._view = import_string(self.import_name)
+        return self._view
+
+    def __call__(self, *args, **kwargs):
+        return self.view(*args, **kwargs)
+
+    def __getattr__(self, name):
+        # Attributes set by decorators (e.g. query_budget) become visible once
+        # the view has been loaded; before that, don't import just to look.
+        view = self.__dict__.get('_view')
+        if view is None:
+            raise AttributeError(name)
+        return getattr(view, name)
+
+
+def lazy_blueprint(name, module, routes):
+    """Blueprint with rules for `module`'s views, imported on first request"""
+    bp = Blueprint(name, module)
+    for route in routes:
+        rule, func = route[0], route[1]
+        methods = route[2] if len(route) > 2 else None
+        bp.add_url_rule(rule, func, LazyView(f'{module}.{func}'), methods=methods)
+    return bp
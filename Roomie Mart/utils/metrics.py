@@ -0,0 +1,211 @@
+"""Per-endpoint request and SQL metrics.
+
+init_app(app) turns on SQL instrumentation (database/instrumentation.py),
+times every request, adds a Server-Timing header and serves everything
+collected so far in Prometheus text format at /metrics. Metrics live in
+process memory, so each worker process reports its own numbers.
+
+/metrics answers 404 unless the app is in debug mode, METRICS_PAGE is set,
+or the request carries `Authorization: Bearer <METRICS_TOKEN>` (what a
+Prometheus scrape job sends with its bearer_token setting).
+"""
+import hmac
+import threading
+from time import perf_counter
+
+from flask import Response, abort, current_app, request
+
+from database import instrumentation
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help)
+METRICS = {
+    'roomie_requests_total': ('counter', 'HTTP requests by endpoint, method and status.'),
+    'roomie_request_duration_seconds': ('histogram', 'Request latency by endpoint.'),
+    'roomie_sql_statements_total': ('counter', 'SQL statements run by SQLite (incl. BEGIN/COMMIT) by endpoint.'),
+    'roomie_sql_seconds_total': ('counter', 'Time spent executing and fetching SQL by endpoint.'),
+    'roomie_model_changes_total': ('counter', 'Committed model writes by entity and action (utils/events.py).'),
+}
+
+
+class MetricsRegistry:
+    """Thread-safe counters and histograms keyed by metric name and label tuple"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def inc(self, name, labels, value=1):
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[labels] = series.get(labels, 0) + value
+
+    def observe(self, name, labels, value):
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            h = series.get(labels)
+            if h is None:
+                # per-bucket counts, then sum and count
+                h = series[labels] = [0] * len(LATENCY_BUCKETS) + [0.0, 0]
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if value <= bound:
+                    h[i] += 1
+                    break
+            h[-2] += value
+            h[-1] += 1
+
+    def register(self, name, kind, help_text):
+        METRICS.setdefault(name, (kind, help_text))
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            histograms = {n: {k: list(v) for k, v in s.items()} for n, s in self._histograms.items()}
+        lines = []
+        for name, (kind, help_text) in METRICS.items():
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            if kind == 'histogram':
+                for labels, h in sorted(histograms.get(name, {}).items()):
+                    cumulative = 0
+                    for bound, count in zip(LATENCY_BUCKETS, h):
+                        cumulative += count
+                        lines.append(f'{name}_bucket{_labels(labels, le=bound)} {cumulative}')
+                    lines.append(f'{name}_bucket{_labels(labels, le="+Inf")} {h[-1]}')
+                    lines.append(f'{name}_sum{_labels(labels)} {h[-2]:.6f}')
+                    lines.append(f'{name}_count{_labels(labels)} {h[-1]}')
+            else:
+                for labels, value in sorted(counters.get(name, {}).items()):
+                    lines.append(f'{name}{_labels(labels)} {value:.6f}' if isinstance(value, float)
+                                 else f'{name}{_labels(labels)} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _labels(pairs, **extra):
+    items = list(pairs) + list(extra.items())
+    if not items:
+        return ''
+    escaped = (f'{k}="{_escape(v)}"' for k, v in items)
+    return '{' + ','.join(escaped) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+registry = MetricsRegistry()
+
+
+class RequestStats:
+    __slots__ = ('started', 'statements', 'sql_seconds')
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.statements = 0
+        self.sql_seconds = 0.0
+
+
+_local = threading.local()
+
+
+def current_stats():
+    """Stats for the request being handled on this thread, or None"""
+    return getattr(_local, 'stats', None)
+
+
+def _on_trace(sql):
+    stats = current_stats()
+    if stats is not None:
+        stats.statements += 1
+    else:
+        registry.inc('roomie_sql_statements_total', (('endpoint', '<background>'),))
+
+
+def _on_statement(sql, params, seconds, conn):
+    stats = current_stats()
+    if stats is not None:
+        stats.sql_seconds += seconds
+    else:
+        registry.inc('roomie_sql_seconds_total', (('endpoint', '<background>'),), seconds)
+
+
+def _on_change(change):
+    registry.inc('roomie_model_changes_total', (('entity', change.entity), ('action', change.action)))
+
+
+def _start_request():
+    _local.stats = RequestStats()
+
+
+def run_with_stats(stats, fn, *args):
+    """fn(*args) with its SQL counted towards `stats`, for request work done on another thread"""
+    _local.stats = stats
+    try:
+        return fn(*args)
+    finally:
+        _local.stats = None
+
+
+def record_request(endpoint, method, status, stats):
+    """Add a finished request to the registry; returns its duration in seconds"""
+    elapsed = perf_counter() - stats.started
+    labels = (('endpoint', endpoint),)
+    registry.inc('roomie_requests_total', labels + (('method', method), ('status', status)))
+    registry.observe('roomie_request_duration_seconds', labels, elapsed)
+    registry.inc('roomie_sql_statements_total', labels, stats.statements)
+    registry.inc('roomie_sql_seconds_total', labels, stats.sql_seconds)
+    return elapsed
+
+
+def _finish_request(response):
+    stats = current_stats()
+    if stats is None:
+        return response
+    elapsed = record_request(request.endpoint or '<unmatched>', request.method, response.status_code, stats)
+    response.headers.add('Server-Timing', f'app;dur={elapsed * 1000:.2f}')
+    response.headers.add('Server-Timing', f'sql;dur={stats.sql_seconds * 1000:.2f};desc="{stats.statements} statements"')
+    return response
+
+
+def _clear_request(exc=None):
+    _local.stats = None
+
+
+def scrape_allowed():
+    if current_app.debug or current_app.config.get('METRICS_PAGE'):
+        return True
+    token = current_app.config.get('METRICS_TOKEN')
+    if not token:
+        return False
+    scheme, _, given = request.headers.get('Authorization', '').partition(' ')
+    return scheme.lower() == 'bearer' and hmac.compare_digest(given.strip().encode(), token.encode())
+
+
+def metrics_view():
+    if not scrape_allowed():
+        abort(404)
+    return Response(registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+_listeners_added = False
+
+
+def init_app(app):
+    """Instrument SQL, time requests and expose /metrics"""
+    global _listeners_added
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    instrumentation.install()
+    if not _listeners_added:
+        from utils import events
+        instrumentation.add_trace_listener(_on_trace)
+        instrumentation.add_statement_listener(_on_statement)
+        events.subscribe(events.ALL, _on_change)
+        _listeners_added = True
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_clear_request)
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -0,0 +1,106 @@
+"""Debug/test-mode N+1 detection and per-route query budgets.
+
+When the app runs with debug or TESTING (or QUERY_INSPECTOR=True), every
+statement executed while handling a request is recorded and grouped by its
+normalized shape. Shapes repeated QUERY_REPEAT_THRESHOLD times or more are
+logged as likely N+1 patterns. Views can declare a ceiling:
+
+    @item_bp.route('/marketplace')
+    @query_budget(2)
+    def marketplace(): ...
+
+Going over budget raises QueryBudgetExceeded under TESTING (so the test
+fails) and logs a warning otherwise.
+"""
+import threading
+from collections import Counter
+
+from flask import current_app, request
+
+from database import instrumentation
+from database.instrumentation import normalize_sql
+
+DEFAULT_REPEAT_THRESHOLD = 3
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """A view ran more SQL statements than its @query_budget allows"""
+
+
+def query_budget(max_statements):
+    """Declare the most SQL statements a view may run per request"""
+    def decorator(view):
+        view.query_budget = max_statements
+        return view
+    return decorator
+
+
+def current_statements():
+    """Statements recorded so far for the request on this thread (or None)"""
+    return getattr(_local, 'statements', None)
+
+
+def _on_statement(sql, params, seconds, conn):
+    statements = current_statements()
+    if statements is not None:
+        statements.append(sql)
+
+
+def _enabled():
+    setting = current_app.config.get('QUERY_INSPECTOR')
+    if setting is None:
+        return current_app.debug or current_app.testing
+    return setting
+
+
+def _start_request():
+    if _enabled():
+        _local.statements = []
+
+
+def _check_request(response):
+    statements = current_statements()
+    if statements is None:
+        return response
+    _local.statements = None
+
+    shapes = Counter(normalize_sql(sql) for sql in statements)
+    threshold = current_app.config.get('QUERY_REPEAT_THRESHOLD', DEFAULT_REPEAT_THRESHOLD)
+    repeated = {shape: n for shape, n in shapes.items() if n >= threshold}
+    for shape, n in repeated.items():
+        current_app.logger.warning('Possible N+1 on %s %s: %d x %s', request.method, request.path, n, shape)
+
+    response.headers['X-Query-Count'] = str(len(statements))
+    if repeated:
+        response.headers['X-Query-Repeats'] = str(sum(repeated.values()))
+
+    view = current_app.view_functions.get(request.endpoint)
+    budget = getattr(view, 'query_budget', None)
+    if budget is not None and len(statements) > budget:
+        message = (f'{request.endpoint} ran {len(statements)} SQL statements (budget {budget}): '
+                   + '; '.join(f'{n} x {shape}' for shape, n in shapes.most_common()))
+        if current_app.testing:
+            raise QueryBudgetExceeded(message)
+        current_app.logger.warning(message)
+    return response
+
+
+def _clear_request(exc=None):
+    _local.statements = None
+
+
+_listener_added = False
+
+
+def init_app(app):
+    """Record statements per request when running in debug/test mode"""
+    global _listener_added
+    instrumentation.install()
+    if not _listener_added:
+        instrumentation.add_statement_listener(_on_statement)
+        _listener_added = True
+    app.before_request(_start_request)
+    app.after_request(_check_request)
+    app.teardown_request(_clear_request)
@@ -0,0 +1,286 @@
+"""Token-bucket rate limiting and load shedding for write and expensive routes.
+
+Each rule groups endpoints (or whole blueprints) and gives every client its
+own bucket per group: `burst` tokens, refilled at `rate` per second, one
+token per request. A client is the logged-in user, or the remote address for
+anonymous requests and for rules keyed by 'ip' (login/register, where the
+user is not known yet). An empty bucket answers 429 with Retry-After set to
+when the next token is due.
+
+Rules with `max_concurrent` also cap how many requests of that group a
+process works on at once; past that the request is shed with 503 and
+Retry-After: 1 rather than queueing behind slow full-scan SQL.
+
+Buckets live in process memory by default, so each worker enforces its own
+limits. RATE_LIMIT_STORAGE='sqlite' keeps them in a small side database
+(RATE_LIMIT_DB, next to the main one by default) shared by every worker on
+the host; if that database fails the request is let through. Override or
+extend the rules with app.config['RATE_LIMITS'] (group -> dict like
+DEFAULT_RULES, or None to drop a group); RATE_LIMIT_ENABLED=False turns the
+whole thing off. Rejections are counted in roomie_rate_limited_total.
+"""
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import Response, current_app, g, jsonify, request, session
+
+from utils import metrics
+
+DEFAULT_RULES = {
+    'auth': {
+        'endpoints': ('auth_bp.login', 'auth_bp.register'),
+        'methods': ('POST',),
+        'key': 'ip',
+        'rate': 10 / 60,
+        'burst': 5,
+    },
+    'messages': {
+        'endpoints': ('message_bp.send_message', 'item_bp.send_request', 'requests_bp.create_request'),
+        'methods': ('POST',),
+        'key': 'user',
+        'rate': 30 / 60,
+        'burst': 10,
+    },
+    'search': {
+        'endpoints': ('item_bp.search',),
+        'key': 'user',
+        'rate': 1,
+        'burst': 20,
+        'max_concurrent': 8,
+    },
+    'analytics': {
+        'blueprints': ('reports_bp',),
+        'key': 'user',
+        'rate': 2,
+        'burst': 30,
+        'max_concurrent': 4,
+    },
+    # Unread badge and open conversations; asgi.py applies this to its native handlers too
+    'polling': {
+        'endpoints': ('message_bp.unread_count', 'message_bp.conversation_updates'),
+        'methods': ('GET',),
+        'key': 'user',
+        'rate': 1,
+        'burst': 20,
+    },
+}
+
+# The memory store forgets its least recently used buckets past this many
+MAX_MEMORY_KEYS = 50000
+# The SQLite store drops buckets idle this long (every default rule refills well within it)
+SQLITE_PRUNE_AGE = 3600
+SQLITE_PRUNE_EVERY = 1000
+
+metrics.registry.register('roomie_rate_limited_total', 'counter',
+                          'Requests rejected by rate limiting (429) or load shedding (503) by group.')
+
+
+class MemoryStore:
+    """Token buckets in this process's memory"""
+
+    def __init__(self, max_keys=MAX_MEMORY_KEYS):
+        self._lock = threading.Lock()
+        self._buckets = OrderedDict()  # key -> (tokens, updated), least recently used first
+        self._max_keys = max_keys
+
+    def take(self, key, rate, burst):
+        """Take one token from `key`'s bucket; seconds until one is available, 0 if taken"""
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(key)
+            tokens = burst if bucket is None else min(burst, bucket[0] + (now - bucket[1]) * rate)
+            allowed = tokens >= 1
+            if allowed:
+                tokens -= 1
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            if len(self._buckets) > self._max_keys:
+                # Idle the longest, so almost certainly refilled: forgetting it changes nothing
+                self._buckets.popitem(last=False)
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class SQLiteStore:
+    """Token buckets in a SQLite file shared by every worker process on the host"""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        self._takes = 0
+        # Create the table up front, but don't keep the connection: the app may
+        # be built in a `flask roomie serve` master that forks afterwards
+        self._connect().close()
+
+    def _connect(self):
+        # Plain sqlite3 on purpose: these statements aren't app queries and
+        # must not count towards metrics or @query_budget
+        conn = sqlite3.connect(self.path, timeout=1.0, isolation_level=None, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=OFF')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            ) WITHOUT ROWID
+        ''')
+        return conn
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+        return conn
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        conn = self._connection()
+        # One atomic statement: refill for the time elapsed, then take a token if there is one
+        tokens, allowed = conn.execute('''
+            INSERT INTO rate_buckets (key, tokens, updated, allowed) VALUES (:key, :burst - 1, :now, 1)
+            ON CONFLICT (key) DO UPDATE SET
+                tokens = MIN(:burst, tokens + MAX(0, :now - updated) * :rate)
+                         - (MIN(:burst, tokens + MAX(0, :now - updated) * :rate) >= 1),
+                allowed = MIN(:burst, tokens + MAX(0, :now - updated) * :rate) >= 1,
+                updated = :now
+            RETURNING tokens, allowed
+        ''', {'key': key, 'burst': burst, 'rate': rate, 'now': now}).fetchone()
+        self._takes += 1
+        if self._takes % SQLITE_PRUNE_EVERY == 0:
+            conn.execute('DELETE FROM rate_buckets WHERE updated < ?', (now - SQLITE_PRUNE_AGE,))
+        return 0 if allowed else (1 - tokens) / rate
+
+
+class RateLimiter:
+    """Matches requests to rules, takes tokens and tracks in-flight requests per group"""
+
+    def __init__(self, rules, store):
+        self.rules = rules
+        self.store = store
+        self.by_endpoint = {}
+        self.by_blueprint = {}
+        for group, rule in rules.items():
+            for endpoint in rule.get('endpoints', ()):
+                self.by_endpoint[endpoint] = group
+            for blueprint in rule.get('blueprints', ()):
+                self.by_blueprint[blueprint] = group
+        self._lock = threading.Lock()
+        self._in_flight = dict.fromkeys(rules, 0)
+
+    def group_for(self, endpoint, blueprint, method):
+        group = self.by_endpoint.get(endpoint) or self.by_blueprint.get(blueprint)
+        if group is None:
+            return None
+        methods = self.rules[group].get('methods')
+        if methods and method not in methods:
+            return None
+        return group
+
+    def enter(self, group):
+        """Count a request in; False if the group is already at max_concurrent"""
+        limit = self.rules[group].get('max_concurrent')
+        with self._lock:
+            if limit and self._in_flight[group] >= limit:
+                return False
+            self._in_flight[group] += 1
+            return True
+
+    def leave(self, group):
+        with self._lock:
+            self._in_flight[group] -= 1
+
+    def admit(self, group, client):
+        """Take a token and count the request in: None if admitted (leave() when done),
+        else (status, retry_after, reason) for the rejection"""
+        rule = self.rules[group]
+        try:
+            wait = self.store.take(f'{group}:{client}', rule['rate'], rule['burst'])
+        except sqlite3.Error as e:
+            print(f"[rate_limit] bucket store failed, letting request through: {e}")
+            wait = 0
+        if wait:
+            return 429, wait, 'rate'
+        if not self.enter(group):
+            return 503, 1, 'shed'
+        return None
+
+
+def client_key(user_id, remote_addr):
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{remote_addr}'
+
+
+def count_rejection(group, reason):
+    metrics.registry.inc('roomie_rate_limited_total', (('group', group), ('reason', reason)))
+
+
+def rejection_payload(status):
+    message = 'Too many requests, please slow down.' if status == 429 else 'Server busy, please try again shortly.'
+    return {'error': 'rate_limited' if status == 429 else 'overloaded', 'message': message}
+
+
+def retry_after_header(retry_after):
+    return str(max(1, math.ceil(retry_after)))
+
+
+def reject(group, status, retry_after, reason):
+    count_rejection(group, reason)
+    payload = rejection_payload(status)
+    wants_json = ('/api/' in request.path
+                  or request.accept_mimetypes.best_match(['text/html', 'application/json']) == 'application/json')
+    if wants_json:
+        response = jsonify(payload)
+        response.status_code = status
+    else:
+        response = Response(payload['message'], status=status, mimetype='text/plain')
+    response.headers['Retry-After'] = retry_after_header(retry_after)
+    return response
+
+
+def _check_request():
+    limiter = current_app.extensions['rate_limit']
+    group = limiter.group_for(request.endpoint, request.blueprint, request.method)
+    if group is None:
+        return None
+    user_id = session.get('user_id') if limiter.rules[group].get('key', 'user') == 'user' else None
+    rejected = limiter.admit(group, client_key(user_id, request.remote_addr))
+    if rejected:
+        return reject(group, *rejected)
+    g.rate_limit_group = group
+    return None
+
+
+def _finish_request(exc=None):
+    group = g.pop('rate_limit_group', None)
+    if group is not None:
+        current_app.extensions['rate_limit'].leave(group)
+
+
+def build_rules(overrides):
+    rules = {group: dict(rule) for group, rule in DEFAULT_RULES.items()}
+    for group, rule in (overrides or {}).items():
+        if rule is None:
+            rules.pop(group, None)
+        else:
+            rules[group] = {**rules.get(group, {}), **rule}
+    return rules
+
+
+def init_app(app):
+    """Apply the rate limits in app.config (RATE_LIMITS, RATE_LIMIT_STORAGE, RATE_LIMIT_DB)"""
+    if not app.config.get('RATE_LIMIT_ENABLED', True):
+        return
+    if app.config.get('RATE_LIMIT_STORAGE', 'memory') == 'sqlite':
+        path = app.config.get('RATE_LIMIT_DB') or os.path.splitext(app.config['DATABASE_PATH'])[0] + '_rate_limits.db'
+        store = SQLiteStore(path)
+    else:
+        store = MemoryStore()
+    app.extensions['rate_limit'] = RateLimiter(build_rules(app.config.get('RATE_LIMITS')), store)
+    app.before_request(_check_request)
+    app.teardown_request(_finish_request)
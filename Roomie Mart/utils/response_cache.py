@@ -0,0 +1,221 @@
+"""Whole-response cache for pages every logged-out visitor sees the same way.
+
+GET / , /marketplace and /item/<id> from a visitor without a session user
+(and without pending flash messages) are answered from process memory when
+the same path and query string (parameters sorted, blank ones dropped) was
+rendered before. The view, its SQL and the template are skipped; a hit costs
+a dict lookup.
+
+Entries carry tags: 'listings' for pages listing items, 'item:<id>' for an
+item's page. Item change events (utils/events.py) invalidate the tags a
+write touches in this process right away. Writes made by other processes
+(serve workers, CLI commands, jobs) reach the cache through the
+item_changes log that utils/facet_index.py reads as well: at most every
+SYNC_INTERVAL seconds a lookup reads the items written since the last look
+and drops their tags. Entries also expire after RESPONSE_CACHE_TTL seconds,
+which bounds how long things outside that log (seller ratings, similar
+items, images) can be stale.
+
+The cache is an LRU bounded by RESPONSE_CACHE_MAX_BYTES of response bodies
+per process. RESPONSE_CACHE_ENABLED=False turns it off. Lookups are counted
+in roomie_response_cache_total.
+"""
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlencode
+
+from flask import Response, current_app, g, request, session
+
+from database import db_connection
+from utils import events, metrics
+
+DEFAULT_MAX_BYTES = 32 * 1024 * 1024
+DEFAULT_TTL = 60
+SYNC_INTERVAL = 1.0
+# More item changes than this since the last look and everything is dropped
+SYNC_LIMIT = 500
+
+# endpoint -> function(view_args) returning the entry's tags
+CACHEABLE = {
+    'index': lambda args: ('listings',),
+    'item_bp.marketplace': lambda args: ('listings',),
+    'item_bp.item_detail': lambda args: (f"item:{args['item_id']}",),
+}
+
+metrics.registry.register('roomie_response_cache_total', 'counter',
+                          'Anonymous page lookups in the response cache by endpoint and result.')
+
+
+class ResponseCache:
+    """LRU of rendered responses, with tag invalidation"""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (body, status, content_type, tags, expires)
+        self._tags = {}  # tag -> set of keys
+        self._invalidated = {}  # tag -> generation of its last invalidation
+        self.generation = 0
+        self._lock = threading.Lock()
+        self.version = None  # item_changes version applied so far
+        self.synced_at = 0.0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[4] < time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key, body, status, content_type, tags, ttl, since):
+        """Store a response rendered from a lookup at generation `since`, unless its tags changed meanwhile"""
+        if len(body) > self.max_bytes // 4:
+            return False
+        with self._lock:
+            if any(self._invalidated.get(tag, 0) > since for tag in tags):
+                return False
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (body, status, content_type, tags, time.monotonic() + ttl)
+            self.size += len(body)
+            for tag in tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+            return True
+
+    def invalidate(self, *tags):
+        with self._lock:
+            self.generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self.generation
+                for key in self._tags.pop(tag, ()):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            for tag in self._tags:
+                self._invalidated[tag] = self.generation
+            self._entries.clear()
+            self._tags.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        body, _, _, tags, _ = self._entries.pop(key)
+        self.size -= len(body)
+        for tag in tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+    def __len__(self):
+        return len(self._entries)
+
+
+# One cache per database file (tests and benchmarks build several apps)
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(database=None, max_bytes=DEFAULT_MAX_BYTES):
+    database = database or db_connection.DATABASE_PATH
+    with _caches_lock:
+        cache = _caches.get(database)
+        if cache is None:
+            cache = _caches[database] = ResponseCache(max_bytes)
+        return cache
+
+
+def invalidate(*tags):
+    """Drop cached pages carrying any of `tags`"""
+    get_cache().invalidate(*tags)
+
+
+@events.subscriber('item')
+def on_item_change(change):
+    # A new item only shows up in listings; anything else also changes its own page
+    if change.action == 'created':
+        invalidate('listings')
+    else:
+        invalidate('listings', f'item:{change.id}')
+
+
+def sync(cache):
+    """Apply item writes made by other processes since the last look (at most every SYNC_INTERVAL)"""
+    from models.item_model import Item
+
+    now = time.monotonic()
+    if now - cache.synced_at < SYNC_INTERVAL:
+        return
+    cache.synced_at = now
+    if cache.version is None:
+        cache.version = Item.get_change_version()
+        return
+    changes = Item.get_facet_changes(cache.version, SYNC_LIMIT)
+    if len(changes) == SYNC_LIMIT:
+        cache.clear()
+        cache.version = Item.get_change_version()
+    elif changes:
+        cache.invalidate('listings', *(f"item:{row['item_id']}" for row in changes))
+        cache.version = changes[-1]['version']
+
+
+def cache_key():
+    args = sorted((name, value) for name, value in request.args.items(multi=True) if value.strip())
+    return f'{request.path}?{urlencode(args)}'
+
+
+def _lookup():
+    tags_for = CACHEABLE.get(request.endpoint)
+    if tags_for is None or request.method != 'GET' or 'user_id' in session or '_flashes' in session:
+        return None
+    cache = get_cache()
+    try:
+        sync(cache)
+    except Exception as e:
+        # Can't tell what other processes changed: don't serve or store anything
+        print(f"[response_cache] could not read item changes: {e}")
+        return None
+    key = cache_key()
+    entry = cache.get(key)
+    if entry is None:
+        metrics.registry.inc('roomie_response_cache_total', (('endpoint', request.endpoint), ('result', 'miss')))
+        g.response_cache = (cache, key, tags_for(request.view_args), cache.generation)
+        return None
+    metrics.registry.inc('roomie_response_cache_total', (('endpoint', request.endpoint), ('result', 'hit')))
+    body, status, content_type, _, _ = entry
+    response = Response(body, status=status, content_type=content_type)
+    response.headers['X-Cache'] = 'HIT'
+    return response
+
+
+def _store(response):
+    pending = g.pop('response_cache', None)
+    if pending is None:
+        return response
+    cache, key, tags, since = pending
+    # Only plain pages that didn't touch the session (no cookie, no flash consumed)
+    if (response.status_code == 200 and not response.is_streamed and not session.modified
+            and 'Set-Cookie' not in response.headers):
+        cache.put(key, response.get_data(), response.status_code, response.content_type, tags,
+                  current_app.config.get('RESPONSE_CACHE_TTL', DEFAULT_TTL), since)
+    response.headers['X-Cache'] = 'MISS'
+    return response
+
+
+def init_app(app):
+    """Serve anonymous GETs of CACHEABLE endpoints from memory (RESPONSE_CACHE_* settings)"""
+    if not app.config.get('RESPONSE_CACHE_ENABLED', True):
+        return
+    get_cache(app.config['DATABASE_PATH'],
+              app.config.get('RESPONSE_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+    app.before_request(_lookup)
+    app.after_request(_store)
@@ -0,0 +1,154 @@
+"""TF-IDF vectors and top-K cosine neighbours for "similar items" (NumPy).
+
+Each item becomes a sparse TF-IDF vector over the words of its title
+(counted TITLE_WEIGHT times), its description and a `category:<name>` term,
+L2-normalised so a dot product is the cosine similarity. Vectors are kept in
+CSR form (indptr, indices, data); nearest() densifies a block of query rows
+and one corpus block at a time, restricted to the terms the query block
+actually uses, so memory stays bounded however many items there are and the
+work is a series of small matrix multiplications.
+
+Used by `flask roomie similar` (commands/similar.py); nothing here touches the
+database.
+"""
+import re
+from collections import Counter
+
+import numpy as np
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+STOPWORDS = frozenset('''
+    a an and are as at be by for from has have i in is it its my of on or so the this to
+    was were with you your very only used use can will all any one just also
+'''.split())
+TITLE_WEIGHT = 2
+MIN_DF = 2  # a term only one item uses can't make two items similar
+MAX_FEATURES = 20000
+MIN_SCORE = 0.05
+QUERY_BLOCK = 256
+CORPUS_BLOCK = 8192
+
+
+def tokens(title, description, category):
+    """Term counts for one item"""
+    counts = Counter()
+    for text, weight in ((title, TITLE_WEIGHT), (description, 1)):
+        for word in TOKEN_RE.findall((text or '').lower()):
+            if len(word) > 1 and not word.isdigit() and word not in STOPWORDS:
+                counts[word] += weight
+    if category:
+        counts['category:' + category.lower()] += 1
+    return counts
+
+
+class TfidfMatrix:
+    """L2-normalised TF-IDF rows in CSR form; row i belongs to item ids[i]"""
+
+    def __init__(self, ids, indptr, indices, data, n_terms):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.data = data
+        self.n_terms = n_terms
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _entries(self, positions):
+        """(row in `positions`, flat index into indices/data) for every stored entry"""
+        starts = self.indptr[positions]
+        lengths = self.indptr[positions + 1] - starts
+        rows = np.repeat(np.arange(len(positions)), lengths)
+        offsets = np.arange(lengths.sum()) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        return rows, np.repeat(starts, lengths) + offsets
+
+    def terms(self, positions):
+        """Sorted term ids used by the rows at `positions`"""
+        _, flat = self._entries(positions)
+        return np.unique(self.indices[flat])
+
+    def dense(self, positions, column_of, width):
+        """Rows at `positions` as a float32 array; term t goes to column column_of[t] (-1 drops it)"""
+        rows, flat = self._entries(positions)
+        columns = column_of[self.indices[flat]]
+        keep = columns >= 0
+        out = np.zeros((len(positions), width), dtype=np.float32)
+        out[rows[keep], columns[keep]] = self.data[flat[keep]]
+        return out
+
+
+def build_matrix(docs, min_df=MIN_DF, max_features=MAX_FEATURES):
+    """TfidfMatrix for (item_id, title, description, category) rows"""
+    ids, rows, cols, counts = [], [], [], []
+    vocabulary = {}
+    for position, (item_id, title, description, category) in enumerate(docs):
+        ids.append(item_id)
+        for term, count in tokens(title, description, category).items():
+            rows.append(position)
+            cols.append(vocabulary.setdefault(term, len(vocabulary)))
+            counts.append(count)
+    n_docs = len(ids)
+    rows = np.array(rows, dtype=np.int64)
+    cols = np.array(cols, dtype=np.int64)
+    counts = np.array(counts, dtype=np.float64)
+
+    # Keep the max_features most widespread terms that at least min_df items share
+    df = np.bincount(cols, minlength=len(vocabulary))
+    kept = np.nonzero(df >= min_df)[0]
+    if len(kept) > max_features:
+        kept = kept[np.argsort(-df[kept], kind='stable')[:max_features]]
+        kept.sort()
+    column_of = np.full(len(vocabulary), -1, dtype=np.int64)
+    column_of[kept] = np.arange(len(kept))
+    keep = column_of[cols] >= 0
+    rows, cols, counts = rows[keep], column_of[cols[keep]], counts[keep]
+
+    idf = np.log((1 + n_docs) / (1 + df[kept])) + 1
+    data = (1 + np.log(counts)) * idf[cols]
+    norms = np.sqrt(np.bincount(rows, weights=data * data, minlength=n_docs))
+    data /= norms[rows]
+    indptr = np.zeros(n_docs + 1, dtype=np.int64)
+    np.cumsum(np.bincount(rows, minlength=n_docs), out=indptr[1:])
+    return TfidfMatrix(np.array(ids, dtype=np.int64), indptr, cols, data.astype(np.float32), len(kept))
+
+
+def nearest(matrix, query_positions, k, min_score=MIN_SCORE, column_best=None,
+            query_block=QUERY_BLOCK, corpus_block=CORPUS_BLOCK):
+    """Yield (position, [(neighbour position, score), ...]) best first for each query row.
+
+    At most k neighbours scoring at least min_score; a row is never its own
+    neighbour. If column_best (float32, one slot per row of the matrix) is
+    given, it is raised to the best score any query row reached against each
+    corpus row.
+    """
+    query_positions = np.asarray(query_positions, dtype=np.int64)
+    n = len(matrix)
+    for start in range(0, len(query_positions), query_block):
+        positions = query_positions[start:start + query_block]
+        terms = matrix.terms(positions)
+        column_of = np.full(matrix.n_terms, -1, dtype=np.int64)
+        column_of[terms] = np.arange(len(terms))
+        queries = matrix.dense(positions, column_of, len(terms))
+
+        best_scores = np.full((len(positions), k), -1.0, dtype=np.float32)
+        best = np.full((len(positions), k), -1, dtype=np.int64)
+        for corpus_start in range(0, n, corpus_block):
+            corpus = np.arange(corpus_start, min(n, corpus_start + corpus_block))
+            scores = queries @ matrix.dense(corpus, column_of, len(terms)).T
+            inside = (positions >= corpus_start) & (positions < corpus_start + len(corpus))
+            scores[np.nonzero(inside)[0], positions[inside] - corpus_start] = -1.0
+            if column_best is not None:
+                seen = column_best[corpus_start:corpus_start + len(corpus)]
+                np.maximum(seen, scores.max(axis=0), out=seen)
+            candidates = np.concatenate([best_scores, scores], axis=1)
+            candidate_ids = np.concatenate([best, np.broadcast_to(corpus, scores.shape)], axis=1)
+            top = np.argpartition(-candidates, k - 1, axis=1)[:, :k]
+            best_scores = np.take_along_axis(candidates, top, axis=1)
+            best = np.take_along_axis(candidate_ids, top, axis=1)
+
+        order = np.argsort(-best_scores, axis=1, kind='stable')
+        best_scores = np.take_along_axis(best_scores, order, axis=1)
+        best = np.take_along_axis(best, order, axis=1)
+        for row, position in enumerate(positions):
+            yield int(position), [(int(best[row, i]), float(best_scores[row, i]))
+                                  for i in range(k) if best_scores[row, i] >= min_score]
@@ -0,0 +1,60 @@
+"""Built-in background job handlers (see utils/jobs.py).
+
+Most of them wrap what a `flask roomie ...` command does, so the runner can
+keep the derived data fresh on the schedule in jobs.DEFAULT_SCHEDULE.
+"""
+from utils.jobs import handler
+
+
+@handler('messages.notify')
+def notify(sender_id, receiver_id, item_id, content):
+    """System message to the other side of a request or order"""
+    from models.message_model import Message
+    Message.create_message(sender_id, receiver_id, item_id, content)
+
+
+@handler('similar.refresh', max_attempts=3)
+def refresh_similar(full=False):
+    try:
+        import numpy  # noqa: F401
+    except ImportError:
+        print('[tasks] similar.refresh skipped: NumPy is not installed')
+        return
+    from commands.similar import refresh_similar as refresh
+    summary = refresh(full=full)
+    print(f"[tasks] similar items: {summary['mode']}, {summary['lists']} list(s) in {summary['seconds']}s")
+
+
+@handler('seller_stats.rebuild', max_attempts=3)
+def rebuild_seller_stats():
+    from models.feedback_model import Feedback
+    Feedback.rebuild_seller_stats()
+
+
+@handler('analytics.snapshot', max_attempts=3)
+def analytics_snapshot():
+    from database import analytics_replica
+    analytics_replica.take_snapshot()
+
+
+@handler('messages.archive', max_attempts=3)
+def archive_messages(days=None):
+    from commands.archive import DEFAULT_DAYS, archive_old_messages
+    moved, seconds = archive_old_messages(days=days or DEFAULT_DAYS)
+    print(f'[tasks] archived {moved} message(s) in {seconds}s')
+
+
+@handler('db.maintain', max_attempts=3)
+def maintain_database():
+    from database import maintenance
+    maintenance.checkpoint('TRUNCATE')
+    maintenance.incremental_vacuum()
+    maintenance.optimize()
+
+
+@handler('jobs.cleanup', max_attempts=1)
+def cleanup_jobs(days=7):
+    from models.job_model import Job
+    deleted = Job.delete_finished(days)
+    if deleted:
+        print(f'[tasks] deleted {deleted} finished job(s)')